@@ -0,0 +1,192 @@
+from wego.aio import AsyncWegoApi, AsyncLazyWeChatUser
+from wego.exceptions import WeChatUserError, HelperError
+from wego.api import WeChatUser
+from wego.asgi import PushApp, ASGIHelper, ASGIRequest
+from wego.session import SessionRecord
+from wego.cache import ProfileCache
+from wego import settings
+import unittest
+import asyncio
+import threading
+import hashlib
+
+PUSH = (b'<xml><ToUserName><![CDATA[t]]></ToUserName><FromUserName><![CDATA[f]]></FromUserName>'
+        b'<MsgType><![CDATA[text]]></MsgType><Content><![CDATA[hi]]></Content></xml>')
+
+
+class FakeHelper(object):
+
+    def __init__(self, session):
+
+        self.session = session
+
+    def get_session(self, key):
+
+        return self.session.get(key, False)
+
+    def set_session(self, key, value):
+
+        self.session[key] = value
+
+
+class TestAsyncWegoApi(unittest.TestCase):
+
+    def setUp(self):
+        self.calls = []
+        self.wego = settings.init(APP_ID='1', APP_SECRET='1', REGISTER_URL='www.quseit.com/',
+                                  HELPER='wego.helpers.official.DjangoHelper')
+        self.aio = AsyncWegoApi(self.wego, fetch=self.fetch)
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+    def tearDown(self):
+        asyncio.set_event_loop(None)
+        self.loop.close()
+
+    async def fetch(self, url, params=None, body=None):
+        self.calls.append(url)
+        await asyncio.sleep(0.01)
+        if url.endswith('access_token'):
+            return {'openid': 'oA', 'access_token': 't', 'expires_in': 7200, 'refresh_token': 'r'}
+        return dict({'openid': params['openid'], 'nickname': 'n'}, **getattr(self, 'fetch_data', {}))
+
+    def test_login(self):
+        records = [SessionRecord(FakeHelper({})) for i in range(3)]
+
+        async def login():
+            return await asyncio.gather(*[self.aio.get_openid(record, 'code') for record in records])
+
+        openids = self.loop.run_until_complete(login())
+        self.assertEqual(openids, ['oA'] * 3)
+        self.assertEqual(len(self.calls), 1)
+
+        user = self.loop.run_until_complete(self.aio.get_userinfo(records[0], 'oA'))
+        self.assertEqual(user.nickname, 'n')
+
+    def test_lazy_userinfo(self):
+        helper = FakeHelper({})
+        record = SessionRecord(helper)
+        record.update(openid='oA', scope='snsapi_base')
+
+        class Request(object):
+            wx_user = AsyncLazyWeChatUser(self.wego, record, 'oA')
+
+        with self.assertRaises(WeChatUserError):
+            Request.wx_user.nickname
+        self.wego.settings.data['GET_GLOBAL_ACCESS_TOKEN'] = lambda wechat: 'token'
+        self.wego.settings.data['USERINFO_EXPIRE'] = 60
+        self.fetch_data = {'subscribe': 1}
+        user = self.loop.run_until_complete(self.aio.get_lazy_userinfo(Request))
+        self.assertEqual((user.nickname, Request.wx_user.nickname), ('n', 'n'))
+        self.assertEqual(WeChatUser.loads(self.wego, SessionRecord(helper).userinfo).nickname, 'n')
+
+    def test_cache_backend_in_executor(self):
+        threads = []
+
+        class Backend(dict):
+            def get(self, key):
+                threads.append(threading.current_thread())
+                return dict.get(self, key)
+
+            def set(self, key, value, ttl):
+                threads.append(threading.current_thread())
+                self[key] = value
+
+        record = SessionRecord(FakeHelper({}))
+        record.update(openid='oA', scope='snsapi_base')
+
+        class Request(object):
+            wx_user = AsyncLazyWeChatUser(self.wego, record, 'oA')
+
+        self.wego.userinfo_cache = ProfileCache(backend=Backend())
+        self.wego.settings.data['GET_GLOBAL_ACCESS_TOKEN'] = lambda wechat: 'token'
+        self.wego.settings.data['USERINFO_EXPIRE'] = 60
+        self.fetch_data = {'subscribe': 1}
+        self.loop.run_until_complete(self.aio.get_lazy_userinfo(Request))
+        self.assertTrue(threads)
+        self.assertFalse(threading.current_thread() in threads)
+
+    def test_push(self):
+        threads = []
+        self.wego.add_push_listener(lambda push: threads.append(threading.current_thread()))
+        push = self.loop.run_until_complete(self.aio.parse_push(PUSH, {}))
+        self.assertEqual((push.type, push.Content), ('text', 'hi'))
+        self.assertNotEqual(threads, [threading.current_thread()])
+
+
+class TestASGI(unittest.TestCase):
+
+    def setUp(self):
+        self.wego = settings.init(APP_ID='1', APP_SECRET='1', REGISTER_URL='www.quseit.com/', PUSH_TOKEN='token',
+                                  PUSH_ENCODING_AES_KEY='a' * 43, HELPER='wego.asgi.ASGIHelper')
+        self.wego.settings.PUSH_TOKEN = ''
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+
+    def call(self, app, method, query, body=b''):
+        messages = [{'type': 'http.request', 'body': body}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {'type': 'http', 'method': method, 'path': '/push', 'query_string': query, 'headers': []}
+        self.loop.run_until_complete(app(scope, receive, send))
+        return sent[0]['status'], sent[1]['body']
+
+    def test_push_app(self):
+        async def handler(push):
+            return push.reply_text(push.Content)
+
+        app = PushApp(self.wego, handler)
+        status, body = self.call(app, 'POST', b'', PUSH)
+        self.assertEqual(status, 200)
+        self.assertIn(b'<![CDATA[hi]]>', body)
+
+        self.wego.settings.PUSH_TOKEN = 'token'
+        signature = hashlib.sha1(''.join(sorted(['token', '1', '2'])).encode('utf-8')).hexdigest()
+        query = 'signature=%s&timestamp=1&nonce=2&echostr=ok' % signature
+        self.assertEqual(self.call(app, 'GET', query.encode('ascii')), (200, b'ok'))
+        self.assertEqual(self.call(app, 'GET', b'signature=0&timestamp=1&nonce=2')[0], 403)
+
+    def test_push_app_pay(self):
+        async def handler(push):
+            return push.success if push.is_pay else None
+
+        app = PushApp(self.wego, handler)
+        self.wego.settings.data['MCH_SECRET'] = 'key'
+        fields = {'return_code': 'SUCCESS', 'appid': '1', 'total_fee': '1'}
+        sign = self.wego.make_sign(fields)
+        pay = ('<xml><return_code><![CDATA[SUCCESS]]></return_code><appid><![CDATA[1]]></appid>'
+               '<total_fee>1</total_fee><sign><![CDATA[%s]]></sign></xml>')
+        status, body = self.call(app, 'POST', b'', (pay % sign).encode('utf-8'))
+        self.assertEqual(status, 200)
+        self.assertIn(b'SUCCESS', body)
+        self.assertEqual(self.call(app, 'POST', b'', (pay % ('0' * 32)).encode('utf-8'))[0], 403)
+
+        # A push mentions return_code is still a push
+        status, body = self.call(app, 'POST', b'', PUSH.replace(b'hi', b'return_code'))
+        self.assertEqual((status, body), (200, b'success'))
+        self.assertEqual(self.call(app, 'POST', b'', b'<xml>\xff</xml>')[0], 400)
+        self.assertEqual(self.call(app, 'POST', b'', b'<xml></xml>')[0], 400)
+
+    def test_helper(self):
+        scope = {'path': '/a', 'query_string': b'code=c', 'headers': [], 'wego.cookie_secret': 's'}
+        helper = ASGIHelper(ASGIRequest(scope, None))
+        helper.set_session('wx', 'record')
+        self.assertEqual(helper.get_current_path(), '/a?code=c')
+        self.assertEqual(helper.get_params(), {'code': 'c'})
+
+        cookie = helper.cookies[0][1].split(';')[0].encode('latin-1')
+        scope = {'headers': [(b'cookie', cookie)], 'wego.cookie_secret': 's'}
+        self.assertEqual(ASGIHelper(ASGIRequest(scope, None)).get_session('wx'), 'record')
+
+        with self.assertRaises(HelperError):
+            self.wego.get_helper(ASGIRequest({'headers': []}, None))
+        self.wego.settings.data['COOKIE_SECRET'] = 'cookie'
+        self.assertEqual(self.wego.get_helper(ASGIRequest({'headers': []}, None)).secret, b'cookie')
@@ -0,0 +1,5 @@
+import sys
+
+# wego.aio is Python 3.5+
+if sys.version_info >= (3, 5):
+    from .cases import *
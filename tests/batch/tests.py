@@ -0,0 +1,39 @@
+from wego.batch import chunked, run_batches
+import unittest
+
+
+class TestBatch(unittest.TestCase):
+
+    def test_chunked(self):
+        self.assertEqual(list(chunked(range(5), 2)), [[0, 1], [2, 3], [4]])
+        self.assertEqual(list(chunked([], 2)), [])
+
+    def test_run_batches(self):
+        calls = []
+
+        def func(chunk):
+            calls.append(chunk)
+            if chunk == [2, 3] and calls.count(chunk) == 1:
+                raise IOError('retry me')
+            if chunk == [4]:
+                raise IOError('always')
+            return sum(chunk)
+
+        results = list(run_batches(func, chunked(range(5), 2), workers=2, retries=1, backoff=0))
+        self.assertEqual(sorted(i[1] for i in results if i[2] is None), [1, 5])
+        self.assertEqual([i[0] for i in results if i[2] is not None], [[4]])
+
+    def test_chunks_error(self):
+        def chunks():
+            yield [1]
+            raise IOError('broken source')
+
+        results = []
+        with self.assertRaises(IOError):
+            for i in run_batches(sum, chunks(), workers=2):
+                results.append(i)
+        self.assertEqual(results, [([1], 1, None)])
+
+
+if __name__ == '__main__':
+    unittest.main()
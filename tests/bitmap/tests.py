@@ -0,0 +1,43 @@
+from wego.bitmap import Bitmap, TagIndex
+import unittest
+import tempfile
+import shutil
+import os
+
+
+class TestBitmap(unittest.TestCase):
+
+    def test_algebra(self):
+        a = Bitmap.from_numbers([0, 3, 9, 100])
+        b = Bitmap.from_numbers([3, 100, 101])
+        self.assertEqual(list(a & b), [3, 100])
+        self.assertEqual(list(a | b), [0, 3, 9, 100, 101])
+        self.assertEqual(list(a - b), [0, 9])
+        self.assertEqual(len(a), 4)
+        self.assertTrue(9 in a and 10 not in a)
+        self.assertEqual(Bitmap.loads(a.dumps()), a)
+
+
+class TestTagIndex(unittest.TestCase):
+
+    def test_index(self):
+        index = TagIndex()
+        index.add(1, ['oA', 'oB', 'oC'])
+        index.add(2, ['oB', 'oD'])
+        index.remove(1, ['oC'])
+        followers = index.bitmap(['oA', 'oB', 'oD'])
+        self.assertEqual(list(index.openids((index.tag(1) - index.tag(2)) & followers)), ['oA'])
+        self.assertEqual(sorted(index.user_tags('oB')), [1, 2])
+
+        path = tempfile.mkdtemp()
+        try:
+            index.save(os.path.join(path, 'tags.bin'))
+            loaded = TagIndex.load(os.path.join(path, 'tags.bin'))
+        finally:
+            shutil.rmtree(path)
+        self.assertEqual(loaded.tags, index.tags)
+        self.assertEqual(loaded.openid_list, index.openid_list)
+
+
+if __name__ == '__main__':
+    unittest.main()
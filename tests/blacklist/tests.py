@@ -0,0 +1,63 @@
+from wego.api import WegoApiError
+from wego import settings
+import threading
+import unittest
+
+
+def init():
+    w = settings.init(APP_ID='1', APP_SECRET='1', REGISTER_URL='www.quseit.com/',
+                      HELPER='wego.helpers.official.DjangoHelper')
+    w.calls = []
+    w.lock = threading.Lock()
+    return w
+
+
+class TestBlacklist(unittest.TestCase):
+
+    def test_iter_blacklist(self):
+        w = init()
+        pages = {
+            '': {'total': 10001, 'count': 10000, 'data': {'openid': ['o%s' % i for i in range(10000)]},
+                 'next_openid': 'o9999'},
+            'o9999': {'total': 10001, 'count': 1, 'data': {'openid': ['o10000']}, 'next_openid': 'o10000'},
+        }
+        w.wechat.get_blacklist = lambda begin_openid: w.calls.append(begin_openid) or pages[begin_openid]
+
+        openids = list(w.iter_blacklist())
+        self.assertEqual(len(openids), 10001)
+        self.assertEqual(openids[-1], 'o10000')
+        self.assertEqual(w.calls, ['', 'o9999'])
+
+        w.wechat.get_blacklist = lambda begin_openid: {'total': 0, 'count': 0, 'next_openid': ''}
+        self.assertEqual(list(w.iter_blacklist()), [])
+
+    def test_block_users(self):
+        w = init()
+
+        def batch_blacklist(openids):
+            with w.lock:
+                w.calls.append(list(openids))
+            return {'errcode': 0}
+        w.wechat.batch_blacklist = batch_blacklist
+
+        openids = ['o%s' % i for i in range(45)]
+        self.assertTrue(w.block_users(openids))
+        self.assertEqual(sorted(len(i) for i in w.calls), [5, 20, 20])
+        self.assertEqual(sorted(i for chunk in w.calls for i in chunk), sorted(openids))
+
+    def test_unblock_users_failed(self):
+        w = init()
+
+        def batch_unblacklist(openids):
+            if 'o0' in openids:
+                raise WegoApiError('system busy')
+            return {'errcode': 0}
+        w.wechat.batch_unblacklist = batch_unblacklist
+
+        with self.assertRaises(WegoApiError) as context:
+            w.unblock_users(['o%s' % i for i in range(30)], workers=2, rate=0)
+        self.assertEqual(context.exception.openids, ['o%s' % i for i in range(20)])
+
+
+if __name__ == '__main__':
+    unittest.main()
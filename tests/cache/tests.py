@@ -0,0 +1,210 @@
+from wego.cache import MemoryCache, ProfileCache, SingleFlight
+from wego.invalidation import InvalidationBus, LocalPubSub
+from wego.conversation import ConversationStore
+import threading
+import unittest
+import logging
+import time
+
+
+class TestMemoryCache(unittest.TestCase):
+
+    def test_lru(self):
+        cache = MemoryCache(max_size=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('b'), None)
+        self.assertTrue('c' in cache)
+
+    def test_ttl(self):
+        cache = MemoryCache(ttl=60)
+        cache.set('a', 1)
+        cache.set('b', 2, expires_at=time.time() - 1)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('b', 'missing'), 'missing')
+        self.assertEqual([i[:2] for i in cache.items()], [('a', 1)])
+
+
+class TestProfileCache(unittest.TestCase):
+
+    def test_field_classes(self):
+        cache = ProfileCache(ttl=60, ext_ttl=0)
+        cache.set_profile('o1', {'openid': 'o1', 'nickname': 'wego'})
+        cache.set('o1', {'openid': 'o1', 'subscribe': 1, 'nickname': 'wego', 'remark': ''})
+        self.assertEqual(cache.get_profile('o1'), {'openid': 'o1', 'nickname': 'wego'})
+        self.assertEqual(cache.get('o1'), None)
+
+        cache.ext_ttl = 60
+        cache.set('o1', {'openid': 'o1', 'subscribe': 1, 'nickname': 'wego', 'remark': 'vip'})
+        self.assertEqual(cache.get('o1')['remark'], 'vip')
+        self.assertEqual(cache.get('o1')['nickname'], 'wego')
+
+        cache.delete('o1')
+        self.assertEqual(cache.get_profile('o1'), None)
+
+    def test_clear_shared_backend(self):
+        backend = DictBackend()
+        a, b = ProfileCache(backend=backend, prefix='a:'), ProfileCache(backend=backend, prefix='b:')
+        a.set_profile('o1', {'openid': 'o1'})
+        b.set_profile('o1', {'openid': 'o1'})
+        backend['other'] = 1
+
+        a.clear()
+        self.assertEqual(sorted(backend), ['b:o1', 'other'])
+        self.assertEqual(a.get_profile('o1'), None)
+        self.assertEqual(b.get_profile('o1'), {'openid': 'o1'})
+
+    def test_backend_outside_lock(self):
+        locked = []
+
+        class Backend(DictBackend):
+            def get(self, key):
+                locked.append(cache.lock.locked())
+                return DictBackend.get(self, key)
+
+            def set(self, key, value, ttl):
+                locked.append(cache.lock.locked())
+                DictBackend.set(self, key, value, ttl)
+
+        backend = Backend()
+        cache = ProfileCache(backend=backend)
+        cache.set('o1', {'openid': 'o1', 'subscribe': 0})
+        cache.local.clear()
+        # Read through before merging
+        cache.set_profile('o1', {'openid': 'o1', 'nickname': 'wego'})
+        self.assertEqual(backend['wego:user:o1']['ext'], {'openid': 'o1', 'subscribe': 0})
+        self.assertEqual(locked, [False] * 4)
+
+
+class TestInvalidationBus(unittest.TestCase):
+
+    def test_invalidate(self):
+        backend = LocalPubSub()
+        bus, other = InvalidationBus(backend), InvalidationBus(backend)
+        local, remote = MemoryCache(), MemoryCache()
+        bus.register('user', local)
+        other.register('user', remote)
+        for cache in (local, remote):
+            cache.set('openid1', 1)
+            cache.set('openid2', 2)
+
+        bus.invalidate('user', 'openid1')
+        self.assertEqual((local.get('openid1'), remote.get('openid1')), (None, None))
+        self.assertEqual((local.get('openid2'), remote.get('openid2')), (2, 2))
+
+        bus.invalidate('user')
+        self.assertEqual((len(local), len(remote)), (0, 0))
+
+    def test_invalidate_many(self):
+        backend = LocalPubSub()
+        bus, other = InvalidationBus(backend), InvalidationBus(backend)
+        local, remote = MemoryCache(), MemoryCache()
+        bus.register('user', local)
+        other.register('user', remote)
+        for cache in (local, remote):
+            for key in ('openid1', 'openid2', 'openid3'):
+                cache.set(key, 1)
+        messages = []
+        backend.subscribe(messages.append)
+
+        bus.invalidate_many('user', ['openid1', 'openid2'])
+        self.assertEqual(len(messages), 1)
+        self.assertEqual([len(local), len(remote), local.get('openid3'), remote.get('openid3')], [1, 1, 1, 1])
+
+
+class DictBackend(dict):
+
+    def set(self, key, value, ttl):
+        self[key] = value
+
+    def delete(self, key):
+        self.pop(key, None)
+
+    def delete_prefix(self, prefix):
+        for key in [i for i in self if i.startswith(prefix)]:
+            del self[key]
+
+
+class TestConversationStore(unittest.TestCase):
+
+    def test_write_through(self):
+        backend = DictBackend()
+        store = ConversationStore(backend)
+        store.merge('openid', step=1)
+        self.assertEqual(store.incr('openid', 'step'), 2)
+        self.assertEqual(backend['openid'], {'step': 2})
+
+        store.cache.clear()
+        self.assertEqual(store.get('openid'), {'step': 2})
+        store.delete('openid')
+        self.assertEqual(store.get('openid', {}), {})
+        self.assertEqual(backend, {})
+
+    def test_update_reads_backend(self):
+        backend = DictBackend()
+        store = ConversationStore(backend)
+        store.set('openid', {'step': 1})
+        # Written by another process
+        backend['openid'] = {'step': 5}
+        self.assertEqual(store.incr('openid', 'step'), 6)
+
+    def test_backend_update(self):
+        class AtomicBackend(DictBackend):
+            def atomic_update(self, key, func, ttl):
+                self[key] = func(self.get(key))
+                return self[key]
+
+        backend = AtomicBackend()
+        store = ConversationStore(backend)
+        self.assertEqual(store.incr('openid', 'step'), 1)
+        backend['openid'] = {'step': 5}
+        self.assertEqual(store.incr('openid', 'step'), 6)
+        self.assertEqual(store.get('openid'), {'step': 6})
+
+    def test_local_bus_warning(self):
+        messages = []
+
+        class Handler(logging.Handler):
+            def emit(self, record):
+                messages.append(record)
+
+        handler = Handler()
+        logging.getLogger('wego').addHandler(handler)
+        try:
+            ConversationStore().bind(InvalidationBus())
+            ConversationStore(DictBackend()).bind(InvalidationBus(LocalPubSub()))
+        finally:
+            logging.getLogger('wego').removeHandler(handler)
+        self.assertEqual(len(messages), 1)
+
+
+class TestSingleFlight(unittest.TestCase):
+
+    def test_do(self):
+        flight = SingleFlight()
+        calls = []
+        release = threading.Event()
+
+        def func():
+            calls.append(1)
+            release.wait()
+            return 'token'
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(flight.do('code', func))) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.1)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, ['token'] * 4)
+        self.assertEqual(calls, [1])
+        self.assertEqual(flight.calls, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+from wego.invalidation import LocalPubSub
+from wego.exceptions import WegoApiError
+from wego import settings
+import unittest
+
+
+def init(backend):
+    w = settings.init(APP_ID='1', APP_SECRET='1', REGISTER_URL='www.quseit.com/', INVALIDATION_BACKEND=backend,
+                      HELPER='wego.helpers.official.DjangoHelper')
+    w.calls = []
+
+    def get_all_groups():
+        w.calls.append('get_all_groups')
+        return {'groups': [{'id': 0, 'name': u'未分组', 'count': 5}, {'id': 100, 'name': 'vip', 'count': 1}]}
+
+    w.wechat.get_all_groups = get_all_groups
+    w.wechat.create_group = lambda name: {'group': {'id': 101, 'name': name}}
+    w.wechat.change_group_name = lambda groupid, name: {'errcode': 0}
+    w.wechat.del_group = lambda groupid: {'errcode': 0}
+    return w
+
+
+class TestGroupCache(unittest.TestCase):
+
+    def setUp(self):
+        backend = LocalPubSub()
+        self.w, self.other = init(backend), init(backend)
+
+    def test_cached(self):
+        self.assertEqual(self.w.get_groups()[100], {'name': 'vip', 'count': 1})
+        self.assertEqual(self.w._get_groupid('vip'), 100)
+        self.assertEqual(self.w._get_groupid(0), 0)
+        self.assertRaises(WegoApiError, self.w._get_groupid, 'missing')
+        self.assertEqual(self.w.calls, ['get_all_groups'])
+
+        # Returned tables are copies
+        self.w.get_groups()[100]['name'] = 'changed'
+        self.assertEqual(self.w.get_groups()[100]['name'], 'vip')
+
+        self.w.get_groups(refresh=True)
+        self.assertEqual(len(self.w.calls), 2)
+
+    def test_updated_in_place(self):
+        self.w.get_groups()
+        self.other.get_groups()
+
+        self.w.create_group('new')
+        self.assertTrue(self.w.change_group_name('vip', 'svip'))
+        self.assertTrue(self.w.del_group(0))
+        self.assertEqual(self.w.get_groups(), {100: {'name': 'svip', 'count': 1}, 101: {'name': 'new', 'count': 0}})
+        self.assertEqual(self.w._get_groupid('svip'), 100)
+        self.assertEqual(self.w.calls, ['get_all_groups'])
+
+        # Other processes drop their table and fetch it again
+        self.assertEqual(self.other.groups_cache.get('groups'), None)
+
+
+class Session(object):
+
+    def __init__(self):
+        self.urls = []
+
+    def post(self, url, data=None):
+        self.urls.append(url)
+        return self
+
+    def json(self):
+        return {'errcode': 0}
+
+
+class TestGroupUrls(unittest.TestCase):
+
+    def test_access_token(self):
+        session = Session()
+        w = settings.init(APP_ID='1', APP_SECRET='1', REGISTER_URL='www.quseit.com/', HTTP_SESSION=session,
+                          GET_GLOBAL_ACCESS_TOKEN=lambda wechat: 'token',
+                          HELPER='wego.helpers.official.DjangoHelper')
+        w.wechat.create_group('vip')
+        w.wechat.change_group_name(100, 'svip')
+        w.wechat.change_user_group('openid', 100)
+        w.wechat.del_group(100)
+        self.assertEqual([url.split('/cgi-bin/')[1] for url in session.urls], [
+            'groups/create?access_token=token',
+            'groups/update?access_token=token',
+            'groups/members/update?access_token=token',
+            'groups/delete?access_token=token',
+        ])
@@ -0,0 +1,52 @@
+import subprocess
+import unittest
+import sys
+import os
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def run(code):
+    return subprocess.check_output([sys.executable, '-c', code], cwd=ROOT).decode('utf-8').split()
+
+
+@unittest.skipIf(sys.version_info < (3, 7), 'Lazy module attributes need Python 3.7+')
+class TestImportTime(unittest.TestCase):
+
+    def test_light_import(self):
+        loaded = run(
+            'import sys, wego\n'
+            'print(" ".join(i for i in ("requests", "wego.api", "wego.wechat", "wego.lib.WEGOBizMsgCrypt",'
+            ' "wego.helpers.official") if i in sys.modules))'
+        )
+        self.assertEqual(loaded, [])
+
+    def test_full_import(self):
+        # What the light import defers is loaded by wego.api, requests only at the first wechat call
+        loaded = run(
+            'import sys, wego.api\n'
+            'print(" ".join(i for i in ("requests", "wego.cache", "wego.session") if i in sys.modules))'
+        )
+        self.assertEqual(loaded, ['wego.cache', 'wego.session'])
+
+    def test_init_helper_path(self):
+        # A HELPER path is checked at init without importing the helper module
+        loaded = run(
+            'import sys, wego\n'
+            'wego.init(APP_ID="1", APP_SECRET="1", REGISTER_URL="www.quseit.com/",'
+            ' HELPER="wego.helpers.official.DjangoHelper")\n'
+            'print("wego.helpers.official" in sys.modules)'
+        )
+        self.assertEqual(loaded, ['False'])
+
+    def test_lazy_attributes(self):
+        self.assertEqual(run('import wego; print(wego.WegoApi.__module__, wego.WeChatApi.__module__)'),
+                         ['wego.api', 'wego.wechat'])
+
+
+class TestAttributes(unittest.TestCase):
+
+    def test_attributes(self):
+        # Imported with wego before Python 3.7
+        self.assertEqual(run('import wego; print(wego.WegoApi.__name__, wego.WeChatUser.__name__)'),
+                         ['WegoApi', 'WeChatUser'])
@@ -0,0 +1,91 @@
+from wego.media import MediaStore, MediaPrefetcher
+import tempfile
+import unittest
+import shutil
+import os
+
+
+class Response(object):
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.closed = False
+
+    def iter_content(self, size):
+        return iter(self.chunks)
+
+    def close(self):
+        self.closed = True
+
+
+class Wechat(object):
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.calls = 0
+
+    def stream_temporary_material(self, media_id):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise IOError('network')
+        return Response([b'abc', b'', b'def'])
+
+
+class Wego(object):
+
+    def __init__(self, wechat):
+        self.wechat = wechat
+
+
+class TestMediaStore(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_save_lookup(self):
+        store = MediaStore(self.dir)
+        path = store.save('m1', [b'abc', b'def'])
+        self.assertEqual(store.save('m2', [b'abcdef']), path)
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), b'abcdef')
+
+        # Index is read back from disk by a new store
+        self.assertEqual(MediaStore(self.dir).lookup('m2'), path)
+        self.assertEqual(store.lookup('m3'), None)
+        self.assertEqual(os.listdir(os.path.join(self.dir, 'tmp')), [])
+
+    def test_unsafe_media_id(self):
+        store = MediaStore(self.dir)
+        path = store.save('../../x/..', [b'abc'])
+        self.assertEqual(MediaStore(self.dir).lookup('../../x/..'), path)
+        names = os.listdir(os.path.join(self.dir, 'media'))
+        self.assertEqual(len(names), 1)
+        self.assertTrue(names[0].startswith('sha1-'))
+
+
+class TestMediaPrefetcher(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_download_retry(self):
+        wechat = Wechat(failures=1)
+        prefetcher = MediaPrefetcher(Wego(wechat), self.dir, retries=1, backoff=0)
+        path = prefetcher.download('m1')
+        self.assertEqual(prefetcher.path('m1'), path)
+        self.assertEqual(wechat.calls, 2)
+
+        # Downloaded media is not fetched again
+        prefetcher.download('m1')
+        self.assertEqual(wechat.calls, 2)
+
+    def test_download_failed(self):
+        prefetcher = MediaPrefetcher(Wego(Wechat(failures=2)), self.dir, retries=1, backoff=0)
+        self.assertRaises(IOError, prefetcher.download, 'm1')
+        self.assertEqual(prefetcher.path('m1'), None)
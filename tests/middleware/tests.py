@@ -0,0 +1,115 @@
+from wego.helpers.official import WSGIHelper
+from wego.middleware import WSGIMiddleware
+from wego.exceptions import InitError, HelperError, UpgradeRequired
+from wego import settings
+import unittest
+import io
+
+
+def app(environ, start_response):
+    start_response('200 OK', [('Content-Type', 'text/plain')])
+    return [environ['wego.login'].openid.encode('ascii')]
+
+
+class TestWSGIMiddleware(unittest.TestCase):
+
+    def setUp(self):
+        self.wego = settings.init(
+            APP_ID='1',
+            APP_SECRET='1',
+            REGISTER_URL='www.quseit.com/',
+            HELPER='wego.helpers.official.DjangoHelper',
+            COOKIE_SECRET='cookie'
+        )
+        self.wego.wechat.get_access_token = lambda code: {
+            'openid': 'oA', 'access_token': 't', 'expires_in': 7200, 'refresh_token': 'r', 'scope': 'snsapi_base'
+        }
+
+    def call(self, middleware, query='', cookie=''):
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response['status'], response['headers'] = status, dict(headers)
+
+        environ = {'PATH_INFO': '/', 'QUERY_STRING': query, 'HTTP_COOKIE': cookie, 'wsgi.input': io.BytesIO()}
+        body = b''.join(middleware(environ, start_response))
+        return response['status'], response['headers'], body
+
+    def test_lazy_login(self):
+        middleware = WSGIMiddleware(app, self.wego)
+        self.assertEqual(self.call(middleware)[2], b'')
+
+        status, headers, body = self.call(middleware, 'code=c')
+        self.assertEqual(body, b'oA')
+        self.assertIn('Secure', headers['Set-Cookie'])
+        cookie = headers['Set-Cookie'].split(';')[0]
+        status, headers, body = self.call(middleware, cookie=cookie)
+        self.assertEqual(body, b'oA')
+        self.assertNotIn('Set-Cookie', headers)
+        self.assertEqual(self.call(middleware, cookie=cookie.replace('|', '|0'))[2], b'')
+
+    def test_cookie_max_age(self):
+        helper = WSGIHelper({'wego.cookie_secret': 's'})
+        helper.set_session('wx', 'value')
+        cookie = helper.cookies[0][1].split(';')[0]
+        self.assertEqual(WSGIHelper({'wego.cookie_secret': 's', 'HTTP_COOKIE': cookie}).get_session('wx'), 'value')
+        expired = WSGIHelper({'HTTP_COOKIE': cookie}, 's', -1)
+        self.assertFalse(expired.get_session('wx'))
+
+        with self.assertRaises(HelperError):
+            WSGIHelper({})
+        with self.assertRaises(InitError):
+            WSGIMiddleware(app, settings.init(APP_ID='1', APP_SECRET='1', REGISTER_URL='www.quseit.com/',
+                                              HELPER='wego.helpers.official.DjangoHelper'))
+        with self.assertRaises(InitError):
+            settings.init(APP_ID='1', APP_SECRET='1', REGISTER_URL='www.quseit.com/',
+                          HELPER='wego.helpers.official.DjangoHelper', COOKIE_SECRET='1')
+
+    def test_generator_body(self):
+        def generator_app(environ, start_response):
+            start_response('200 OK', [('Content-Type', 'text/plain')])
+            # The login is resolved, and the session written, while the body is iterated
+            login = environ['wego.login']
+            yield login.openid.encode('ascii')
+            self.assertIs(login.user, login.user)
+            yield b'!'
+
+        status, headers, body = self.call(WSGIMiddleware(generator_app, self.wego), 'code=c')
+        self.assertEqual(body, b'oA!')
+        self.assertIn('Set-Cookie', headers)
+
+        def upgrade_app(environ, start_response):
+            start_response('200 OK', [('Content-Type', 'text/plain')])
+            raise UpgradeRequired('profile')
+            yield b''
+
+        status, headers, body = self.call(WSGIMiddleware(upgrade_app, self.wego), 'code=c')
+        self.assertEqual(status, '302 Found')
+        self.assertIn('scope=snsapi_userinfo', headers['Location'])
+
+    def test_login_required(self):
+        status, headers, body = self.call(WSGIMiddleware(app, self.wego, login_required=True))
+        self.assertEqual(status, '302 Found')
+        self.assertIn('scope=snsapi_base', headers['Location'])
+
+    def test_login_required_profile(self):
+        self.wego.wechat.get_userinfo = lambda openid: {'openid': openid, 'subscribe': 0}
+        calls = []
+
+        class Request(object):
+            wego_helper = WSGIHelper({'wego.cookie_secret': 's', 'PATH_INFO': '/', 'QUERY_STRING': 'code=c'})
+
+        @self.wego.login_required(scope='snsapi_base', profile=True)
+        def view(request):
+            calls.append(request.wx_user.nickname)
+
+        response = {}
+        view(Request())(None, lambda status, headers: response.update(status=status, headers=dict(headers)))
+        self.assertEqual(calls, [])
+        self.assertEqual(response['status'], '302 Found')
+        self.assertIn('scope=snsapi_userinfo', response['headers']['Location'])
+
+    def test_helper(self):
+        helper = WSGIHelper({'wego.cookie_secret': 's', 'PATH_INFO': '/a', 'QUERY_STRING': 'b=1&b=2'})
+        self.assertEqual(helper.get_current_path(), '/a?b=1&b=2')
+        self.assertEqual(helper.get_params(), {'b': '2'})
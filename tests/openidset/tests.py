@@ -0,0 +1,40 @@
+from wego.openidset import OpenidSet
+import unittest
+import tempfile
+import shutil
+import os
+
+
+class TestOpenidSet(unittest.TestCase):
+
+    def setUp(self):
+        self.a = OpenidSet.from_iterable(['oC', 'oA', 'oB', 'oA'])
+        self.b = OpenidSet.from_iterable(['oB', 'oD'])
+
+    def test_membership(self):
+        self.assertEqual(len(self.a), 3)
+        self.assertEqual(list(self.a), ['oA', 'oB', 'oC'])
+        self.assertTrue('oB' in self.a)
+        self.assertFalse('oD' in self.a)
+        self.assertFalse('o' * 29 in self.a)
+
+    def test_set_algebra(self):
+        self.assertEqual(list(self.a | self.b), ['oA', 'oB', 'oC', 'oD'])
+        self.assertEqual(list(self.a - self.b), ['oA', 'oC'])
+        self.assertEqual(list(self.a & self.b), ['oB'])
+        self.assertEqual(list(OpenidSet() | self.b), ['oB', 'oD'])
+
+    def test_persistence(self):
+        path = tempfile.mkdtemp()
+        try:
+            self.a.save(os.path.join(path, 'a.bin'))
+            loaded = OpenidSet.load(os.path.join(path, 'a.bin'))
+            self.assertEqual(loaded, self.a)
+            self.assertTrue('oC' in loaded)
+            del loaded
+        finally:
+            shutil.rmtree(path)
+
+
+if __name__ == '__main__':
+    unittest.main()
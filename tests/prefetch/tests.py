@@ -0,0 +1,76 @@
+from wego.prefetch import ProfilePrefetcher
+from wego.session import SessionRecord
+from wego import settings
+import unittest
+import time
+
+
+class Push(object):
+
+    def __init__(self, push_type, openid):
+        self.type = push_type
+        self.from_user = openid
+
+
+class Helper(object):
+
+    def __init__(self):
+        self.session = {}
+
+    def get_session(self, key):
+        return self.session.get(key, False)
+
+    def set_session(self, key, value):
+        self.session[key] = value
+
+
+def init():
+    w = settings.init(APP_ID='1', APP_SECRET='1', REGISTER_URL='www.quseit.com/', PREFETCH_USERINFO=True,
+                      EXT_USERINFO_EXPIRE=60, USERINFO_EXPIRE=60, HELPER='wego.helpers.official.DjangoHelper')
+    w.calls = []
+
+    def batch_get_userinfo(openids):
+        w.calls.append(sorted(openids))
+        return {'user_info_list': [{'openid': i, 'subscribe': 1, 'nickname': i.upper()} for i in openids]}
+
+    w.wechat.batch_get_userinfo = batch_get_userinfo
+    w.wechat.get_userinfo = lambda openid: batch_get_userinfo([openid])['user_info_list'][0]
+    return w
+
+
+class TestProfilePrefetcher(unittest.TestCase):
+
+    def test_fetch(self):
+        w = init()
+        w.prefetcher.fetch(['oa', 'ob', 'oa'])
+        w.prefetcher.fetch(['oa', 'oc'])
+        self.assertEqual(w.calls, [['oa', 'ob'], ['oc']])
+        self.assertEqual(w.userinfo_cache.get('ob')['nickname'], 'OB')
+
+    def test_on_push(self):
+        w = init()
+        w.prefetcher.on_push(Push('text', 'oa'))
+        w.prefetcher.on_push(Push('subscribe', 'ob'))
+        for i in range(100):
+            if w.userinfo_cache.get('ob'):
+                break
+            time.sleep(0.01)
+        self.assertEqual(w.calls, [['ob']])
+
+    def test_bounded(self):
+        prefetcher = ProfilePrefetcher(None, maxsize=2)
+        # No worker, nothing is taken from the queue
+        prefetcher.thread = object()
+        self.assertEqual([prefetcher.prefetch(i) for i in ('oa', 'ob', 'oc')], [True, True, False])
+        self.assertEqual(prefetcher.dropped, 1)
+
+    def test_userinfo_from_ext_cache(self):
+        w = init()
+        w.prefetcher.fetch(['oa'])
+        w.wechat.get_userinfo_by_token = lambda openid, token: self.fail('user token is not used')
+
+        record = SessionRecord(Helper())
+        record.update(openid='oa', access_token='t', refresh_token='r', expires_at=time.time() + 60)
+        user = w._get_userinfo(record, 'oa')
+        self.assertEqual(user.nickname, 'OA')
+        self.assertTrue(user.is_upgrade)
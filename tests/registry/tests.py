@@ -0,0 +1,121 @@
+from wego.registry import AccountRegistry
+from wego.invalidation import LocalPubSub
+import threading
+import unittest
+import logging
+import time
+
+
+class DictBackend(dict):
+
+    def set(self, key, value, ttl):
+        self[key] = value
+
+    def delete(self, key):
+        self.pop(key, None)
+
+    def delete_prefix(self, prefix):
+        for key in [i for i in self if i.startswith(prefix)]:
+            del self[key]
+
+
+def settings_of(app_id):
+    return {
+        'APP_ID': app_id,
+        'APP_SECRET': 's' + app_id,
+        'REGISTER_URL': 'www.quseit.com/',
+        'ORIGINAL_ID': 'gh_' + app_id,
+        'USERINFO_EXPIRE': 60,
+    }
+
+
+class TestAccountRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.loaded = []
+
+        def loader(app_id):
+            self.loaded.append(app_id)
+            return settings_of(app_id) if app_id.startswith('wx') else None
+
+        self.accounts = AccountRegistry(loader, HELPER='wego.helpers.official.DjangoHelper',
+                                        INVALIDATION_BACKEND=LocalPubSub())
+
+    def test_lookup(self):
+        a = self.accounts.register(**settings_of('wxa'))
+        b = self.accounts['wxb']
+        self.assertEqual(self.loaded, ['wxb'])
+        self.assertTrue(self.accounts['wxa'] is a)
+        self.assertTrue(self.accounts.by_username('gh_wxb') is b)
+        self.assertEqual(self.accounts.get('bad'), None)
+        self.assertRaises(KeyError, lambda: self.accounts['bad'])
+        self.assertEqual(len(self.accounts), 2)
+        self.assertEqual(len(logging.getLogger('wego').handlers), 1)
+
+        # Shared connection pool, own settings
+        self.assertTrue(a.wechat.http is b.wechat.http)
+        self.assertEqual(b.settings.APP_SECRET, 'swxb')
+
+    def test_concurrent_load(self):
+        loader = self.accounts.loader
+
+        def slow_loader(app_id):
+            time.sleep(0.05)
+            return loader(app_id)
+
+        self.accounts.loader = slow_loader
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(self.accounts['wxa'])) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.loaded, ['wxa'])
+        self.assertEqual(len(set(id(wego) for wego in results)), 1)
+
+    def test_route_push(self):
+        a = self.accounts.register(**settings_of('wxa'))
+        xml = '<xml><ToUserName><![CDATA[gh_wxa]]></ToUserName><Encrypt><![CDATA[...]]></Encrypt></xml>'
+        self.assertTrue(self.accounts.route_push(xml.encode('utf-8')) is a)
+        pay = '<xml><appid><![CDATA[wxc]]></appid><return_code><![CDATA[SUCCESS]]></return_code></xml>'
+        # Unauthenticated bodies do not load accounts
+        self.assertEqual(self.accounts.route_push(pay), None)
+        self.assertEqual(self.loaded, [])
+        self.accounts['wxc']
+        self.assertEqual(self.accounts.route_push(pay).settings.APP_ID, 'wxc')
+        self.assertEqual(self.accounts.route_push('<xml></xml>'), None)
+
+    def test_shared_token_store(self):
+        a = self.accounts.register(**settings_of('wxa'))
+        b = self.accounts.register(**settings_of('wxb'))
+        calls = []
+        for wego in (a, b):
+            wego.wechat.get_global_access_token = lambda app_id=wego.settings.APP_ID: calls.append(app_id) or {
+                'access_token': 'token_' + app_id, 'expires_in': 7200
+            }
+
+        self.assertEqual(a.settings.GET_GLOBAL_ACCESS_TOKEN(a.wechat), 'token_wxa')
+        self.assertEqual(b.settings.GET_GLOBAL_ACCESS_TOKEN(b.wechat), 'token_wxb')
+        self.assertEqual(a.settings.GET_GLOBAL_ACCESS_TOKEN(a.wechat), 'token_wxa')
+        self.assertEqual(calls, ['wxa', 'wxb'])
+
+    def test_invalidation_per_account(self):
+        a = self.accounts.register(**settings_of('wxa'))
+        b = self.accounts.register(**settings_of('wxb'))
+        a.userinfo_cache.set_profile('oA', {'openid': 'oA', 'nickname': 'A'})
+        b.userinfo_cache.set_profile('oA', {'openid': 'oA', 'nickname': 'B'})
+
+        b.invalidation.publish('user', 'oA')
+        self.assertEqual(a.userinfo_cache.get_profile('oA')['nickname'], 'A')
+
+    def test_shared_backend(self):
+        backend = DictBackend()
+        a = self.accounts.register(USERINFO_CACHE_BACKEND=backend, **settings_of('wxa'))
+        b = self.accounts.register(USERINFO_CACHE_BACKEND=backend, **settings_of('wxb'))
+        a.userinfo_cache.set_profile('oA', {'openid': 'oA', 'nickname': 'A'})
+        b.userinfo_cache.set_profile('oA', {'openid': 'oA', 'nickname': 'B'})
+
+        a.invalidation.invalidate('user')
+        self.assertEqual(a.userinfo_cache.get_profile('oA'), None)
+        b.userinfo_cache.local.clear()
+        self.assertEqual(b.userinfo_cache.get_profile('oA')['nickname'], 'B')
@@ -31,19 +31,53 @@ class TestSettingsInit(unittest.TestCase):
                 HELPER='wego.helpers.official.DjangoHelper'
             )
 
+        # The helper module is checked at init, the helper at the first use
+        w = settings.init(
+            APP_ID='1',
+            APP_SECRET='1',
+            REGISTER_URL='/',
+            REDIRECT_PATH='/',
+            MCH_ID='1',
+            MCH_SECRET='1',
+            PAY_NOTIFY_PATH='/a',
+            HELPER=u'wego.helpers.official.ErrorHelper',
+            KEY_PEM_PATH='2',
+            CERT_PEM_PATH='1'
+        )
         with self.assertRaises(AttributeError):
-            settings.init(
-                APP_ID='1',
-                APP_SECRET='1',
-                REGISTER_URL='/',
-                REDIRECT_PATH='/',
-                MCH_ID='1',
-                MCH_SECRET='1',
-                PAY_NOTIFY_PATH='/a',
-                HELPER='wego.helpers.official.ErrorHelper',
-                KEY_PEM_PATH='2',
-                CERT_PEM_PATH='1'
-            )
+            w.settings.HELPER
+
+        with self.assertRaises(ImportError):
+            settings.init(APP_ID='1', APP_SECRET='1', REGISTER_URL='/', HELPER='wego.helpers.oficial.DjangoHelper')
+
+
+class TestWarmup(unittest.TestCase):
+
+    def test_warmup(self):
+        w = settings.init(
+            APP_ID='1',
+            APP_SECRET='1',
+            REGISTER_URL='www.quseit.com/',
+            HELPER='wego.helpers.official.DjangoHelper',
+            PUSH_TOKEN='t',
+            PUSH_ENCODING_AES_KEY='a' * 43
+        )
+        connected = []
+        w.wechat.preconnect = connected.append
+        w.wechat.get_global_access_token = lambda: {'access_token': 'token', 'expires_in': 7200}
+
+        timings = w.warmup()
+        self.assertEqual(connected, ['https://api.weixin.qq.com/'])
+        self.assertEqual(w.wechat.global_access_token['access_token'], 'token')
+        self.assertTrue(hasattr(w, 'push_crypto'))
+        self.assertTrue(all(i is not None for i in timings.values()))
+
+        # A failed step does not stop the others
+        w.wechat.global_access_token = {}
+        w.wechat.get_global_access_token = lambda: 1 / 0
+        timings = w.warmup()
+        self.assertEqual(timings['token'], None)
+        self.assertEqual(len(connected), 2)
 
 
 if __name__ == '__main__':
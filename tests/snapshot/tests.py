@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+from wego.snapshot import CacheSnapshot
+from wego import settings
+import tempfile
+import unittest
+import shutil
+import atexit
+import time
+import os
+
+
+def init(app_id='1', **kwargs):
+    return settings.init(APP_ID=app_id, APP_SECRET='1', REGISTER_URL='www.quseit.com/', USERINFO_EXPIRE=60,
+                         EXT_USERINFO_EXPIRE=60, HELPER='wego.helpers.official.DjangoHelper', **kwargs)
+
+
+class TestCacheSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'wego.snapshot')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_save_load(self):
+        a = init()
+        a.wechat.global_access_token = {'access_token': 'token', 'expires_in': 7200, 'expires_at': time.time() + 60}
+        a._set_groups({0: {'name': u'默认组', 'count': 3}, 100: {'name': 'vip', 'count': 1}})
+        a.userinfo_cache.set('oA', {'openid': 'oA', 'subscribe': 1, 'nickname': 'A'})
+        a.userinfo_cache.local.set('oB', {'profile': {}, 'profile_at': 0, 'ext': {}, 'ext_at': 0},
+                                   expires_at=time.time() - 1)
+        CacheSnapshot(a, self.path).save()
+
+        b = init(SNAPSHOT_PATH=self.path)
+        if hasattr(atexit, 'unregister'):
+            atexit.unregister(b.snapshot._save_quietly)
+        self.assertEqual(b.wechat.global_access_token['access_token'], 'token')
+        self.assertEqual(b.settings.GET_GLOBAL_ACCESS_TOKEN(b.wechat), 'token')
+        self.assertEqual(b._load_groups()[1], {u'默认组': 0, 'vip': 100})
+        self.assertEqual(b.userinfo_cache.get('oA')['nickname'], 'A')
+        self.assertEqual(len(b.userinfo_cache.local), 1)
+
+    def test_ignored(self):
+        other = CacheSnapshot(init('2'), self.path)
+        other.save()
+        snapshot = CacheSnapshot(init(), self.path)
+        self.assertEqual(snapshot.load(), 0)
+        with open(other.path, 'rb') as f:
+            payload = f.read()
+        for data, message in ((payload, 'another account'), (b'WGSN\x01broken', 'corrupt'), (payload[:-4], 'corrupt')):
+            with self.assertRaises(ValueError) as context:
+                snapshot.loads(data)
+            self.assertIn(message, str(context.exception))
+        with open(snapshot.path, 'wb') as f:
+            f.write(b'WGSN\x01broken')
+        self.assertEqual(snapshot.load(), 0)
+
+    def test_shared_path(self):
+        a, b = init('1'), init('2')
+        a.wechat.global_access_token = {'access_token': 'a', 'expires_in': 7200, 'expires_at': time.time() + 60}
+        b.wechat.global_access_token = {'access_token': 'b', 'expires_in': 7200, 'expires_at': time.time() + 60}
+        CacheSnapshot(a, self.path).save()
+        CacheSnapshot(b, self.path).save()
+
+        c = init('1')
+        self.assertEqual(CacheSnapshot(c, self.path).load(), 1)
+        self.assertEqual(c.wechat.global_access_token['access_token'], 'a')
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+from wego.stats import HyperLogLog, PushStats
+from wego.exceptions import WegoApiError
+from wego import settings
+import unittest
+import hashlib
+import time
+
+
+class Push(object):
+
+    def __init__(self, push_type, key, openid):
+        self.type = push_type
+        self.EventKey = key
+        self.from_user = openid
+
+
+class TestHyperLogLog(unittest.TestCase):
+
+    def test_count(self):
+        hll = HyperLogLog(12)
+        for i in range(20000):
+            hll.add('openid%s' % (i % 5000))
+        self.assertTrue(4700 < hll.count() < 5300)
+
+    def test_merge(self):
+        a, b = HyperLogLog(), HyperLogLog()
+        for i in range(1000):
+            a.add(str(i))
+            b.add(str(i + 500))
+        self.assertTrue(1400 < a.merge(b).count() < 1600)
+
+
+class TestPushStats(unittest.TestCase):
+
+    def test_rollup(self):
+        rows = []
+        stats = PushStats(flush=rows.extend, batch_size=1, interval=0)
+        stats.feed(Push('click', 'V1001', 'a'), now=0)
+        stats.feed(Push('click', 'V1001', 'b'), now=10)
+        stats.feed(Push('click', 'V1001', 'a'), now=20)
+        self.assertEqual(stats.get('click', 'V1001'), (3, 2))
+        self.assertEqual(rows, [])
+
+        stats.feed(Push('scan', '123', 'a'), now=61)
+        # Counting never flushes
+        self.assertEqual(rows, [])
+        stats.tick(now=62)
+        self.assertEqual(rows, [{
+            'resolution': 'minute', 'start': 0, 'type': 'click', 'key': 'V1001', 'count': 3, 'users': 2
+        }])
+        self.assertEqual(stats.series('click', 'V1001'), [(0, 3, 2)])
+        self.assertEqual(stats.get('click', 'V1001', 'hour'), (3, 2))
+
+        stats.flush(close=True)
+        self.assertEqual(len(rows), 4)
+
+    def test_close_by_time(self):
+        rows = []
+        stats = PushStats(flush=rows.extend, interval=0)
+        stats.incr('click', 'V1001', 'a', now=0)
+        stats.tick(now=30)
+        self.assertEqual(rows, [])
+
+        # No more events, the minute is closed by time
+        stats.tick(now=60)
+        self.assertEqual([(row['resolution'], row['count']) for row in rows], [('minute', 1)])
+        self.assertEqual(stats.get('click', 'V1001'), (0, 0))
+
+    def test_failed_flush(self):
+        def flush(rows):
+            raise IOError('db down')
+
+        stats = PushStats(flush=flush, interval=0)
+        stats.incr('click', 'V1001', 'a', now=0)
+        self.assertRaises(IOError, stats.tick, 60)
+        self.assertEqual(len(stats.pending), 1)
+
+    def test_background_flush(self):
+        rows = []
+        stats = PushStats(flush=rows.extend, batch_size=1, interval=60)
+        now = time.time()
+        stats.incr('click', 'V1001', 'a', now=now - 3600)
+        # The hour bucket is closed, the background thread is woken up
+        stats.incr('click', 'V1001', 'a', now=now)
+        for i in range(100):
+            if rows:
+                break
+            time.sleep(0.01)
+        self.assertTrue(rows)
+        stats.close()
+        stats.thread.join(1)
+        self.assertFalse(stats.thread.is_alive())
+
+
+class Logger(object):
+
+    def __init__(self):
+        self.errors = []
+
+    def exception(self, message):
+        self.errors.append(message)
+
+
+class TestPushListeners(unittest.TestCase):
+
+    def test_faulty_listener(self):
+        w = settings.init(APP_ID='1', APP_SECRET='1', REGISTER_URL='www.quseit.com/',
+                          HELPER='wego.helpers.official.DjangoHelper')
+        w.settings.data['LOGGER'] = Logger()
+        stats = PushStats(batch_size=100)
+        w.add_push_listener(lambda push: 1 / 0)
+        w.add_push_listener(stats.feed)
+
+        push = w._build_push('<xml><ToUserName><![CDATA[gh]]></ToUserName><FromUserName><![CDATA[oA]]>'
+                             '</FromUserName><MsgType><![CDATA[text]]></MsgType><Content><![CDATA[hi]]></Content></xml>')
+        self.assertEqual(push.type, 'text')
+        self.assertEqual(len(w.settings.LOGGER.errors), 1)
+        self.assertEqual(stats.get('text', '')[0], 1)
+
+
+
+class Request(object):
+
+    def __init__(self, body, params=None):
+        self.body = body
+        self.GET = self
+        self.params = params or {}
+
+    def dict(self):
+        return self.params
+
+
+class TestAnalysisPush(unittest.TestCase):
+
+    def setUp(self):
+        self.w = settings.init(APP_ID='1', APP_SECRET='1', REGISTER_URL='www.quseit.com/',
+                               HELPER='wego.helpers.official.DjangoHelper')
+        self.w.settings.data['MCH_SECRET'] = 'key'
+
+    def test_pay_sign(self):
+        sign = self.w.make_sign({'return_code': 'SUCCESS', 'appid': '1', 'total_fee': '1'})
+        pay = ('<xml><return_code><![CDATA[SUCCESS]]></return_code><appid><![CDATA[1]]></appid>'
+               '<total_fee>1</total_fee><sign><![CDATA[%s]]></sign></xml>')
+        self.assertTrue(self.w.analysis_push(Request((pay % sign).encode('utf-8'))).is_pay)
+        self.assertRaises(WegoApiError, self.w.analysis_push, Request((pay % ('0' * 32)).encode('utf-8')))
+
+        # A push mentions return_code is still a push
+        push = self.w.analysis_push(Request(
+            '<xml><ToUserName><![CDATA[gh]]></ToUserName><FromUserName><![CDATA[oA]]></FromUserName>'
+            '<MsgType><![CDATA[text]]></MsgType><Content><![CDATA[return_code]]></Content></xml>'
+        ))
+        self.assertEqual(push.Content, 'return_code')
+
+    def test_push_signature(self):
+        self.w.settings.data['PUSH_TOKEN'] = 'token'
+        signature = hashlib.sha1(''.join(sorted(['token', '1', '2'])).encode('utf-8')).hexdigest()
+        self.assertTrue(self.w.check_push_signature({'signature': signature, 'timestamp': '1', 'nonce': '2'}))
+        self.assertFalse(self.w.check_push_signature({'signature': u'签名', 'timestamp': '1', 'nonce': '2'}))
+        self.assertFalse(self.w.check_push_signature({'timestamp': '1', 'nonce': '2'}))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+from wego.sync import FollowerSync
+from wego import settings
+import tempfile
+import unittest
+import shutil
+
+
+class Push(object):
+
+    def __init__(self, push_type, openid):
+        self.type = push_type
+        self.from_user = openid
+
+
+class Wego(object):
+
+    def __init__(self, followers, page_size=2, fail_at=None):
+        self.followers = sorted(followers)
+        self.page_size = page_size
+        self.fail_at = fail_at
+        self.requests = []
+
+    def iter_follower_pages(self, next_openid=''):
+        start = self.followers.index(next_openid) + 1 if next_openid else 0
+        while start < len(self.followers):
+            self.requests.append(next_openid)
+            if len(self.requests) == self.fail_at:
+                raise IOError('network')
+            openids = self.followers[start:start + self.page_size]
+            next_openid = openids[-1]
+            yield openids, next_openid
+            start += self.page_size
+
+
+class TestFollowerSync(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_sync_and_diff(self):
+        sync = FollowerSync(Wego(['oA', 'oB', 'oC']), self.path)
+        self.assertEqual(sync.run(), {'count': 3, 'added': 3, 'removed': 0})
+        self.assertTrue(sync.is_follower('oB'))
+
+        sync.wego = Wego(['oB', 'oC', 'oD', 'oE'])
+        self.assertEqual(sync.run(), {'count': 4, 'added': 2, 'removed': 1})
+        self.assertEqual(list(sync.added()), ['oD', 'oE'])
+        self.assertEqual(list(sync.removed()), ['oA'])
+        self.assertFalse(sync.is_follower('oA'))
+
+    def test_old_snapshot_readable(self):
+        sync = FollowerSync(Wego(['oA', 'oB', 'oC']), self.path)
+        sync.run()
+        # A reader holding the last snapshot during a sync
+        old = sync.snapshot()
+        sync.wego = Wego(['oB', 'oD'])
+        sync.run()
+        self.assertTrue('oA' in old)
+        self.assertEqual(list(sync.snapshot()), ['oB', 'oD'])
+
+    def test_resume(self):
+        sync = FollowerSync(Wego(['oA', 'oB', 'oC', 'oD', 'oE'], fail_at=2), self.path)
+        self.assertRaises(IOError, sync.run)
+
+        # The first page is not fetched again
+        wego = sync.wego = Wego(['oA', 'oB', 'oC', 'oD', 'oE'])
+        self.assertEqual(sync.run()['count'], 5)
+        self.assertEqual(wego.requests, ['oB', 'oD'])
+        self.assertEqual(list(FollowerSync(wego, self.path).snapshot()), ['oA', 'oB', 'oC', 'oD', 'oE'])
+
+    def test_pushes(self):
+        sync = FollowerSync(Wego(['oA']), self.path)
+        sync.run()
+        sync.on_push(Push('unsubscribe', 'oA'))
+        sync.on_push(Push('subscribe', 'oB'))
+        self.assertFalse(sync.is_follower('oA'))
+        self.assertTrue(sync.is_follower('oB'))
+
+
+class TestFollowerPages(unittest.TestCase):
+
+    def test_pages(self):
+        w = settings.init(APP_ID='1', APP_SECRET='1', REGISTER_URL='www.quseit.com/',
+                          HELPER='wego.helpers.official.DjangoHelper')
+        pages = {
+            '': {'count': 10000, 'data': {'openid': ['o%05d' % i for i in range(10000)]}, 'next_openid': 'o09999'},
+            'o09999': {'count': 1, 'data': {'openid': ['oZ']}, 'next_openid': 'oZ'},
+        }
+        w.wechat.get_followers = lambda next_openid='': pages[next_openid]
+        self.assertEqual([(len(i), j) for i, j in w.iter_follower_pages()], [(10000, 'o09999'), (1, 'oZ')])
+        self.assertEqual(list(w.iter_followers('o09999')), ['oZ'])
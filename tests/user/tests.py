@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+from wego.api import WeChatUser, WeChatUserError
+from wego.session import SessionRecord, pack_bytes
+from wego.revalidate import Revalidator
+from wego import settings
+import unittest
+import struct
+import base64
+import time
+
+
+class FakeWego(object):
+
+    def __init__(self):
+
+        self.calls = []
+
+    def _get_ext_userinfo_data(self, openid):
+
+        self.calls.append(openid)
+        return {'openid': openid, 'subscribe': 1, 'remark': 'vip', 'groupid': 2, 'tagid_list': [1, 2]}
+
+
+class TestWeChatUser(unittest.TestCase):
+
+    def test_dumps_loads(self):
+        data = {'openid': 'oA', 'nickname': u'张三', 'sex': 1, 'privilege': [], 'expires_at': 1.5, 'other': -1}
+        user = WeChatUser.loads(None, WeChatUser(None, dict(data)).dumps())
+        self.assertEqual(user.openid, 'oA')
+        self.assertIsNotNone(user._raw)
+        self.assertEqual(user.nickname, u'张三')
+        self.assertIsNone(user._raw)
+        self.assertEqual(user.data, data)
+        self.assertEqual(WeChatUser.loads(None, '{"openid": "oB"}').openid, 'oB')
+
+    def test_upgrade(self):
+        wego = FakeWego()
+        user = WeChatUser(wego, {'openid': 'oA', 'nickname': 'a'})
+        self.assertEqual(user.city, '')
+        self.assertEqual(wego.calls, [])
+        self.assertEqual(user.tagid_list, [1, 2])
+        self.assertEqual(user.remark, 'vip')
+        self.assertEqual(wego.calls, ['oA'])
+        self.assertTrue(WeChatUser.loads(wego, user.dumps()).is_upgrade)
+
+    def test_attributes(self):
+        user = WeChatUser(FakeWego(), {'openid': 'oA', 'nickname': 'a'})
+        self.assertEqual(user.__dict__, {})
+        user.extra = 1
+        user.nickname = 'b'
+        self.assertEqual((user.extra, user.nickname, user.data['nickname']), (1, 'b', 'b'))
+        with self.assertRaises(WeChatUserError):
+            user.groupid = 'vip'
+
+
+class FakeHelper(object):
+
+    def __init__(self, session):
+
+        self.session = session
+        self.writes = 0
+
+    def get_session(self, key):
+
+        return self.session.get(key, False)
+
+    def set_session(self, key, value):
+
+        self.writes += 1
+        self.session[key] = value
+
+    def del_session(self, key):
+
+        self.session.pop(key, None)
+
+
+class TestSessionRecord(unittest.TestCase):
+
+    def test_migrate(self):
+        helper = FakeHelper({'wx_openid': 'oA', 'wx_access_token': 't', 'wx_access_token_expires_at': '9.5',
+                             'wx_refresh_token': 'r', 'wx_userinfo': '{"openid": "oA"}'})
+        record = SessionRecord(helper)
+        self.assertTrue(record.save())
+        self.assertEqual(list(helper.session), ['wx'])
+
+        helper = FakeHelper({'wx': helper.session['wx']})
+        record = SessionRecord(helper)
+        self.assertEqual((record.openid, record.access_token, record.expires_at, record.refresh_token),
+                         ('oA', 't', 9.5, 'r'))
+        self.assertEqual(WeChatUser.loads(None, record.userinfo).openid, 'oA')
+
+        record.update(openid='oA', access_token='t')
+        self.assertFalse(record.save())
+        record.update(access_token='t2')
+        self.assertTrue(record.save())
+        self.assertEqual(helper.writes, 1)
+
+    def test_scope(self):
+        helper = FakeHelper({})
+        record = SessionRecord(helper)
+        record.update(openid='oA', scope='snsapi_base')
+        record.save()
+        self.assertEqual(SessionRecord(helper).scope, 'snsapi_base')
+
+        # Version 1 has no scope
+        buf = bytearray(struct.pack('>Bd', 1, 0))
+        for value in (b'oA', b't', b'r', b''):
+            pack_bytes(buf, value)
+        record = SessionRecord(FakeHelper({'wx': base64.b64encode(bytes(buf))}))
+        self.assertEqual((record.openid, record.scope), ('oA', 'snsapi_userinfo'))
+
+
+class TestRevalidator(unittest.TestCase):
+
+    def test_refresh_apply(self):
+        wego = settings.init(APP_ID='1', APP_SECRET='1', REGISTER_URL='www.quseit.com/', USERINFO_EXPIRE=60,
+                             USERINFO_GRACE=60, HELPER='wego.helpers.official.DjangoHelper')
+        wego.wechat.refresh_access_token = lambda token: {'access_token': 't2', 'expires_in': 7200,
+                                                          'refresh_token': 'r2'}
+        wego.wechat.get_userinfo_by_token = lambda openid, token: {'openid': openid, 'nickname': token}
+
+        self.assertEqual((wego.revalidator.grace, wego.revalidator.results.ttl), (60, 600))
+
+        revalidator = Revalidator(wego)
+        revalidator.results.set(('oA', 'r'), revalidator.refresh('oA', 't', time.time() - 1, 'r'))
+
+        # Another session of the user
+        other = SessionRecord(FakeHelper({}))
+        other.update(refresh_token='r3')
+        self.assertFalse(revalidator.apply('oA', other))
+
+        record = SessionRecord(FakeHelper({}))
+        record.update(refresh_token='r')
+        self.assertTrue(revalidator.apply('oA', record))
+        self.assertEqual((record.access_token, record.refresh_token), ('t2', 'r2'))
+        self.assertEqual(WeChatUser.loads(wego, record.userinfo).nickname, 't2')
+        self.assertFalse(revalidator.apply('oA', record))
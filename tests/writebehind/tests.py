@@ -0,0 +1,95 @@
+from wego.writebehind import WriteBehindQueue
+from wego.bitmap import TagIndex
+from wego import settings
+import tempfile
+import unittest
+import shutil
+import os
+
+
+def init():
+    w = settings.init(APP_ID='1', APP_SECRET='1', REGISTER_URL='www.quseit.com/',
+                      HELPER='wego.helpers.official.DjangoHelper')
+    w.calls = []
+    w.wechat.batch_change_user_group = lambda openids, groupid: w.calls.append(('group', sorted(openids), groupid))
+    w.wechat.batch_tagging = lambda openids, tagid: w.calls.append(('tag', sorted(openids), tagid))
+    w.wechat.batch_untagging = lambda openids, tagid: w.calls.append(('untag', sorted(openids), tagid))
+    w.wechat.set_user_remark = lambda openid, remark: w.calls.append(('remark', openid, remark))
+    return w
+
+
+class TestWriteBehindQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'writes.jsonl')
+        self.w = init()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_coalesce(self):
+        queue = WriteBehindQueue(self.w, interval=0)
+        queue.change_user_group('oA', 1)
+        queue.change_user_group('oA', 2)
+        queue.change_user_group('oB', 2)
+        queue.tag_user('oA', 5)
+        queue.untag_user('oA', 5)
+        queue.set_remark('oC', 'x')
+        queue.set_remark('oC', 'y')
+        self.assertEqual(len(queue), 4)
+
+        self.assertEqual(queue.close(), 0)
+        self.assertEqual(sorted(self.w.calls), [
+            ('group', ['oA', 'oB'], 2), ('remark', 'oC', 'y'), ('untag', ['oA'], 5)
+        ])
+
+    def test_tag_index(self):
+        self.w.tag_index = TagIndex()
+        self.w.write_behind = queue = WriteBehindQueue(self.w, interval=0)
+        published = []
+        self.w.invalidation.backend.subscribe(published.append)
+        self.w.tag_users(['oA', 'oB'], 5)
+        # Not in the index before it reaches wechat
+        self.assertEqual(len(self.w.tag_index.tag(5)), 0)
+
+        def fail(openids, tagid):
+            raise Exception('system busy')
+        self.w.wechat.batch_tagging = fail
+        self.assertEqual(queue.flush(), 2)
+        self.assertEqual(len(self.w.tag_index.tag(5)), 0)
+
+        self.w.wechat.batch_tagging = lambda openids, tagid: None
+        self.assertEqual(queue.close(), 0)
+        self.assertEqual(sorted(self.w.tag_index.openids(self.w.tag_index.tag(5))), ['oA', 'oB'])
+        self.assertEqual(len(published), 1)
+
+    def test_replay(self):
+        crashed = WriteBehindQueue(self.w, self.path, interval=0)
+        crashed.change_user_group('oA', 2)
+        crashed.set_remark('oA', 'vip')
+        # Crash: the journal is left and its lock is released
+        crashed.spill.close()
+        crashed.spill = None
+        crashed.stopped.set()
+
+        queue = WriteBehindQueue(self.w, self.path, interval=0)
+        self.assertEqual(len(queue), 2)
+        self.assertEqual(os.listdir(self.dir), [os.path.basename(queue.journal_path)])
+
+        queue.close()
+        self.assertEqual(sorted(self.w.calls), [('group', ['oA'], 2), ('remark', 'oA', 'vip')])
+        self.assertEqual(os.listdir(self.dir), [])
+
+    def test_journal_per_process(self):
+        running = WriteBehindQueue(self.w, self.path, interval=0)
+        running.change_user_group('oA', 2)
+
+        # The journal of a running process is not taken over
+        queue = WriteBehindQueue(self.w, self.path, interval=0)
+        self.assertEqual(len(queue), 0)
+        self.assertEqual(len(os.listdir(self.dir)), 2)
+
+        queue.close()
+        running.close()
+        self.assertEqual(self.w.calls, [('group', ['oA'], 2)])
@@ -1,5 +1,28 @@
 # -*- coding: utf-8 -*-
 
+"""
+wego
+
+import wego stays light on Python 3.7+, WegoApi, WeChatUser and WeChatApi (and requests with them) are imported
+at the first use by a module __getattr__ (PEP 562). Older Pythons import them with wego.
+"""
+
 from .settings import init
-from .api import WegoApi, WeChatUser
-from .wechat import WeChatApi
+import sys
+
+_LAZY = {
+    'WegoApi': 'api',
+    'WeChatUser': 'api',
+    'WeChatApi': 'wechat',
+}
+
+if sys.version_info >= (3, 7):
+    def __getattr__(name):
+        if name not in _LAZY:
+            raise AttributeError("module 'wego' has no attribute '%s'" % name)
+        module = __import__('wego.' + _LAZY[name], fromlist=[name])
+        value = globals()[name] = getattr(module, name)
+        return value
+else:
+    from .api import WegoApi, WeChatUser
+    from .wechat import WeChatApi
@@ -0,0 +1,366 @@
+# -*- coding: utf-8 -*-
+
+"""
+wego.aio
+
+Asyncio mode for coroutine frameworks such as Tornado, Python 3.5+. OAuth and push never block the event loop:
+wechat calls go through tornado.httpclient.AsyncHTTPClient if tornado is installed, or requests in a thread pool.
+
+    class IndexHandler(tornado.web.RequestHandler):
+
+        @w.aio.login_required
+        async def get(self):
+            self.write(self.wx_user.nickname)
+
+    class PushHandler(tornado.web.RequestHandler):
+
+        async def post(self):
+            push = await w.aio.analysis_push(self)
+
+With snsapi_base the profile is got by login_required(scope='snsapi_base', profile=True) or
+await w.aio.get_lazy_userinfo(self), reading it from a lazy wx_user raises WeChatUserError instead of blocking.
+"""
+
+from .exceptions import WeChatApiError, WeChatUserError, UpgradeRequired
+from .api import WeChatUser, LazyWeChatUser, PROFILE_FIELDS
+from .cache import ProfileCache
+from urllib.parse import urlencode
+import functools
+import asyncio
+import inspect
+import json
+import time
+
+
+async def default_fetch(url, params=None, body=None):
+    """
+    GET url, or POST body when body is not None.
+
+    :return: :dict: JSON that wechat returns.
+    """
+
+    if params:
+        url += ('&' if '?' in url else '?') + urlencode(params)
+
+    try:
+        from tornado.httpclient import AsyncHTTPClient
+    except ImportError:
+        import requests
+        loop = asyncio.get_event_loop()
+        if body is None:
+            response = await loop.run_in_executor(None, requests.get, url)
+        else:
+            response = await loop.run_in_executor(None, functools.partial(requests.post, url, data=body))
+        return json.loads(response.content.decode('utf-8'))
+
+    if body is None:
+        response = await AsyncHTTPClient().fetch(url)
+    else:
+        response = await AsyncHTTPClient().fetch(url, method='POST', body=body)
+    return json.loads(response.body.decode('utf-8'))
+
+
+class AsyncLazyWeChatUser(LazyWeChatUser):
+    """
+    request.wx_user of a snsapi_base login in asyncio mode, its profile is readable once
+    :meth:`AsyncWegoApi.get_lazy_userinfo <wego.aio.AsyncWegoApi.get_lazy_userinfo>` got it.
+    """
+
+    __slots__ = ()
+
+    def resolve(self):
+
+        if self._user is None:
+            raise WeChatUserError(u'Await get_lazy_userinfo before reading the profile'
+                                  u'(请先 await get_lazy_userinfo 获取用户信息)')
+        return self._user
+
+
+class AsyncWeChatApi(object):
+    """
+    Coroutine version of the wechat apis used by login and push.
+
+    :param wego: :class:`WegoApi <wego.api.WegoApi>` object.
+    :param fetch: (optional) Coroutine function fetch(url, params, body) returns JSON dict, such as one on aiohttp.
+    """
+
+    def __init__(self, wego, fetch=None):
+
+        self.wego = wego
+        self.settings = wego.settings
+        self.fetch = fetch or default_fetch
+
+    async def get_access_token(self, code):
+
+        return await self.fetch('https://api.weixin.qq.com/sns/oauth2/access_token', {
+            'appid': self.settings.APP_ID,
+            'secret': self.settings.APP_SECRET,
+            'code': code,
+            'grant_type': 'authorization_code'
+        })
+
+    async def refresh_access_token(self, refresh_token):
+
+        data = await self.fetch('https://api.weixin.qq.com/sns/oauth2/refresh_token', {
+            'appid': self.settings.APP_ID,
+            'grant_type': 'refresh_token',
+            'refresh_token': refresh_token
+        })
+
+        if 'errcode' in data:
+            return 'error'
+        return data
+
+    async def get_userinfo_by_token(self, openid, access_token):
+
+        return await self.fetch('https://api.weixin.qq.com/sns/userinfo', {
+            'access_token': access_token,
+            'openid': openid,
+            'lang': 'zh_CN'
+        })
+
+    async def get_userinfo(self, openid):
+
+        # GET_GLOBAL_ACCESS_TOKEN may call wechat, so it runs in thread pool
+        loop = asyncio.get_event_loop()
+        access_token = await loop.run_in_executor(None, self.settings.GET_GLOBAL_ACCESS_TOKEN, self.wego.wechat)
+        data = await self.fetch('https://api.weixin.qq.com/cgi-bin/user/info', {
+            'access_token': access_token,
+            'openid': openid,
+            'lang': 'zh_CN'
+        })
+
+        if 'errcode' in data:
+            raise WeChatApiError('errcode: {}, msg: {}'.format(data['errcode'], data['errmsg']))
+        return data
+
+
+class AsyncWegoApi(object):
+    """
+    Asyncio mode of a WegoApi, use :attr:`WegoApi.aio <wego.api.WegoApi.aio>` to get it.
+    Sessions, caches and settings are shared with the WegoApi.
+
+    :param wego: :class:`WegoApi <wego.api.WegoApi>` object.
+    :param fetch: (optional) See :class:`AsyncWeChatApi <wego.aio.AsyncWeChatApi>`.
+    :param executor: (optional) concurrent.futures executor push decryption runs in, default runs it inline.
+            Push listeners, cache invalidation and USERINFO_CACHE calls which may reach a backend run in it,
+            or in the default executor of the loop.
+    """
+
+    def __init__(self, wego, fetch=None, executor=None):
+
+        self.wego = wego
+        self.settings = wego.settings
+        self.wechat = AsyncWeChatApi(wego, fetch)
+        self.executor = executor
+        self.code_futures = {}
+
+    def login_required(self, func=None, scope='snsapi_userinfo', profile=False):
+        """
+        Decorator for coroutine handlers, same as :meth:`WegoApi.login_required <wego.api.WegoApi.login_required>`.
+        With snsapi_base, read request.wx_user profile after profile=True or :meth:`get_lazy_userinfo`.
+        """
+
+        if func is None:
+            return lambda func: self.login_required(func, scope, profile)
+
+        @functools.wraps(func)
+        async def get_wx_user(request, *args, **kwargs):
+
+            helper = getattr(request, 'wego_helper', None) or self.wego.get_helper(request)
+            record = self.wego.get_session_record(helper)
+
+            code = helper.get_params().get('code', '')
+            openid = None
+
+            if code:
+                openid = await self.get_openid(record, code)
+
+            if not openid:
+                openid = record.openid
+
+            if openid and scope == 'snsapi_base':
+                request.wego = self.wego
+                request.wx_openid = openid
+                request.wx_user = AsyncLazyWeChatUser(self.wego, record, openid)
+                if profile:
+                    try:
+                        request.wx_user = await self.get_lazy_userinfo(request)
+                    except UpgradeRequired:
+                        record.save()
+                        return self.wego.redirect_for_code(helper)
+                record.save()
+                try:
+                    return await self._call(func, request, *args, **kwargs)
+                except UpgradeRequired:
+                    return self.wego.redirect_for_code(helper)
+
+            if openid:
+                request.wego = self.wego
+                request.wx_openid = openid
+
+                wx_user = await self.get_userinfo(record, openid)
+                if wx_user != 'error':
+                    request.wx_user = wx_user
+                    record.save()
+                    return await self._call(func, request, *args, **kwargs)
+
+            record.save()
+            return self.wego.redirect_for_code(helper, scope)
+
+        return get_wx_user
+
+    @staticmethod
+    async def _call(func, *args, **kwargs):
+
+        result = func(*args, **kwargs)
+        if inspect.isawaitable(result):
+            result = await result
+        return result
+
+    async def get_openid(self, record, code):
+        """
+        Exchange code for openid, concurrent requests of the same code share one call.
+
+        :param record: :class:`SessionRecord <wego.session.SessionRecord>` object.
+        :return: openid, None if the code is invalid.
+        """
+
+        data = self.wego.code_cache.get(code)
+        if data is None:
+            future = self.code_futures.get(code)
+            if future is None:
+                future = self.code_futures[code] = asyncio.ensure_future(self._exchange_code(code))
+                future.add_done_callback(lambda future: self.code_futures.pop(code, None))
+            data = await future
+        if data is None:
+            return None
+
+        self.wego._set_user_tokens(record, data)
+        record.update(openid=data['openid'])
+
+        return data['openid']
+
+    async def _exchange_code(self, code):
+
+        data = await self.wechat.get_access_token(code)
+        if 'openid' not in data:
+            self.settings.LOGGER.warning(u'Exchange code failed: %s' % data)
+            return None
+
+        self.wego.code_cache.set(code, data)
+        return data
+
+    async def _cache_call(self, func, *args):
+        """
+        Call a USERINFO_CACHE method, in executor unless the cache is memory only.
+        """
+
+        cache = self.wego.userinfo_cache
+        if isinstance(cache, ProfileCache) and cache.backend is None:
+            return func(*args)
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(func, *args))
+
+    async def get_userinfo(self, record, openid):
+        """
+        Get user info, same as :meth:`WegoApi.get_userinfo <wego.api.WegoApi.get_userinfo>`.
+
+        :return: :class:`WeChatUser <wego.api.WeChatUser>` object or 'error'
+        """
+
+        wego = self.wego
+        wechat_user = wego._get_userinfo_from_session(record, openid)
+        if not wechat_user and wego.userinfo_cache is not None:
+            wechat_user = await self._cache_call(wego._get_userinfo_from_cache, openid)
+        if wechat_user:
+            return wechat_user
+
+        if record.scope == 'snsapi_base':
+            return 'error'
+
+        if record.expires_at and record.expires_at < time.time():
+            new_token = await self.wechat.refresh_access_token(record.refresh_token)
+            if new_token == 'error':
+                return 'error'
+            wego._set_user_tokens(record, new_token)
+
+        data = await self.wechat.get_userinfo_by_token(openid, record.access_token)
+        wego._set_userinfo_to_session(record, data)
+        if hasattr(wego.userinfo_cache, 'set_profile') and 'errcode' not in data:
+            await self._cache_call(wego.userinfo_cache.set_profile, openid, data)
+
+        return WeChatUser(wego, data)
+
+    async def get_lazy_userinfo(self, request):
+        """
+        Resolve request.wx_user of a snsapi_base login without blocking, the profile is saved into session.
+
+        :return: :class:`WeChatUser <wego.api.WeChatUser>` object
+        :raise: UpgradeRequired if only a snsapi_userinfo authorization can get the profile.
+        """
+
+        wx_user = request.wx_user
+        if not isinstance(wx_user, LazyWeChatUser):
+            return wx_user
+        if wx_user._user is not None:
+            return wx_user._user
+
+        record = wx_user.record
+        wechat_user = await self.get_userinfo(record, wx_user.openid)
+        if wechat_user == 'error':
+            cache = self.wego.userinfo_cache
+            data = await self._cache_call(cache.get, wx_user.openid) if cache is not None else None
+            if data is None:
+                data = await self.wechat.get_userinfo(wx_user.openid)
+                if cache is not None:
+                    await self._cache_call(cache.set, wx_user.openid, data)
+            if data.get('subscribe') != 1:
+                raise UpgradeRequired(u'User info requires snsapi_userinfo(需要用户授权获取信息)')
+            wechat_user = WeChatUser(self.wego, dict(data), is_upgrade=True)
+            self.wego._set_userinfo_to_session(record, {k: data[k] for k in PROFILE_FIELDS if k in data})
+
+        record.save()
+        wx_user._user = wechat_user
+        return wechat_user
+
+    async def analysis_push(self, request):
+        """
+        Same as :meth:`WegoApi.analysis_push <wego.api.WegoApi.analysis_push>`, decryption runs in executor if set.
+
+        :return: :class:`WeChatPush <wego.api.WeChatPush>` object.
+        """
+
+        helper = self.wego.get_helper(request)
+        raw_xml = helper.get_body()
+        if inspect.isawaitable(raw_xml):
+            raw_xml = await raw_xml
+
+        return await self.parse_push(raw_xml, helper.get_params())
+
+    async def parse_push(self, raw_xml, params):
+        """
+        Parse a push body.
+
+        :param raw_xml: Request body.
+        :param params: Query params.
+        :return: :class:`WeChatPush <wego.api.WeChatPush>` or :class:`WeChatPay <wego.api.WeChatPay>` object.
+        :raise: WegoApiError if the pay sign is wrong or decryption fails.
+        """
+
+        if isinstance(raw_xml, bytes):
+            raw_xml = raw_xml.decode('utf-8')
+
+        pay = self.wego._parse_pay(raw_xml)
+        if pay is not None:
+            return pay
+
+        loop = asyncio.get_event_loop()
+        if self.executor is not None and self.settings.PUSH_TOKEN:
+            raw_xml, nonce = await loop.run_in_executor(self.executor, self.wego._decrypt_push, raw_xml, params)
+        else:
+            raw_xml, nonce = self.wego._decrypt_push(raw_xml, params)
+
+        push = self.wego._parse_push(raw_xml, nonce)
+        await loop.run_in_executor(self.executor, self.wego._notify_push, push)
+        return push
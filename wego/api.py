@@ -1,12 +1,24 @@
 # -*- coding: utf-8 -*-
-from .exceptions import WegoApiError, WeChatUserError
+from .exceptions import WegoApiError, WeChatUserError, UpgradeRequired
+from .invalidation import InvalidationBus
+from .batch import chunked, run_batches, RateLimiter
+from .cache import MemoryCache, ProfileCache, SingleFlight, PROFILE_FIELDS
+from .session import SessionRecord, pack_varint, unpack_varint, pack_bytes, unpack_bytes
 from functools import reduce
+import functools
 import wego
 import json
 import time
 import random
 import string
 import hashlib
+import struct
+import hmac
+
+try:
+    string_types = basestring
+except NameError:
+    string_types = str
 
 
 class WegoApi(object):
@@ -18,12 +30,119 @@ class WegoApi(object):
 
         self.settings = settings
         self.wechat = wego.WeChatApi(settings)
+        self.push_listeners = list(settings.PUSH_LISTENERS or [])
+        self.invalidation = InvalidationBus(settings.data.get('INVALIDATION_BACKEND'), settings.APP_ID)
+        self.groups_cache = self.invalidation.register('groups', MemoryCache(1, settings.GROUPS_EXPIRE))
+
+        # A code can be exchanged once, a refreshed or prefetched redirect brings it again
+        self.code_cache = MemoryCache(10000, settings.OAUTH_CODE_EXPIRE)
+        self.code_flight = SingleFlight()
+
+        self.userinfo_cache = settings.data.get('USERINFO_CACHE')
+        if self.userinfo_cache is None and (settings.USERINFO_EXPIRE or settings.EXT_USERINFO_EXPIRE):
+            self.userinfo_cache = ProfileCache(
+                settings.USERINFO_CACHE_SIZE or 10000,
+                settings.USERINFO_EXPIRE,
+                settings.EXT_USERINFO_EXPIRE,
+                settings.data.get('USERINFO_CACHE_BACKEND'),
+                'wego:user:%s:' % settings.APP_ID
+            )
+        if self.userinfo_cache is not None:
+            self.invalidation.register('user', self.userinfo_cache)
+
+        if settings.PREFETCH_USERINFO:
+            from .prefetch import ProfilePrefetcher
+            self.prefetcher = ProfilePrefetcher(self)
+            self.add_push_listener(self.prefetcher.on_push)
+
+        self.conversations = settings.data.get('CONVERSATION_STORE')
+        if self.conversations is not None:
+            self.conversations.bind(self.invalidation)
+
+        self.tag_index = settings.data.get('TAG_INDEX')
+        if self.tag_index is True:
+            from .bitmap import TagIndex
+            self.tag_index = TagIndex()
+
+        if settings.WRITE_BEHIND:
+            from .writebehind import WriteBehindQueue
+            self.write_behind = WriteBehindQueue(self, settings.WRITE_BEHIND_SPILL_PATH or None)
+        else:
+            self.write_behind = None
+
+        if settings.USERINFO_EXPIRE and settings.USERINFO_GRACE:
+            from .revalidate import Revalidator
+            self.revalidator = Revalidator(self, grace=settings.USERINFO_GRACE)
+        else:
+            self.revalidator = None
+
+        if settings.MEDIA_PREFETCH_PATH:
+            from .media import MediaPrefetcher
+            self.media_prefetcher = MediaPrefetcher(self, settings.MEDIA_PREFETCH_PATH)
+            self.add_push_listener(self.media_prefetcher.on_push)
+
+        if settings.SNAPSHOT_PATH:
+            from .snapshot import CacheSnapshot
+            self.snapshot = CacheSnapshot(self, settings.SNAPSHOT_PATH)
+            self.snapshot.load()
+            self.snapshot.start(settings.SNAPSHOT_INTERVAL)
+        else:
+            self.snapshot = None
+
+        if settings.WARMUP:
+            self.warmup()
+
+    def warmup(self):
+        """
+        Do the work of the first requests before serving: import the helper, open pooled connections to
+        wechat hosts, fetch (or load from TOKEN_STORE) the global access token and build the push crypto.
+        A failed step is logged and skipped, the request that needs it does it again.
+
+        :return: :dict: Seconds each step took, None if it failed.
+        """
+
+        settings = self.settings
+        hosts = ['https://api.weixin.qq.com/']
+        if settings.MCH_ID:
+            hosts.append('https://api.mch.weixin.qq.com/')
 
-    def login_required(self, func):
+        steps = [('helper', lambda: settings.HELPER)]
+        steps += [('connect ' + i, functools.partial(self.wechat.preconnect, i)) for i in hosts]
+        steps.append(('token', lambda: settings.GET_GLOBAL_ACCESS_TOKEN(self.wechat)))
+        if settings.PUSH_TOKEN:
+            steps.append(('push_crypto', self._get_push_crypto))
+
+        timings = {}
+        for name, func in steps:
+            start = time.time()
+            try:
+                func()
+                timings[name] = time.time() - start
+            except Exception as e:
+                timings[name] = None
+                settings.LOGGER.warning(u'Warm up %s failed(预热失败): %s' % (name, e))
+        settings.LOGGER.info(u'Warm up done(预热完成): %s' % timings)
+        return timings
+
+    def login_required(self, func=None, scope='snsapi_userinfo', profile=False):
         """
         Decorator：use for request function, and it will init an independent WegoApi instance.
+
+            @w.login_required(scope='snsapi_base')
+            def view(request):
+                request.wx_openid     # silent authorization, no consent screen
+                request.wx_user.city  # profile is fetched here, or the user is redirected to authorize
+
+        :param scope: (optional) snsapi_userinfo or snsapi_base. With snsapi_base only openid is resolved
+                before the function, request.wx_user is a :class:`LazyWeChatUser <wego.api.LazyWeChatUser>`.
+        :param profile: (optional) With snsapi_base, get the profile before the function, a user who has to
+                authorize snsapi_userinfo is redirected before the function runs. Use it for functions with
+                side effects, see :class:`LazyWeChatUser <wego.api.LazyWeChatUser>`.
         """
 
+        if func is None:
+            return lambda func: self.login_required(func, scope, profile)
+
         def get_wx_user(request, *args, **kwargs):
             """
             Called by login_required, it will set some attributes to function`s first param.
@@ -32,35 +151,56 @@ class WegoApi(object):
             :return: Subject to availability.
             """
 
-            helper = self.settings.HELPER(request)
+            # The helper of wego.middleware, so the session record is read once
+            helper = getattr(request, 'wego_helper', None) or self.get_helper(request)
+            record = self.get_session_record(helper)
 
             code = helper.get_params().get('code', '')
             openid = None
 
             if code:
-                openid = self.get_openid(helper, code)
-                helper.set_session('wx_openid', openid)
+                openid = self._get_openid(record, code)
 
             if not openid:
-                openid = helper.get_session('wx_openid')
+                openid = record.openid
+
+            if openid and scope == 'snsapi_base':
+                request.wego = self
+                request.wx_openid = openid
+                if profile:
+                    try:
+                        request.wx_user = self._get_lazy_userinfo(record, openid)
+                    except UpgradeRequired:
+                        record.save()
+                        return self.redirect_for_code(helper)
+                else:
+                    request.wx_user = LazyWeChatUser(self, record, openid)
+                record.save()
+                try:
+                    return func(request, *args, **kwargs)
+                except UpgradeRequired:
+                    return self.redirect_for_code(helper)
 
             if openid:
                 request.wego = self
                 request.wx_openid = openid
 
-                wx_user = self.get_userinfo(helper, openid)
+                wx_user = self._get_userinfo(record, openid)
                 if wx_user != 'error':
                     request.wx_user = wx_user
+                    record.save()
                     return func(request, *args, **kwargs)
 
-            return self.redirect_for_code(helper)
+            record.save()
+            return self.redirect_for_code(helper, scope)
 
         return get_wx_user
 
-    def redirect_for_code(self, helper):
+    def redirect_for_code(self, helper, scope='snsapi_userinfo'):
         """
         Let user jump to wechat authorization page.
 
+        :param scope: (optional) snsapi_userinfo or snsapi_base.
         :return: Redirect object
         """
 
@@ -74,7 +214,7 @@ class WegoApi(object):
             get_params = helper.get_params()
             if 'code' not in get_params:
                 state = '&'.join(['%s=%s' % (i, j) for i, j in get_params.items()])
-        url = self.wechat.get_code_url(redirect_url, state)
+        url = self.wechat.get_code_url(redirect_url, state, scope)
 
         return helper.redirect(url)
 
@@ -83,15 +223,59 @@ class WegoApi(object):
         Get user openid.
 
         :param code: A code that user redirect back will bring.
-        :return: openid
+        :return: openid, None if the code is invalid.
         """
 
-        data = self.wechat.get_access_token(code)
+        record = self.get_session_record(helper)
+        openid = self._get_openid(record, code)
+        record.save()
 
-        self._set_user_tokens(helper, data)
+        return openid
+
+    def _get_openid(self, record, code):
+
+        data = self.code_cache.get(code)
+        if data is None:
+            data = self.code_flight.do(code, lambda: self._exchange_code(code))
+        if data is None:
+            return None
+
+        self._set_user_tokens(record, data)
+        record.update(openid=data['openid'])
 
         return data['openid']
 
+    def _exchange_code(self, code):
+        """
+        Exchange code for tokens and cache the result.
+
+        :return: :dict: Tokens, None if wechat refuses the code.
+        """
+
+        data = self.code_cache.get(code)
+        if data is not None:
+            return data
+
+        data = self.wechat.get_access_token(code)
+        if 'openid' not in data:
+            self.settings.LOGGER.warning(u'Exchange code failed: %s' % data)
+            return None
+
+        self.code_cache.set(code, data)
+        return data
+
+    def get_session_record(self, helper):
+        """
+        Get the session record of a request, it is read once per helper.
+
+        :return: :class:`SessionRecord <wego.session.SessionRecord>` object
+        """
+
+        record = getattr(helper, 'wego_session', None)
+        if record is None:
+            record = helper.wego_session = SessionRecord(helper, self.settings.SESSION_KEY or 'wx')
+        return record
+
     def get_userinfo(self, helper, openid):
         """
         Get user info.
@@ -99,40 +283,95 @@ class WegoApi(object):
         :return: :class:`WeChatUser <wego.api.WeChatUser>` object
         """
 
-        wechat_user = self._get_userinfo_from_session(helper)
+        record = self.get_session_record(helper)
+        wechat_user = self._get_userinfo(record, openid)
+        record.save()
+
+        return wechat_user
+
+    def _get_userinfo(self, record, openid):
+
+        wechat_user = self._get_userinfo_from_session(record, openid) or self._get_userinfo_from_cache(openid)
         if wechat_user:
             return wechat_user
 
-        wx_access_token_expires_at = helper.get_session('wx_access_token_expires_at')
-        if wx_access_token_expires_at and float(wx_access_token_expires_at) < time.time():
-            refresh_token = helper.get_session('wx_refresh_token')
-            new_token = self.wechat.refresh_access_token(refresh_token)
+        # A snsapi_base token can not get userinfo
+        if record.scope == 'snsapi_base':
+            return 'error'
+
+        if record.expires_at and record.expires_at < time.time():
+            new_token = self.wechat.refresh_access_token(record.refresh_token)
             if new_token == 'error':
                 return 'error'
-            self._set_user_tokens(helper, new_token)
+            self._set_user_tokens(record, new_token)
 
-        access_token = helper.get_session('wx_access_token')
-        data = self.wechat.get_userinfo_by_token(openid, access_token)
-        self._set_userinfo_to_session(helper, data)
+        data = self.wechat.get_userinfo_by_token(openid, record.access_token)
+        self._set_userinfo_to_session(record, data)
+        if hasattr(self.userinfo_cache, 'set_profile') and 'errcode' not in data:
+            self.userinfo_cache.set_profile(openid, data)
 
         return WeChatUser(self, data)
 
-    def _get_userinfo_from_session(self, helper):
+    def _get_userinfo_from_cache(self, openid):
         """
-        Get user info from session.
+        Get user info from USERINFO_CACHE.
 
         :return: None or :class:`WeChatUser <wego.api.WeChatUser>` object
         """
 
-        if self.settings.USERINFO_EXPIRE:
-            wx_userinfo = helper.get_session('wx_userinfo')
-            if wx_userinfo:
-                wx_userinfo = dict({'expires_at': 0}, **json.loads(wx_userinfo))
-                if wx_userinfo['expires_at'] > time.time():
-                    return WeChatUser(self, wx_userinfo)
+        # Subscribed user`s ext userinfo contains the whole profile
+        if self.userinfo_cache is not None:
+            data = self.userinfo_cache.get(openid)
+            if data and data.get('subscribe') == 1:
+                return WeChatUser(self, dict(data), is_upgrade=True)
+
+            if hasattr(self.userinfo_cache, 'get_profile'):
+                data = self.userinfo_cache.get_profile(openid)
+                if data:
+                    return WeChatUser(self, data)
+        return None
+
+    def _get_lazy_userinfo(self, record, openid):
+        """
+        Resolve the user of a snsapi_base login: session, cache, user token, then ext info of subscribed user.
+
+        :return: :class:`WeChatUser <wego.api.WeChatUser>` object
+        :raise: UpgradeRequired if only a snsapi_userinfo authorization can get the profile.
+        """
+
+        wechat_user = self._get_userinfo(record, openid)
+        if wechat_user == 'error':
+            data = self._get_ext_userinfo_data(openid)
+            if data.get('subscribe') != 1:
+                raise UpgradeRequired(u'User info requires snsapi_userinfo(需要用户授权获取信息)')
+            wechat_user = WeChatUser(self, data, is_upgrade=True)
+            self._set_userinfo_to_session(record, {k: data[k] for k in PROFILE_FIELDS if k in data})
+
+        record.save()
+        return wechat_user
+
+    def _get_userinfo_from_session(self, record, openid):
+        """
+        Get user info from session, a stale one within USERINFO_GRACE is returned and refreshed in background.
+
+        :return: None or :class:`WeChatUser <wego.api.WeChatUser>` object
+        """
+
+        if self.settings.USERINFO_EXPIRE and record.userinfo:
+            if self.revalidator is not None:
+                self.revalidator.apply(openid, record)
+
+            # Only openid and expires_at are decoded here
+            wx_user = WeChatUser.loads(self, record.userinfo)
+            expires_at = wx_user._data.get('expires_at') or 0
+            if expires_at > time.time():
+                return wx_user
+            if self.revalidator is not None and expires_at + self.revalidator.grace > time.time():
+                self.revalidator.submit(openid, record)
+                return wx_user
         return None
 
-    def _set_userinfo_to_session(self, helper, data):
+    def _set_userinfo_to_session(self, record, data):
         """
         Set user info into session.
 
@@ -140,10 +379,11 @@ class WegoApi(object):
         :return: None
         """
 
-        data['expires_at'] = time.time() + self.settings.USERINFO_EXPIRE
-        helper.set_session('wx_userinfo', json.dumps(data))
+        if self.settings.USERINFO_EXPIRE:
+            data['expires_at'] = time.time() + self.settings.USERINFO_EXPIRE
+            record.update(userinfo=WeChatUser(self, data).dumps())
 
-    def _set_user_tokens(self, helper, data):
+    def _set_user_tokens(self, record, data):
         """
         Set user all tokens to sessions.
 
@@ -151,9 +391,13 @@ class WegoApi(object):
         :return: None
         """
 
-        helper.set_session('wx_access_token', data['access_token'])
-        helper.set_session('wx_access_token_expires_at', str(time.time() + data['expires_in'] - 180))
-        helper.set_session('wx_refresh_token', data['refresh_token'])
+        record.update(
+            access_token=data['access_token'],
+            expires_at=time.time() + data['expires_in'] - 180,
+            refresh_token=data['refresh_token']
+        )
+        if 'scope' in data:
+            record.update(scope='snsapi_userinfo' if 'snsapi_userinfo' in data['scope'] else 'snsapi_base')
 
     def get_ext_userinfo(self, openid):
         """
@@ -162,9 +406,92 @@ class WegoApi(object):
         :return: :dict: User data
         """
 
-        data = self.wechat.get_userinfo(openid)
+        data = self._get_ext_userinfo_data(openid)
 
-        return WeChatUser(self, data)
+        return WeChatUser(self, data, is_upgrade=True)
+
+    def get_ext_userinfo_batch(self, openids, workers=4, rate=20):
+        """
+        Get extra info of many users by /cgi-bin/user/info/batchget, 100 users per call,
+        calls run concurrently and every failed call is retried.
+
+            for user in w.get_ext_userinfo_batch(openids):
+                print(user.nickname)
+
+        :param openids: Any iterable of openid, it is read lazily.
+        :param workers: (optional) Calls in flight.
+        :param rate: (optional) Max calls per second.
+        :return: Generator of :class:`WeChatUser <wego.api.WeChatUser>` object, in completion order.
+        :raise: WegoApiError with .openids of failed calls, or the exception reading openids raises.
+        """
+
+        failed = []
+        limiter = RateLimiter(rate) if rate else None
+        batches = run_batches(self.wechat.batch_get_userinfo, chunked(openids, 100), workers, rate_limiter=limiter)
+        for chunk, data, error in batches:
+            if error is not None:
+                self.settings.LOGGER.error(u'Batch get userinfo failed: %s' % error)
+                failed.extend(chunk)
+                continue
+
+            for user in data['user_info_list']:
+                if self.userinfo_cache is not None:
+                    self.userinfo_cache.set(user['openid'], user)
+                yield WeChatUser(self, user, is_upgrade=True)
+
+        if failed:
+            error = WegoApiError(u'Get userinfo of %s users failed(获取用户信息失败)' % len(failed))
+            error.openids = failed
+            raise error
+
+    def _get_ext_userinfo_data(self, openid):
+        """
+        Get user extra info from USERINFO_CACHE, fetch and cache it if missing.
+
+        :return: :dict: User data
+        """
+
+        data = self.userinfo_cache.get(openid) if self.userinfo_cache is not None else None
+        if data is None:
+            data = self.wechat.get_userinfo(openid)
+            if self.userinfo_cache is not None:
+                self.userinfo_cache.set(openid, data)
+
+        return dict(data)
+
+    def iter_follower_pages(self, next_openid=''):
+        """
+        Stream followers page by page, only one page is in memory.
+
+        :param next_openid: (optional) Resume after it.
+        :return: Generator of (openid list, next_openid).
+        """
+
+        while True:
+            data = self.wechat.get_followers(next_openid)
+            openids = data.get('data', {}).get('openid', []) if data.get('count') else []
+            if not openids:
+                return
+
+            next_openid = data.get('next_openid', '')
+            yield openids, next_openid
+            if not next_openid or len(openids) < 10000:
+                return
+
+    def iter_followers(self, next_openid=''):
+        """
+        Stream all followers.
+
+            for openid in w.iter_followers():
+                ...
+
+        :param next_openid: (optional) Resume after it.
+        :return: Generator of openid.
+        """
+
+        for openids, next_openid in self.iter_follower_pages(next_openid):
+            for openid in openids:
+                yield openid
 
     def verification_token(self, openid, access_token):
         """
@@ -506,6 +833,48 @@ class WegoApi(object):
 
         return md5.hexdigest().upper()
 
+    def check_pay_sign(self, data):
+        """
+        Check the sign of a wechat pay notification with MCH_SECRET.
+
+        :param data: :dict: All fields of the notification.
+        :return: :Bool
+        """
+
+        if not self.settings.MCH_SECRET or not data.get('sign'):
+            return False
+        sign = self.make_sign({k: v for k, v in data.items() if k != 'sign' and v != ''})
+        return hmac.compare_digest(sign, data['sign'])
+
+    def _parse_pay(self, raw_xml):
+        """
+        Parse a wechat pay notification, the sign is checked with MCH_SECRET.
+
+        :return: :class:`WeChatPay <wego.api.WeChatPay>` object, None if it is not a pay notification.
+        :raise: WegoApiError if the sign is wrong.
+        """
+
+        data = self.wechat._analysis_pay_xml(raw_xml)
+        if 'return_code' not in data:
+            return None
+        if not self.check_pay_sign(data):
+            raise WegoApiError(u'Invalid pay notification sign(支付通知签名错误)')
+        return WeChatPay(data)
+
+    def get_helper(self, request):
+        """
+        Make the HELPER of a request, helpers keep sessions in signed cookies get COOKIE_SECRET and COOKIE_MAX_AGE.
+
+        :return: Helper object.
+        """
+
+        from .helpers.official import SignedCookieHelper
+
+        helper_class = self.settings.HELPER
+        if issubclass(helper_class, SignedCookieHelper):
+            return helper_class(request, self.settings.COOKIE_SECRET, self.settings.COOKIE_MAX_AGE)
+        return helper_class(request)
+
     def create_group(self, name):
         """
         Create a new group.
@@ -514,17 +883,63 @@ class WegoApi(object):
         :return: :dict: {'id': 'int', 'name':'str'}
         """
 
-        return self.wechat.create_group(name)['group']
+        data = self.wechat.create_group(name)['group']
+        self._update_groups(lambda groups: groups.update({data['id']: {'name': data['name'], 'count': 0}}))
+        return data
 
-    def get_groups(self):
+    def get_groups(self, refresh=False):
         """
-        Get all groups.
+        Get all groups, the group table is cached GROUPS_EXPIRE seconds and updated by create_group,
+        change_group_name and del_group. Count of group is refreshed when cache expired.
 
+        :param refresh: (optional) Fetch from wechat whether cached or not.
         :return: :dict: {'your_group_id': {'name':'str', 'count':'int'}}
         """
 
-        data = self.wechat.get_all_groups()
-        return {i.pop('id'): i for i in data['groups']}
+        groups = self._load_groups(refresh)[0]
+        return {i: dict(j) for i, j in groups.items()}
+
+    def _load_groups(self, refresh=False):
+        """
+        Get the cached group table, fetch it if missing.
+
+        :return: :tuple: (groups, {name: group id})
+        """
+
+        cached = None if refresh else self.groups_cache.get('groups')
+        if cached is None:
+            data = self.wechat.get_all_groups()
+            cached = self._set_groups({i.pop('id'): i for i in data['groups']})
+        return cached
+
+    def _set_groups(self, groups, expires_at=None):
+        """
+        Cache the group table with a name index.
+
+        :param expires_at: (optional) Timestamp it expires, default is GROUPS_EXPIRE seconds later.
+        :return: :tuple: (groups, {name: group id})
+        """
+
+        index = {}
+        for i in sorted(groups):
+            index.setdefault(groups[i]['name'], i)
+
+        cached = (groups, index)
+        if self.settings.GROUPS_EXPIRE:
+            self.groups_cache.set('groups', cached, expires_at=expires_at)
+        return cached
+
+    def _update_groups(self, func):
+        """
+        Update cached group table in place by func(groups), and invalidate other processes.
+        """
+
+        cached = self.groups_cache.get('groups')
+        if cached is not None:
+            groups = {i: dict(j) for i, j in cached[0].items()}
+            func(groups)
+            self._set_groups(groups)
+        self.invalidation.publish('groups')
 
     def get_user_groups(self, openid):
         """
@@ -536,28 +951,24 @@ class WegoApi(object):
         data = self.wechat.get_user_groups(openid)
         return data
 
-    def _get_groupid(self, group):
+    def _get_groupid(self, group, error=WegoApiError):
         """
         Input group id or group name and return group id.
 
         :param group: Group name or group id.
+        :param error: (optional) Exception raised if without this group.
         :return: group id
         """
 
-        groups = self.get_groups()
+        groups, index = self._load_groups()
+
         if type(group) is int:
             groupid = int(group)
         else:
-            group = str(group)
-            for i in groups:
-                if groups[i]['name'] == group:
-                    groupid = i
-                    break
-            else:
-                raise WegoApiError(u'Without this group(没有这个群组)')
+            groupid = index.get(str(group))
 
         if groupid not in groups:
-            raise WegoApiError(u'Without this group(没有这个群组)')
+            raise error(u'Without this group(没有这个群组)')
 
         return groupid
 
@@ -572,18 +983,25 @@ class WegoApi(object):
 
         groupid = self._get_groupid(group)
         data = self.wechat.change_group_name(groupid, name)
+        if not data['errcode']:
+            self._update_groups(lambda groups: groups[groupid].update({'name': name}))
         return not data['errcode']
 
     def change_user_group(self, openid, group):
         """
-        Change user group.
+        Change user group, with WRITE_BEHIND it is queued and returns True at once.
 
         :param group: Group id or group name.
         :return: :Bool .
         """
 
         groupid = self._get_groupid(group)
+        if self.write_behind is not None:
+            self.write_behind.change_user_group(openid, groupid)
+            return True
+
         data = self.wechat.change_user_group(openid, groupid)
+        self.invalidation.invalidate('user', openid)
         return not data['errcode']
 
     def del_group(self, group):
@@ -596,8 +1014,208 @@ class WegoApi(object):
 
         groupid = self._get_groupid(group)
         data = self.wechat.del_group(groupid)
+        if not data['errcode']:
+            self._update_groups(lambda groups: groups.pop(groupid, None))
+        # Users of the deleted group are moved to the default group
+        self.invalidation.invalidate('user')
         return not data['errcode']
 
+    def create_tag(self, name):
+        """
+        Create a new tag.
+
+        :param name: Tag name.
+        :return: :dict: {'id': 'int', 'name':'str'}
+        """
+
+        data = self.wechat.create_tag(name)
+        if 'tag' not in data:
+            raise WegoApiError(u'Create tag failed(创建标签失败): %s' % data.get('errmsg'))
+        return data['tag']
+
+    def get_tags(self):
+        """
+        Get all tags.
+
+        :return: :dict: {'your_tag_id': {'name':'str', 'count':'int'}}
+        """
+
+        data = self.wechat.get_all_tags()
+        return {i.pop('id'): i for i in data['tags']}
+
+    def change_tag_name(self, tagid, name):
+        """
+        Change tag name.
+
+        :return: :Bool
+        """
+
+        data = self.wechat.change_tag_name(tagid, name)
+        return not data['errcode']
+
+    def del_tag(self, tagid):
+        """
+        Delete tag.
+
+        :return: :Bool
+        """
+
+        data = self.wechat.del_tag(tagid)
+        if not data['errcode']:
+            if self.tag_index is not None:
+                self.tag_index.drop(tagid)
+            self.invalidation.invalidate('user')
+        return not data['errcode']
+
+    def iter_tag_users(self, tagid, next_openid=''):
+        """
+        Stream users with the tag.
+
+        :param tagid: Tag id.
+        :param next_openid: (optional) Resume after it.
+        :return: Generator of openid.
+        """
+
+        while True:
+            data = self.wechat.get_tag_users(tagid, next_openid)
+            openids = data.get('data', {}).get('openid', []) if data.get('count') else []
+            for openid in openids:
+                yield openid
+
+            next_openid = data.get('next_openid', '')
+            if not next_openid or len(openids) < 10000:
+                return
+
+    def get_user_tags(self, openid):
+        """
+        Get tag ids of a user.
+
+        :return: :list
+        """
+
+        data = self.wechat.get_user_tags(openid)
+        return data.get('tagid_list', [])
+
+    def tag_users(self, openids, tagid, workers=4, rate=20):
+        """
+        Tag many users, 50 users per call, with WRITE_BEHIND they are queued.
+
+        :param openids: Any iterable of openid.
+        :param tagid: Tag id.
+        :return: :Bool
+        """
+
+        return self._batch_tagging(openids, tagid, True, workers, rate)
+
+    def untag_users(self, openids, tagid, workers=4, rate=20):
+        """
+        Untag many users, 50 users per call, with WRITE_BEHIND they are queued.
+
+        :param openids: Any iterable of openid.
+        :param tagid: Tag id.
+        :return: :Bool
+        """
+
+        return self._batch_tagging(openids, tagid, False, workers, rate)
+
+    def _batch_tagging(self, openids, tagid, tagging, workers, rate):
+
+        # The queue updates tag_index and caches when the writes reach wechat
+        if self.write_behind is not None:
+            for openid in openids:
+                if tagging:
+                    self.write_behind.tag_user(openid, tagid)
+                else:
+                    self.write_behind.untag_user(openid, tagid)
+            return True
+
+        func = self.wechat.batch_tagging if tagging else self.wechat.batch_untagging
+        done, failed = self._run_openid_batches(lambda chunk: func(chunk, tagid), openids, 50, workers, rate)
+        self.invalidation.invalidate_many('user', (openid for chunk in done for openid in chunk))
+
+        if self.tag_index is not None:
+            for chunk in done:
+                if tagging:
+                    self.tag_index.add(tagid, chunk)
+                else:
+                    self.tag_index.remove(tagid, chunk)
+
+        if failed:
+            error = WegoApiError(u'Tagging %s users failed(批量打标签失败)' % len(failed))
+            error.openids = failed
+            raise error
+        return True
+
+    def _run_openid_batches(self, func, openids, size, workers, rate):
+        """
+        Call func(chunk) for chunks of openids concurrently under the rate limit, failed chunks are retried.
+
+        :return: :tuple: (succeed chunks, failed openids)
+        """
+
+        limiter = RateLimiter(rate) if rate else None
+        done, failed = [], []
+        for chunk, data, error in run_batches(func, chunked(openids, size), workers, rate_limiter=limiter):
+            if error is None:
+                done.append(chunk)
+            else:
+                self.settings.LOGGER.error(u'Batch call failed: %s' % error)
+                failed.extend(chunk)
+
+        return done, failed
+
+    def iter_blacklist(self, begin_openid=''):
+        """
+        Stream the blacklist page by page.
+
+        :param begin_openid: (optional) Resume after it.
+        :return: Generator of openid.
+        """
+
+        while True:
+            data = self.wechat.get_blacklist(begin_openid)
+            openids = data.get('data', {}).get('openid', []) if data.get('count') else []
+            for openid in openids:
+                yield openid
+
+            begin_openid = data.get('next_openid', '')
+            if not begin_openid or len(openids) < 10000:
+                return
+
+    def block_users(self, openids, workers=2, rate=10):
+        """
+        Add users to blacklist, 20 users per call.
+
+        :param openids: Any iterable of openid.
+        :param workers: (optional) Calls in flight.
+        :param rate: (optional) Max calls per second.
+        :return: :Bool
+        """
+
+        done, failed = self._run_openid_batches(self.wechat.batch_blacklist, openids, 20, workers, rate)
+        if failed:
+            error = WegoApiError(u'Block %s users failed(拉黑用户失败)' % len(failed))
+            error.openids = failed
+            raise error
+        return True
+
+    def unblock_users(self, openids, workers=2, rate=10):
+        """
+        Remove users from blacklist, 20 users per call.
+
+        :param openids: Any iterable of openid.
+        :param workers: (optional) Calls in flight.
+        :param rate: (optional) Max calls per second.
+        :return: :Bool
+        """
+
+        done, failed = self._run_openid_batches(self.wechat.batch_unblacklist, openids, 20, workers, rate)
+        if failed:
+            error = WegoApiError(u'Unblock %s users failed(取消拉黑用户失败)' % len(failed))
+            error.openids = failed
+            raise error
+        return True
+
     def create_menu(self, *args, **kwargs):
         """
         Create menu by wego.button
@@ -614,6 +1232,7 @@ class WegoApi(object):
             data = self.wechat.create_conditional_menu(data)
         else:
             data = self.wechat.create_menu(data)
+        self.invalidation.invalidate('menu')
 
         return not data['errcode'] if 'errcode' in data else data['menuid']
 
@@ -626,6 +1245,7 @@ class WegoApi(object):
 
     def del_menu(self, target='all'):
 
+        self.invalidation.invalidate('menu')
         if target == 'all':
             return not self.wechat.del_all_menus()['errcode']
 
@@ -679,37 +1299,122 @@ class WegoApi(object):
         :param raw_xml: Raw xml.
         :return: :class:`WeChatPush <wego.api.WeChatPush>` object.
         :rtype: WeChatPush.
+        :raise: WegoApiError if the sign of a pay notification is wrong.
         """
 
-        helper = self.settings.HELPER(request)
+        helper = self.get_helper(request)
         raw_xml = helper.get_body()
 
-        if raw_xml.find('return_code') != -1:
-            # TODO 通知验证
-            data = self.wechat._analysis_xml(raw_xml)
-            return WeChatPay(data)
-
-        crypto = None
-        nonce = None
-
-        if self.settings.PUSH_TOKEN:
-            if not hasattr(self, 'push_crypto'):
-                from .lib.WEGOBizMsgCrypt import WXBizMsgCrypt
-                self.push_crypto = WXBizMsgCrypt(
-                    self.settings.PUSH_TOKEN,
-                    self.settings.PUSH_ENCODING_AES_KEY,
-                    self.settings.APP_ID
-                )
-
-            crypto = self.push_crypto
-            msg_sign = helper.get_params()['msg_signature']
-            timestamp = helper.get_params()['timestamp']
-            nonce = helper.get_params()['nonce']
-            ret, raw_xml = self.push_crypto.DecryptMsg(raw_xml, msg_sign, timestamp, nonce)
+        pay = self._parse_pay(raw_xml)
+        if pay is not None:
+            return pay
+
+        raw_xml, nonce = self._decrypt_push(raw_xml, helper.get_params())
+
+        return self._build_push(raw_xml, nonce)
+
+    def check_push_signature(self, params):
+        """
+        Check the signature wechat signs push and server verification requests with PUSH_TOKEN.
+
+        :param params: Query params, contain signature, timestamp and nonce.
+        :return: :Bool
+        """
+
+        if not self.settings.PUSH_TOKEN:
+            return True
+
+        items = sorted([self.settings.PUSH_TOKEN, params.get('timestamp', ''), params.get('nonce', '')])
+        signature = hashlib.sha1(''.join(items).encode('utf-8')).hexdigest()
+        given = params.get('signature') or ''
+        if not isinstance(given, bytes):
+            given = given.encode('utf-8')
+        return hmac.compare_digest(signature.encode('utf-8'), given)
+
+    def _get_push_crypto(self):
+
+        if not hasattr(self, 'push_crypto'):
+            from .lib.WEGOBizMsgCrypt import WXBizMsgCrypt
+            self.push_crypto = WXBizMsgCrypt(
+                self.settings.PUSH_TOKEN,
+                self.settings.PUSH_ENCODING_AES_KEY,
+                self.settings.APP_ID
+            )
+        return self.push_crypto
 
+    def _decrypt_push(self, raw_xml, params):
+        """
+        Decrypt push xml if PUSH_TOKEN is set, it is CPU bound.
+
+        :param params: Query params of the push.
+        :return: :tuple: (raw xml, nonce)
+        """
+
+        if not self.settings.PUSH_TOKEN:
+            return raw_xml, None
+
+        self._get_push_crypto()
+
+        nonce = params['nonce']
+        ret, raw_xml = self.push_crypto.DecryptMsg(raw_xml, params['msg_signature'], params['timestamp'], nonce)
+        if ret != 0:
+            raise WegoApiError(u'Decrypt push failed: %s(推送消息解密失败)' % ret)
+        return raw_xml, nonce
+
+    def _build_push(self, raw_xml, nonce=None):
+        """
+        Parse decrypted push xml and call push listeners.
+
+        :return: :class:`WeChatPush <wego.api.WeChatPush>` object.
+        """
+
+        push = self._parse_push(raw_xml, nonce)
+        self._notify_push(push)
+        return push
+
+    def _parse_push(self, raw_xml, nonce=None):
+
+        crypto = self.push_crypto if self.settings.PUSH_TOKEN else None
         data = self.wechat._analysis_xml(raw_xml)
+        return WeChatPush(data, crypto, nonce, self.conversations)
+
+    def _notify_push(self, push):
+        """
+        Invalidate caches the push changes and call push listeners, they may block on IO.
+        """
+
+        self.invalidation.on_push(push)
+        for listener in self.push_listeners:
+            # A faulty listener must not break push handling
+            try:
+                listener(push)
+            except Exception:
+                self.settings.LOGGER.exception(u'Push listener %r failed(推送监听函数出错)' % listener)
+
+    @property
+    def aio(self):
+        """
+        Asyncio mode of this WegoApi, such as Tornado coroutine handlers, Python 3.5+.
+
+        :return: :class:`AsyncWegoApi <wego.aio.AsyncWegoApi>` object
+        """
 
-        return WeChatPush(data, crypto, nonce)
+        if not hasattr(self, '_aio'):
+            from .aio import AsyncWegoApi
+            self._aio = AsyncWegoApi(self)
+        return self._aio
+
+    def add_push_listener(self, listener):
+        """
+        Add a function called with every :class:`WeChatPush <wego.api.WeChatPush>` analysis_push returns,
+        such as :meth:`PushStats.feed <wego.stats.PushStats.feed>`.
+
+        :param listener: A function receive a WeChatPush object.
+        :return: listener
+        """
+
+        self.push_listeners.append(listener)
+        return listener
 
     def add_temporary_material(self, **kwargs):
 
@@ -723,6 +1428,19 @@ class WegoApi(object):
 
         return data
 
+    def get_media_path(self, media_id):
+        """
+        Get local path of a media prefetched by MEDIA_PREFETCH_PATH.
+
+        :param media_id: MediaId of image, voice, video or shortvideo push.
+        :return: Path or None if it has not been downloaded.
+        """
+
+        if not hasattr(self, 'media_prefetcher'):
+            raise WegoApiError(u'MEDIA_PREFETCH_PATH is not set(没有设置 MEDIA_PREFETCH_PATH)')
+
+        return self.media_prefetcher.path(media_id)
+
     def add_permanent_material(self, articles):
 
         data = self.wechat.add_permanent_material(articles)
@@ -975,11 +1693,12 @@ class WeChatPush(object):
     """
     """
 
-    def __init__(self, data, crypto=None, nonce=None):
+    def __init__(self, data, crypto=None, nonce=None, conversations=None):
 
         self.data = data
         self.crypto = crypto
         self.nonce = nonce
+        self.conversations = conversations
 
         if data['MsgType'] == 'event':
             if data['Event'] == 'subscribe' and 'Ticket' in data:
@@ -1013,6 +1732,41 @@ class WeChatPush(object):
             return self.data[key]
         return ''
 
+    @property
+    def state(self):
+        """
+        Conversation state of the user, need CONVERSATION_STORE.
+
+        :return: :dict
+        """
+
+        return self._get_conversations().get(self.from_user, {})
+
+    def set_state(self, state):
+
+        self._get_conversations().set(self.from_user, state)
+
+    def update_state(self, func=None, **fields):
+        """
+        Atomically update conversation state by func(state) or set fields.
+
+        :return: :dict: New state.
+        """
+
+        if func is None:
+            return self._get_conversations().merge(self.from_user, **fields)
+        return self._get_conversations().update(self.from_user, func)
+
+    def end_conversation(self):
+
+        self._get_conversations().delete(self.from_user)
+
+    def _get_conversations(self):
+
+        if self.conversations is None:
+            raise WegoApiError(u'CONVERSATION_STORE is not set(没有设置 CONVERSATION_STORE)')
+        return self.conversations
+
     def reply_text(self, text):
 
         return self.return_xml({
@@ -1090,58 +1844,120 @@ class WeChatPush(object):
         })
 
 
+# Fields only /cgi-bin/user/info returns, reading any of them upgrades the user
+EXT_FIELDS = ('subscribe', 'language', 'remark', 'groupid', 'subscribe_time', 'tagid_list',
+              'subscribe_scene', 'qr_scene', 'qr_scene_str')
+
+# Field codes of compact form, append only
+_USER_FIELDS = PROFILE_FIELDS + EXT_FIELDS + ('group', )
+_USER_FIELD_CODES = {j: i for i, j in enumerate(_USER_FIELDS)}
+_USER_FORMAT_VERSION = 1
+
+
+def _get_user_field(user, key, ext=False):
+    """
+    Read a user field, ext field upgrades the user when it is missing.
+    """
+
+    data = user._data
+    if key not in data:
+        if user._raw is not None:
+            data = user.data
+        if ext and key not in data and not user.is_upgrade:
+            data = user.get_ext_userinfo()
+    return data.get(key, '')
+
+
 class WeChatUser(object):
     """
     A lazy and smart wechat user object. You can set user remark, group, groupid direct,
     because of group name can be repeated, so if you set the group by group name, it may not be accurate.
+
+    A user restored by :meth:`loads` decodes its fields at the first access of a field other than openid.
+    Other attributes can be set on it as before, setting a profile field only changes this object.
+    Its own attributes live in slots, the instance dict is only allocated once another attribute is set.
     """
 
-    def __init__(self, wego, data):
+    __slots__ = ('wego', 'is_upgrade', '_data', '_raw', '__dict__')
+
+    def __init__(self, wego, data, is_upgrade=False):
 
         self.wego = wego
-        self.data = data
-        self.is_upgrade = False
+        self.is_upgrade = is_upgrade
+        self._data = data
+        self._raw = None
+
+    @property
+    def data(self):
+        """
+        :return: :dict: User data
+        """
+
+        if self._raw is not None:
+            raw, self._raw = self._raw, None
+            self._data = dict(self._unpack_fields(raw), **self._data)
+        return self._data
+
+    @data.setter
+    def data(self, value):
+
+        self._data = value
+        self._raw = None
 
     def __getattr__(self, key):
 
-        ext_userinfo = ['subscribe', 'language', 'remark', 'groupid']
-        if key in ext_userinfo and not self.is_upgrade:
-            self.get_ext_userinfo()
+        if key.startswith('_'):
+            raise AttributeError(key)
+        return self.data.get(key, '')
 
-        if key == 'group' and key not in self.data:
-            self.data['group'] = self.wego.get_groups()[self.groupid]
+    @property
+    def remark(self):
 
-        if key in self.data:
-            return self.data[key]
-        return ''
+        return _get_user_field(self, 'remark', True)
 
-    def __setattr__(self, key, value):
+    @remark.setter
+    def remark(self, value):
 
-        if key == 'remark':
-            if self.subscribe != 1:
-                raise WeChatUserError('The user does not subscribe you')
-
-            if self.data['remark'] != value:
-                self.wego.wechat.set_user_remark(self.data['openid'], value)
-                self.data[key] = value
-
-        if key in ['group', 'groupid']:
-            groups = self.wego.get_groups()
-            if key == 'group':
-                for i in groups:
-                    if groups[i]['name'] == value:
-                        value = i
-                        break
-                else:
-                    raise WeChatUserError(u'Without this group(没有这个群组)')
+        if self.subscribe != 1:
+            raise WeChatUserError('The user does not subscribe you')
+
+        if self.data['remark'] != value:
+            if self.wego.write_behind is not None:
+                self.wego.write_behind.set_remark(self.openid, value)
+            else:
+                self.wego.wechat.set_user_remark(self.openid, value)
+                self.wego.invalidation.invalidate('user', self.openid)
+            self.data['remark'] = value
+
+    @property
+    def groupid(self):
 
-            groupid = value
-            if groupid not in groups:
-                raise WeChatUserError(u'Without this group(没有这个群组)')
+        return _get_user_field(self, 'groupid', True)
 
-            self.wego.change_user_group(self.data['openid'], groupid)
+    @groupid.setter
+    def groupid(self, value):
 
-        super(WeChatUser, self).__setattr__(key, value)
+        # Only group id, a group name is set by group
+        if type(value) is not int:
+            raise WeChatUserError(u'Without this group(没有这个群组)')
+        groupid = self.wego._get_groupid(value, WeChatUserError)
+
+        self.wego.change_user_group(self.openid, groupid)
+        self.data['groupid'] = groupid
+        self.data.pop('group', None)
+
+    @property
+    def group(self):
+
+        data = self.data
+        if 'group' not in data:
+            data['group'] = self.wego.get_groups()[self.groupid]
+        return data['group']
+
+    @group.setter
+    def group(self, value):
+
+        self.groupid = self.wego._get_groupid(str(value), WeChatUserError)
 
     def get_ext_userinfo(self):
         """
@@ -1150,15 +1966,159 @@ class WeChatUser(object):
         :return: :dict: User data
         """
 
-        self.data['remark'] = ''
-        self.data['groupid'] = ''
-
-        data = self.wego.wechat.get_userinfo(self.data['openid'])
-        self.data = dict(self.data, **data)
+        data = dict(self.data, remark='', groupid='')
+        data.update(self.wego._get_ext_userinfo_data(self.openid))
+        self.data = data
         self.is_upgrade = True
 
         return self.data
 
+    def dumps(self):
+        """
+        Serialize the user into compact bytes, openid and expires_at can be read back without decoding the others.
+
+        :return: :bytes
+        """
+
+        data = self.data
+        buf = bytearray(struct.pack('>BBd', _USER_FORMAT_VERSION, int(bool(self.is_upgrade)),
+                                    data.get('expires_at') or 0))
+        pack_bytes(buf, data.get('openid', '').encode('utf-8'))
+
+        for key, value in data.items():
+            if key in ('openid', 'expires_at'):
+                continue
+
+            code = _USER_FIELD_CODES.get(key)
+            if code is None:
+                buf.append(0xff)
+                pack_bytes(buf, key.encode('utf-8'))
+            else:
+                buf.append(code)
+
+            if isinstance(value, int) and not isinstance(value, bool) and value >= 0:
+                buf.append(0)
+                pack_varint(buf, value)
+            elif isinstance(value, string_types):
+                buf.append(1)
+                pack_bytes(buf, value.encode('utf-8'))
+            else:
+                buf.append(2)
+                pack_bytes(buf, json.dumps(value, separators=(',', ':')).encode('utf-8'))
+
+        return bytes(buf)
+
+    @classmethod
+    def loads(cls, wego, payload):
+        """
+        Restore a user serialized by :meth:`dumps`, JSON of user data is also accepted.
+
+        :param wego: :class:`WegoApi <wego.api.WegoApi>` object.
+        :param payload: :bytes
+        :return: :class:`WeChatUser <wego.api.WeChatUser>` object
+        """
+
+        if payload[:1] in (b'{', u'{'):
+            if isinstance(payload, bytes):
+                payload = payload.decode('utf-8')
+            return cls(wego, json.loads(payload))
+
+        buf = bytearray(payload)
+        version, flags, expires_at = struct.unpack_from('>BBd', bytes(buf[:10]))
+        if version != _USER_FORMAT_VERSION:
+            raise ValueError('Unknown user format version: %s' % version)
+
+        openid, pos = unpack_bytes(buf, 10)
+        user = cls(wego, {'openid': openid.decode('utf-8')}, bool(flags & 1))
+        if expires_at:
+            user._data['expires_at'] = expires_at
+        user._raw = buf[pos:]
+        return user
+
+    @staticmethod
+    def _unpack_fields(buf):
+
+        data = {}
+        pos = 0
+        while pos < len(buf):
+            code = buf[pos]
+            pos += 1
+            if code == 0xff:
+                key, pos = unpack_bytes(buf, pos)
+                key = key.decode('utf-8')
+            else:
+                key = _USER_FIELDS[code]
+
+            kind = buf[pos]
+            pos += 1
+            if kind == 0:
+                data[key], pos = unpack_varint(buf, pos)
+            else:
+                value, pos = unpack_bytes(buf, pos)
+                value = value.decode('utf-8')
+                data[key] = value if kind == 1 else json.loads(value)
+
+        return data
+
+
+def _set_user_field(user, key, value):
+
+    user.data[key] = value
+
+
+# Plain fields are properties, so reading them skips __getattr__
+for _key in PROFILE_FIELDS + EXT_FIELDS:
+    if _key not in WeChatUser.__dict__:
+        setattr(WeChatUser, _key, property(lambda self, key=_key, ext=_key in EXT_FIELDS:
+                                           _get_user_field(self, key, ext),
+                                           lambda self, value, key=_key: _set_user_field(self, key, value)))
+del _key
+
+
+class LazyWeChatUser(object):
+    """
+    request.wx_user of a snsapi_base login, it gets the :class:`WeChatUser <wego.api.WeChatUser>` at the first
+    access of a field other than openid. If the profile is not in session or cache and the user does not
+    subscribe you, it raises :class:`UpgradeRequired <wego.exceptions.UpgradeRequired>`, which login_required
+    turns into a snsapi_userinfo authorization redirect.
+
+    The redirect is decided when the exception leaves the function, so work the function did before reading the
+    profile runs again after the user authorized, and a function catching WeChatUserError or rendering later
+    (such as Django TemplateResponse) gets no redirect. Read the profile first, or use
+    login_required(scope='snsapi_base', profile=True).
+    """
+
+    __slots__ = ('wego', 'record', 'openid', '_user')
+
+    def __init__(self, wego, record, openid):
+
+        self.wego = wego
+        self.record = record
+        self.openid = openid
+        self._user = None
+
+    def resolve(self):
+        """
+        :return: :class:`WeChatUser <wego.api.WeChatUser>` object
+        """
+
+        if self._user is None:
+            self._user = self.wego._get_lazy_userinfo(self.record, self.openid)
+        return self._user
+
+    def __getattr__(self, key):
+
+        if key.startswith('_'):
+            raise AttributeError(key)
+        return getattr(self.resolve(), key)
+
+    def __setattr__(self, key, value):
+
+        if key in LazyWeChatUser.__slots__:
+            super(LazyWeChatUser, self).__setattr__(key, value)
+        else:
+            setattr(self.resolve(), key, value)
+
 
 # TODO 更方便定制
 def official_get_global_access_token(self):
@@ -1169,6 +2129,17 @@ def official_get_global_access_token(self):
     :return: :str: Global access token
     """
 
+    # Shared by accounts of a registry, keyed by APP_ID
+    store = self.settings.data.get('TOKEN_STORE')
+    if store is not None:
+        key = 'wego:token:' + self.settings.APP_ID
+        access_token = store.get(key)
+        if access_token is None:
+            data = self.get_global_access_token()
+            access_token = data['access_token']
+            store.set(key, access_token, data['expires_in'] - 180)
+        return access_token
+
     if not self.global_access_token or self.global_access_token['expires_at'] <= int(time.time()):
         self.global_access_token = self.get_global_access_token()
         self.global_access_token['expires_at'] = self.global_access_token['expires_in'] + int(time.time()) - 180
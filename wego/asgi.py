@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+
+"""
+wego.asgi
+
+ASGI support for asyncio frameworks, Python 3.5+. The push endpoint is a ready-made ASGI app, signature check,
+parse, listeners and reply all run on the event loop, decryption can run in a pool:
+
+    async def on_push(push):
+        if push.type == 'text':
+            return push.reply_text('hi')
+
+    app = PushApp(w, on_push, executor=ThreadPoolExecutor(4))
+
+OAuth pages use ASGIHelper with :attr:`WegoApi.aio <wego.api.WegoApi.aio>`, any request object has scope and
+a coroutine body() works, such as starlette.requests.Request or :class:`ASGIRequest <wego.asgi.ASGIRequest>`:
+
+    w = wego.init(..., HELPER='wego.asgi.ASGIHelper')
+
+    @w.aio.login_required
+    async def index(request):
+        return request.wego_helper.response(request.wx_user.nickname)
+"""
+
+from .helpers.official import SignedCookieHelper
+from .exceptions import WegoApiError
+from .aio import AsyncWegoApi
+from urllib.parse import parse_qs
+import inspect
+
+
+class Response(object):
+    """
+    A minimal ASGI http response app.
+
+    :param body: :str or :bytes
+    :param status: (optional) Status code.
+    :param headers: (optional) List of (name, value) str.
+    :param content_type: (optional) Content-Type.
+    """
+
+    def __init__(self, body=b'', status=200, headers=None, content_type='text/html; charset=utf-8'):
+
+        self.body = body.encode('utf-8') if isinstance(body, str) else body
+        self.status = status
+        self.headers = [('Content-Type', content_type)] + list(headers or [])
+
+    async def __call__(self, scope, receive, send):
+
+        await send({
+            'type': 'http.response.start',
+            'status': self.status,
+            'headers': [(i.lower().encode('latin-1'), j.encode('latin-1')) for i, j in self.headers]
+        })
+        await send({'type': 'http.response.body', 'body': self.body})
+
+
+class ASGIRequest(object):
+    """
+    Request of an ASGI http scope.
+
+    :param scope: ASGI scope.
+    :param receive: ASGI receive.
+    """
+
+    def __init__(self, scope, receive):
+
+        self.scope = scope
+        self.receive = receive
+        self._body = None
+
+    async def body(self):
+        """
+        :return: :bytes: The whole request body.
+        """
+
+        if self._body is None:
+            chunks = []
+            while True:
+                message = await self.receive()
+                chunks.append(message.get('body', b''))
+                if not message.get('more_body'):
+                    break
+            self._body = b''.join(chunks)
+        return self._body
+
+
+class ASGIHelper(SignedCookieHelper):
+    """
+    Helper of ASGI requests, sessions are kept in HMAC signed cookies, the key is COOKIE_SECRET, the request
+    cookie_secret attribute or scope['wego.cookie_secret'] overrides it.
+    Responses made by :meth:`response` and :meth:`redirect` send the cookies.
+
+    :param request: Request has scope and a coroutine body().
+    :param secret: (optional) Key signs cookies, :meth:`WegoApi.get_helper <wego.api.WegoApi.get_helper>`
+            gives COOKIE_SECRET.
+    :param max_age: (optional) Seconds a cookie is valid.
+    :raise: HelperError if there is no key.
+    """
+
+    def __init__(self, request, secret=None, max_age=2592000):
+        scope = request.scope
+        secret = getattr(request, 'cookie_secret', None) or scope.get('wego.cookie_secret') or secret
+        super(ASGIHelper, self).__init__(secret, max_age)
+        self.request = request
+        self.scope = scope
+        request.wego_helper = self
+
+    def get_current_path(self):
+        path = self.scope.get('root_path', '') + self.scope.get('path', '/')
+        if self.scope.get('query_string'):
+            path += '?' + self.scope['query_string'].decode('latin-1')
+        return path
+
+    def get_params(self):
+        query = self.scope.get('query_string', b'').decode('latin-1')
+        return {i: j[-1] for i, j in parse_qs(query).items()}
+
+    def get_body(self):
+        return self.request.body()
+
+    def get_cookie_header(self):
+        return '; '.join(j.decode('latin-1') for i, j in self.scope.get('headers', []) if i.lower() == b'cookie')
+
+    def response(self, body=b'', status=200, headers=None, content_type='text/html; charset=utf-8'):
+        """
+        :return: :class:`Response <wego.asgi.Response>` with session cookies.
+        """
+
+        return Response(body, status, list(headers or []) + self.cookies, content_type)
+
+    def redirect(self, url):
+        return self.response(status=302, headers=[('Location', url)])
+
+
+class PushApp(object):
+    """
+    ASGI app of the push endpoint. It answers wechat server verification, checks signature with PUSH_TOKEN,
+    parses pushes and replies what handler returns, 'success' if nothing.
+
+    :param wego: :class:`WegoApi <wego.api.WegoApi>` object.
+    :param handler: Function or coroutine function receives a WeChatPush (or WeChatPay), returns reply xml or None.
+    :param executor: (optional) concurrent.futures executor push decryption runs in, default runs it on the loop.
+    """
+
+    def __init__(self, wego, handler, executor=None):
+
+        self.wego = wego
+        self.handler = handler
+        self.aio = AsyncWegoApi(wego, executor=executor)
+
+    async def __call__(self, scope, receive, send):
+
+        if scope['type'] == 'lifespan':
+            while True:
+                message = await receive()
+                await send({'type': message['type'] + '.complete'})
+                if message['type'] == 'lifespan.shutdown':
+                    return
+
+        response = await self.respond(ASGIRequest(scope, receive))
+        await response(scope, receive, send)
+
+    async def respond(self, request):
+        """
+        :param request: :class:`ASGIRequest <wego.asgi.ASGIRequest>` object.
+        :return: :class:`Response <wego.asgi.Response>` object.
+        """
+
+        params = {i: j[-1] for i, j in parse_qs(request.scope.get('query_string', b'').decode('latin-1')).items()}
+
+        if request.scope.get('method') == 'GET':
+            if not self.wego.check_push_signature(params):
+                return Response('Invalid signature', 403)
+            return Response(params.get('echostr', ''), content_type='text/plain')
+
+        body = await request.body()
+        try:
+            # Pay notifications are signed by MCH_SECRET, not PUSH_TOKEN
+            push = self.wego._parse_pay(body)
+            if push is None:
+                if not self.wego.check_push_signature(params):
+                    return Response('Invalid signature', 403)
+                push = await self.aio.parse_push(body, params)
+        except WegoApiError:
+            return Response('Invalid push', 403)
+        except (ValueError, KeyError, TypeError):
+            # Not utf-8, not xml, or fields are missing
+            return Response('Malformed push', 400)
+
+        reply = self.handler(push)
+        if inspect.isawaitable(reply):
+            reply = await reply
+
+        return Response(reply or 'success', content_type='application/xml')
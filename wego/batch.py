@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+
+"""
+wego.batch
+
+Helpers for calling wechat batch apis: chunk an iterable, run chunks concurrently in bounded threads
+and under a rate limit, retry failed chunks.
+"""
+
+import itertools
+import threading
+import time
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+
+def chunked(iterable, size):
+    """
+    Split any iterable into lists of at most size items, lazily.
+
+    :param iterable: Iterable.
+    :param size: Chunk size.
+    :return: Generator of lists.
+    """
+
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class RateLimiter(object):
+    """
+    Thread safe token bucket.
+
+    :param rate: Calls per second.
+    :param burst: (optional) Max calls at once, default is rate.
+    """
+
+    def __init__(self, rate, burst=None):
+
+        self.rate = float(rate)
+        self.burst = burst or max(1, int(rate))
+        self.tokens = self.burst
+        self.updated_at = time.time()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        """
+        Block until a call is allowed.
+
+        :return: None
+        """
+
+        while True:
+            with self.lock:
+                now = time.time()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+
+
+def run_batches(func, chunks, workers=4, retries=2, backoff=0.5, rate_limiter=None):
+    """
+    Call func(chunk) for every chunk in threads, at most workers chunks are in flight,
+    so chunks can be a generator of any length.
+
+    :param func: A function receive a chunk.
+    :param chunks: Iterable of chunks.
+    :param workers: (optional) Number of threads.
+    :param retries: (optional) Retry times of a failed chunk.
+    :param backoff: (optional) Seconds waiting before first retry, doubled every retry.
+    :param rate_limiter: (optional) :class:`RateLimiter <wego.batch.RateLimiter>` object, every call waits it.
+    :return: Generator of (chunk, result, exception) in completion order, exception is None if succeed.
+    :raise: The exception iterating chunks raises, after the chunks before it are yielded.
+    """
+
+    tasks = queue.Queue(workers)
+    results = queue.Queue()
+    stop = threading.Event()
+    done = object()
+    error = []
+
+    def put(q, item):
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for chunk in chunks:
+                if not put(tasks, chunk):
+                    return
+        except Exception as e:
+            error.append(e)
+        for i in range(workers):
+            put(tasks, done)
+
+    def work():
+        while not stop.is_set():
+            try:
+                chunk = tasks.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if chunk is done:
+                break
+
+            for i in range(retries + 1):
+                try:
+                    if rate_limiter is not None:
+                        rate_limiter.wait()
+                    results.put((chunk, func(chunk), None))
+                    break
+                except Exception as e:
+                    if i == retries or stop.is_set():
+                        results.put((chunk, None, e))
+                        break
+                    time.sleep(backoff * 2 ** i)
+        results.put(done)
+
+    threads = [threading.Thread(target=produce)] + [threading.Thread(target=work) for i in range(workers)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+
+    try:
+        running = workers
+        while running:
+            item = results.get()
+            if item is done:
+                running -= 1
+            else:
+                yield item
+    finally:
+        stop.set()
+
+    if error:
+        raise error[0]
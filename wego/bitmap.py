@@ -0,0 +1,282 @@
+# -*- coding: utf-8 -*-
+
+"""
+wego.bitmap
+
+Local tag index for audience segmentation. Every openid gets a dense number, every tag is a bitmap over those
+numbers, so set algebra over millions of users is a few big integer operations (milliseconds).
+
+    index = w.tag_index
+    index.rebuild(w)
+    audience = (index.tag(vip) - index.tag(blocked)) & index.bitmap(sync.snapshot())
+    for openid in index.openids(audience):
+        ...
+"""
+
+import threading
+import binascii
+import zlib
+import json
+import os
+
+
+def _from_bytes(data):
+
+    if hasattr(int, 'from_bytes'):
+        return int.from_bytes(bytes(data), 'little')
+    return int(binascii.hexlify(bytes(bytearray(reversed(data)))) or '0', 16)
+
+
+def _to_bytes(value):
+
+    length = (value.bit_length() + 7) // 8
+    if hasattr(value, 'to_bytes'):
+        return value.to_bytes(length, 'little')
+    return bytes(bytearray(reversed(bytearray(binascii.unhexlify('%0*x' % (length * 2, value))))))
+
+
+class Bitmap(object):
+    """
+    Immutable set of dense user numbers, backed by a python int.
+
+    :param value: (optional) The int, bit n set means number n is in.
+    """
+
+    __slots__ = ('value', )
+
+    def __init__(self, value=0):
+
+        self.value = value
+
+    @classmethod
+    def from_numbers(cls, numbers):
+        """
+        Build from numbers in any order.
+
+        :param numbers: Iterable of int.
+        :return: :class:`Bitmap <wego.bitmap.Bitmap>` object.
+        """
+
+        data = bytearray()
+        for i in numbers:
+            byte = i >> 3
+            if byte >= len(data):
+                data.extend(b'\0' * (byte - len(data) + 1))
+            data[byte] |= 1 << (i & 7)
+        return cls(_from_bytes(data))
+
+    def numbers(self):
+        """
+        :return: Generator of numbers in order.
+        """
+
+        for byte, bits in enumerate(bytearray(_to_bytes(self.value))):
+            while bits:
+                low = bits & -bits
+                yield (byte << 3) + low.bit_length() - 1
+                bits ^= low
+
+    def __contains__(self, number):
+
+        return number >= 0 and bool(self.value >> number & 1)
+
+    def __len__(self):
+
+        return bin(self.value).count('1')
+
+    def __iter__(self):
+
+        return self.numbers()
+
+    def __and__(self, other):
+
+        return Bitmap(self.value & other.value)
+
+    def __or__(self, other):
+
+        return Bitmap(self.value | other.value)
+
+    def __sub__(self, other):
+
+        return Bitmap(self.value & ~other.value)
+
+    def __xor__(self, other):
+
+        return Bitmap(self.value ^ other.value)
+
+    def __eq__(self, other):
+
+        return isinstance(other, Bitmap) and self.value == other.value
+
+    def __ne__(self, other):
+
+        return not self == other
+
+    def dumps(self):
+        """
+        :return: :bytes: zlib compressed bitmap.
+        """
+
+        return zlib.compress(_to_bytes(self.value))
+
+    @classmethod
+    def loads(cls, data):
+
+        return cls(_from_bytes(bytearray(zlib.decompress(data))))
+
+
+class TagIndex(object):
+    """
+    Maps each tag to a bitmap over a dense openid numbering. WegoApi keeps it current by its tag write methods.
+    """
+
+    def __init__(self):
+
+        self.numbers = {}
+        self.openid_list = []
+        self.tags = {}
+        self.lock = threading.RLock()
+
+    def number(self, openid):
+        """
+        Dense number of an openid, a new one is assigned if missing.
+
+        :return: :int
+        """
+
+        number = self.numbers.get(openid)
+        if number is None:
+            with self.lock:
+                number = self.numbers.get(openid)
+                if number is None:
+                    number = self.numbers[openid] = len(self.openid_list)
+                    self.openid_list.append(openid)
+        return number
+
+    def bitmap(self, openids):
+        """
+        Bitmap of any openids, such as followers of a sync snapshot.
+
+        :param openids: Iterable of openid.
+        :return: :class:`Bitmap <wego.bitmap.Bitmap>` object.
+        """
+
+        return Bitmap.from_numbers(self.number(i) for i in openids)
+
+    def tag(self, tagid):
+        """
+        Users with the tag.
+
+        :param tagid: Tag id.
+        :return: :class:`Bitmap <wego.bitmap.Bitmap>` object.
+        """
+
+        return Bitmap(self.tags.get(tagid, 0))
+
+    def everyone(self):
+        """
+        All openids ever numbered.
+
+        :return: :class:`Bitmap <wego.bitmap.Bitmap>` object.
+        """
+
+        return Bitmap((1 << len(self.openid_list)) - 1)
+
+    def openids(self, bitmap):
+        """
+        :param bitmap: :class:`Bitmap <wego.bitmap.Bitmap>` object.
+        :return: Generator of openid.
+        """
+
+        for i in bitmap.numbers():
+            yield self.openid_list[i]
+
+    def user_tags(self, openid):
+        """
+        :return: :list: Tag ids of a user.
+        """
+
+        number = self.numbers.get(openid)
+        if number is None:
+            return []
+        return [i for i, value in self.tags.items() if value >> number & 1]
+
+    def add(self, tagid, openids):
+
+        value = self.bitmap(openids).value
+        with self.lock:
+            self.tags[tagid] = self.tags.get(tagid, 0) | value
+
+    def remove(self, tagid, openids):
+
+        value = self.bitmap(openids).value
+        with self.lock:
+            self.tags[tagid] = self.tags.get(tagid, 0) & ~value
+
+    def drop(self, tagid):
+
+        with self.lock:
+            self.tags.pop(tagid, None)
+
+    def rebuild(self, wego, tagids=None):
+        """
+        Rebuild tags by /cgi-bin/tags/get and /cgi-bin/user/tag/get paging.
+
+        :param wego: :class:`WegoApi <wego.api.WegoApi>` object.
+        :param tagids: (optional) Only rebuild these tags.
+        :return: None
+        """
+
+        if tagids is None:
+            tagids = list(wego.get_tags())
+            for tagid in list(self.tags):
+                if tagid not in tagids:
+                    self.drop(tagid)
+
+        for tagid in tagids:
+            # Fetched without the lock, the lock is held only to replace the bitmap
+            value = self.bitmap(wego.iter_tag_users(tagid)).value
+            with self.lock:
+                self.tags[tagid] = value
+
+    def save(self, path):
+        """
+        Write numbering and compressed bitmaps into a file atomically.
+
+        :param path: File path.
+        :return: None
+        """
+
+        tags = [(tagid, Bitmap(value).dumps()) for tagid, value in sorted(self.tags.items())]
+        header = {'openids': len(self.openid_list), 'tags': [[tagid, len(data)] for tagid, data in tags]}
+
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(json.dumps(header).encode('utf-8') + b'\n')
+            f.write(zlib.compress('\n'.join(self.openid_list).encode('ascii')) + b'\n')
+            for tagid, data in tags:
+                f.write(data)
+        os.rename(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load a file written by save.
+
+        :return: :class:`TagIndex <wego.bitmap.TagIndex>` object.
+        """
+
+        index = cls()
+        with open(path, 'rb') as f:
+            header = json.loads(f.readline().decode('utf-8'))
+            data = f.read()
+
+        openids = zlib.decompressobj()
+        text = openids.decompress(data)
+        rest = openids.unused_data[1:]
+        index.openid_list = text.decode('ascii').split('\n') if header['openids'] else []
+        index.numbers = {j: i for i, j in enumerate(index.openid_list)}
+        for tagid, length in header['tags']:
+            index.tags[tagid] = Bitmap.loads(rest[:length]).value
+            rest = rest[length:]
+        return index
@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+
+"""
+wego.cache
+
+Process-level caches used by wego.
+"""
+
+from collections import OrderedDict
+import threading
+import time
+
+
+class MemoryCache(object):
+    """
+    A thread safe LRU cache, every entry can expire.
+
+    :param max_size: (optional) Least recently used entries are evicted beyond it, 0 means unbounded.
+    :param ttl: (optional) Default seconds an entry lives, None means never expire.
+    """
+
+    def __init__(self, max_size=10000, ttl=None):
+
+        self.max_size = max_size
+        self.ttl = ttl
+        self.data = OrderedDict()
+        self.lock = threading.RLock()
+
+    def get(self, key, default=None):
+        """
+        Get a value, expired entry is dropped.
+
+        :return: Value or default.
+        """
+
+        with self.lock:
+            entry = self.data.pop(key, None)
+            if entry is None:
+                return default
+            if entry[1] is not None and entry[1] <= time.time():
+                return default
+            self.data[key] = entry
+            return entry[0]
+
+    def set(self, key, value, ttl=None, expires_at=None):
+        """
+        Set a value.
+
+        :param ttl: (optional) Seconds it lives, default is cache ttl.
+        :param expires_at: (optional) Timestamp it expires, override ttl.
+        :return: None
+        """
+
+        if expires_at is None:
+            ttl = self.ttl if ttl is None else ttl
+            expires_at = None if ttl is None else time.time() + ttl
+
+        with self.lock:
+            self.data.pop(key, None)
+            self.data[key] = (value, expires_at)
+            while self.max_size and len(self.data) > self.max_size:
+                self.data.popitem(last=False)
+
+    def delete(self, key):
+
+        with self.lock:
+            self.data.pop(key, None)
+
+    def clear(self):
+
+        with self.lock:
+            self.data.clear()
+
+    def items(self):
+        """
+        Get all entries still valid.
+
+        :return: :list: [(key, value, expires_at), ...]
+        """
+
+        now = time.time()
+        with self.lock:
+            return [(k, v, e) for k, (v, e) in self.data.items() if e is None or e > now]
+
+    def __contains__(self, key):
+
+        return self.get(key, self) is not self
+
+    def __len__(self):
+
+        return len(self.data)
+
+
+class SingleFlight(object):
+    """
+    Concurrent calls of the same key share one call and its result.
+
+        flight = SingleFlight()
+        data = flight.do(code, lambda: wechat.get_access_token(code))
+    """
+
+    def __init__(self):
+
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def do(self, key, func):
+        """
+        Call func, or wait for the call of the same key in flight.
+
+        :return: Result of func, its exception is raised to every caller.
+        """
+
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = {'event': threading.Event(), 'result': None, 'error': None}
+
+        if not leader:
+            call['event'].wait()
+        else:
+            try:
+                call['result'] = func()
+            except Exception as e:
+                call['error'] = e
+            finally:
+                with self.lock:
+                    del self.calls[key]
+                call['event'].set()
+
+        if call['error'] is not None:
+            raise call['error']
+        return call['result']
+
+
+# Fields /sns/userinfo returns, the others of /cgi-bin/user/info are ext fields (subscribe, remark, groupid...)
+PROFILE_FIELDS = ('openid', 'nickname', 'sex', 'province', 'city', 'country', 'headimgurl', 'privilege', 'unionid')
+
+
+class ProfileCache(object):
+    """
+    User profile cache keyed by openid, it is a USERINFO_CACHE and also caches OAuth userinfo.
+    Profile fields (nickname, headimgurl...) and ext fields (subscribe, remark, groupid...) expire separately.
+
+    :param max_size: (optional) Max users kept in memory.
+    :param ttl: (optional) Seconds profile fields live, 0 disables caching them.
+    :param ext_ttl: (optional) Seconds ext fields live, 0 disables caching them.
+    :param backend: (optional) Shared cache behind memory, has get(key), set(key, value, ttl) and delete(key),
+            values are JSON serializable dicts. clear() deletes backend keys only if it has delete_prefix(prefix),
+            other backend entries live until their ttl.
+    :param prefix: (optional) Key prefix in backend.
+    """
+
+    def __init__(self, max_size=10000, ttl=3600, ext_ttl=300, backend=None, prefix='wego:user:'):
+
+        self.ttl = ttl
+        self.ext_ttl = ext_ttl
+        self.backend = backend
+        self.prefix = prefix
+        self.local = MemoryCache(max_size)
+        self.lock = threading.Lock()
+
+    def _get_entry(self, openid):
+
+        entry = self.local.get(openid)
+        if entry is None and self.backend is not None:
+            entry = self.backend.get(self.prefix + openid)
+            if entry is not None:
+                self.local.set(openid, entry, expires_at=max(entry['profile_at'], entry['ext_at']))
+        return entry
+
+    def _set_entry(self, openid, profile=None, ext=None):
+
+        # Backend calls are made without the lock, a local miss is read through before it
+        self._get_entry(openid)
+
+        now = time.time()
+        with self.lock:
+            entry = self.local.get(openid) or {'profile': {}, 'profile_at': 0, 'ext': {}, 'ext_at': 0}
+            entry = dict(entry)
+            if profile is not None and self.ttl:
+                entry['profile'], entry['profile_at'] = profile, now + self.ttl
+            if ext is not None and self.ext_ttl:
+                entry['ext'], entry['ext_at'] = ext, now + self.ext_ttl
+
+            expires_at = max(entry['profile_at'], entry['ext_at'])
+            if expires_at <= now:
+                return
+            self.local.set(openid, entry, expires_at=expires_at)
+
+        if self.backend is not None:
+            self.backend.set(self.prefix + openid, entry, int(expires_at - now) + 1)
+
+    def get(self, openid):
+        """
+        Get user extra info as /cgi-bin/user/info returns.
+
+        :return: :dict or None
+        """
+
+        entry = self._get_entry(openid)
+        now = time.time()
+        if entry is None or entry['ext_at'] <= now:
+            return None
+        if entry['ext'].get('subscribe') == 1:
+            if entry['profile_at'] <= now:
+                return None
+            return dict(entry['profile'], **entry['ext'])
+        return dict(entry['ext'])
+
+    def set(self, openid, data):
+        """
+        Set user extra info as /cgi-bin/user/info returns.
+
+        :return: None
+        """
+
+        ext = {k: v for k, v in data.items() if k not in PROFILE_FIELDS or k == 'openid'}
+        profile = None
+        if data.get('subscribe') == 1:
+            profile = {k: data[k] for k in PROFILE_FIELDS if k in data}
+        self._set_entry(openid, profile, ext)
+
+    def get_profile(self, openid):
+        """
+        Get user info as /sns/userinfo returns.
+
+        :return: :dict or None
+        """
+
+        entry = self._get_entry(openid)
+        if entry is None or entry['profile_at'] <= time.time():
+            return None
+        return dict(entry['profile'])
+
+    def set_profile(self, openid, data):
+        """
+        Set user info as /sns/userinfo returns.
+
+        :return: None
+        """
+
+        self._set_entry(openid, profile={k: v for k, v in data.items() if k != 'expires_at'})
+
+    def delete(self, openid):
+
+        self.local.delete(openid)
+        if self.backend is not None:
+            self.backend.delete(self.prefix + openid)
+
+    def clear(self):
+
+        self.local.clear()
+        # The backend is shared by other caches, only keys of this one are deleted
+        if hasattr(self.backend, 'delete_prefix'):
+            self.backend.delete_prefix(self.prefix)
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+
+"""
+wego.conversation
+
+Per-openid conversation state for multi-step chat flows (forms, quizzes, support triage...).
+
+    store = wego.conversation.ConversationStore(backend=MyBackend())
+    w = wego.init(..., CONVERSATION_STORE=store)
+
+    push = w.analysis_push(request)
+    step = push.state.get('step', 0)
+    push.update_state(lambda state: dict(state, step=step + 1))
+
+With a backend shared by processes, set INVALIDATION_BACKEND to a cross process one (such as RedisPubSub),
+or other processes read their stale local copies until TTL. The update helpers lock per process, they are
+atomic across processes only if the backend has atomic_update(openid, func, ttl), such as a redis WATCH transaction
+or SELECT ... FOR UPDATE.
+"""
+
+from .invalidation import LocalPubSub
+from .cache import MemoryCache
+import threading
+import logging
+
+
+class ConversationStore(object):
+    """
+    In-memory LRU with TTL eviction in front of an optional write-through backend.
+    States are dicts, treat the one you get as read-only and change it by set or the update helpers.
+
+    :param backend: (optional) Object has get(openid), set(openid, state, ttl) and delete(openid),
+            such as a wrapper of your SQL table or redis. Reads only reach it on local miss, except update.
+            It may have atomic_update(openid, func, ttl) which atomically sets func(state) and returns it,
+            state is None if no state, then the update helpers are atomic across processes.
+    :param max_size: (optional) Max conversations kept in memory.
+    :param ttl: (optional) Seconds a conversation lives since it was last written.
+    """
+
+    def __init__(self, backend=None, max_size=10000, ttl=1800):
+
+        self.backend = backend
+        self.ttl = ttl
+        self.cache = MemoryCache(max_size, ttl)
+        self.locks = [threading.RLock() for i in range(64)]
+        self.bus = None
+
+    def bind(self, bus):
+        """
+        Keep local copies of processes sharing the backend correct by the invalidation bus.
+
+        :param bus: :class:`InvalidationBus <wego.invalidation.InvalidationBus>` object.
+        :return: None
+        """
+
+        self.bus = bus
+        bus.register('conversation', self.cache)
+        if self.backend is not None and isinstance(bus.backend, LocalPubSub):
+            logging.getLogger('wego').warning(
+                u'Conversation backend is set but INVALIDATION_BACKEND is in-process, '
+                u'other processes may read stale states until TTL'
+                u'(会话存储设置了后端, 但失效通知仅限本进程, 其他进程可能读到过期状态)'
+            )
+
+    def lock(self, openid):
+        """
+        Lock of an openid, hold it to do several operations atomically.
+
+            with store.lock(openid):
+                ...
+        """
+
+        return self.locks[hash(openid) % len(self.locks)]
+
+    def get(self, openid, default=None):
+        """
+        Get conversation state.
+
+        :param openid: FromUserName of push.
+        :param default: (optional) Returned if no state.
+        :return: State or default.
+        """
+
+        state = self.cache.get(openid)
+        if state is None and self.backend is not None:
+            state = self.backend.get(openid)
+            if state is not None:
+                self.cache.set(openid, state)
+
+        return default if state is None else state
+
+    def set(self, openid, state):
+        """
+        Set conversation state, write through backend.
+
+        :param openid: FromUserName of push.
+        :param state: A dict.
+        :return: None
+        """
+
+        with self.lock(openid):
+            if self.backend is not None:
+                self.backend.set(openid, state, self.ttl)
+                if self.bus is not None:
+                    self.bus.invalidate('conversation', openid)
+            self.cache.set(openid, state)
+
+    def _update_backend(self, openid, func, default):
+        """
+        Update by the backend atomically, must hold the lock.
+        """
+
+        def update(state):
+            return func(dict(default or {}) if state is None else state)
+
+        state = self.backend.atomic_update(openid, update, self.ttl)
+        if self.bus is not None:
+            self.bus.invalidate('conversation', openid)
+        self.cache.set(openid, state)
+        return state
+
+    def delete(self, openid):
+        """
+        End a conversation.
+
+        :param openid: FromUserName of push.
+        :return: None
+        """
+
+        with self.lock(openid):
+            if self.backend is not None:
+                self.backend.delete(openid)
+                if self.bus is not None:
+                    self.bus.invalidate('conversation', openid)
+            self.cache.delete(openid)
+
+    def update(self, openid, func, default=None):
+        """
+        Atomically replace state by func(state), current state is read from the backend if any.
+        It is atomic within the process, and across processes only if the backend has atomic_update.
+
+        :param openid: FromUserName of push.
+        :param func: A function receive current state (or a copy of default) and return the new state.
+        :param default: (optional) State used if no state, default is {}.
+        :return: New state.
+        """
+
+        with self.lock(openid):
+            if self.backend is not None and hasattr(self.backend, 'atomic_update'):
+                return self._update_backend(openid, func, default)
+
+            if self.backend is not None:
+                state = self.backend.get(openid)
+            else:
+                state = self.cache.get(openid)
+            if state is None:
+                state = dict(default or {})
+            state = func(state)
+            self.set(openid, state)
+            return state
+
+    def merge(self, openid, **fields):
+        """
+        Atomically set some fields of state, see :meth:`update`.
+
+        :return: New state.
+        """
+
+        return self.update(openid, lambda state: dict(state, **fields))
+
+    def incr(self, openid, field, amount=1):
+        """
+        Atomically increase a field of state, see :meth:`update`.
+
+        :return: New value.
+        """
+
+        state = self.update(openid, lambda state: dict(state, **{field: state.get(field, 0) + amount}))
+        return state[field]
@@ -27,5 +27,9 @@ class WeChatUserError(Exception):
     """An wechat user error occurred."""
 
 
+class UpgradeRequired(WeChatUserError):
+    """The user profile needs a snsapi_userinfo authorization."""
+
+
 class WeChatButtonError(Exception):
     """An wechat button error occurred."""
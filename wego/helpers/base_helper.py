@@ -22,5 +22,8 @@ class BaseHelper(object):
     def get_session(self, key):
         raise HelperError('you have to customized YourHelper.get_session')
 
+    def del_session(self, key):
+        self.set_session(key, '')
+
     def redirect(self, url):
         raise HelperError('you have to customized YourHelper.redirect')
@@ -1,5 +1,17 @@
 # -*- coding: utf-8 -*-
 from .base_helper import BaseHelper
+from wego.exceptions import HelperError
+import hashlib
+import base64
+import hmac
+import time
+
+try:
+    from urllib.parse import parse_qs
+    from http.cookies import SimpleCookie
+except ImportError:
+    from urlparse import parse_qs
+    from Cookie import SimpleCookie
 
 
 class DjangoHelper(BaseHelper):
@@ -22,6 +34,9 @@ class DjangoHelper(BaseHelper):
     def get_session(self, key):
         return self.request.session.get(key, False)
 
+    def del_session(self, key):
+        self.request.session.pop(key, None)
+
     def redirect(self, url):
         from django.shortcuts import redirect
         return redirect(url)
@@ -53,7 +68,100 @@ class TornadoHelper(BaseHelper):
             return self.session[key]
         return self.handler.get_secure_cookie(key)
 
+    def del_session(self, key):
+        self.session[key] = False
+        self.handler.clear_cookie(key)
+
     def redirect(self, url):
         return self.handler.redirect(url)
 
 
+class SignedCookieHelper(BaseHelper):
+    """
+    Base of helpers keep sessions in HMAC signed cookies, subclass gives get_cookie_header, Set-Cookie headers
+    to send are collected in self.cookies. A cookie holds the value, the time it was issued and the signature,
+    it expires max_age seconds after it was issued. The value is signed, not encrypted.
+
+    :param secret: Key signs cookies, COOKIE_SECRET.
+    :param max_age: (optional) Seconds a cookie is valid.
+    """
+
+    def __init__(self, secret, max_age=2592000):
+        if not secret:
+            raise HelperError(u'COOKIE_SECRET is required to sign session cookies(需要设置 COOKIE_SECRET)')
+        self.secret = secret.encode('utf-8')
+        self.max_age = int(max_age)
+        self.session = {}
+        self.cookies = []
+
+    def get_cookie_header(self):
+        raise HelperError('you have to customized YourHelper.get_cookie_header')
+
+    def _sign(self, value):
+        return hmac.new(self.secret, value, hashlib.sha256).hexdigest().encode('ascii')
+
+    def set_session(self, key, value):
+        self.session[key] = value
+        value = base64.urlsafe_b64encode(value.encode('utf-8')) + b'|' + str(int(time.time())).encode('ascii')
+        self.cookies.append(('Set-Cookie', '%s=%s|%s; Path=/; Max-Age=%s; Secure; HttpOnly' % (
+            key, value.decode('ascii'), self._sign(key.encode('utf-8') + b'|' + value).decode('ascii'),
+            self.max_age)))
+
+    def get_session(self, key):
+        if key in self.session:
+            return self.session[key]
+
+        cookie = SimpleCookie(self.get_cookie_header())
+        if key not in cookie or cookie[key].value.count('|') != 2:
+            return False
+        value, signature = [i.encode('ascii') for i in cookie[key].value.rsplit('|', 1)]
+        if not hmac.compare_digest(self._sign(key.encode('utf-8') + b'|' + value), signature):
+            return False
+        value, issued_at = value.split(b'|')
+        if not issued_at.isdigit() or int(issued_at) + self.max_age < time.time():
+            return False
+        return base64.urlsafe_b64decode(value).decode('utf-8')
+
+    def del_session(self, key):
+        self.session[key] = False
+        self.cookies.append(('Set-Cookie', '%s=; Path=/; Max-Age=0; Secure; HttpOnly' % key))
+
+
+class WSGIHelper(SignedCookieHelper):
+    """
+    Helper of a WSGI environ, use it with :class:`WSGIMiddleware <wego.middleware.WSGIMiddleware>`
+    which sends the cookies.
+
+    :param environ: WSGI environ.
+    :param secret: (optional) Key signs cookies, default is environ['wego.cookie_secret'].
+    :param max_age: (optional) Seconds a cookie is valid.
+    """
+
+    def __init__(self, environ, secret=None, max_age=2592000):
+        super(WSGIHelper, self).__init__(secret or environ.get('wego.cookie_secret', ''), max_age)
+        self.environ = environ
+
+    def get_current_path(self):
+        path = self.environ.get('SCRIPT_NAME', '') + self.environ.get('PATH_INFO', '/')
+        if self.environ.get('QUERY_STRING'):
+            path += '?' + self.environ['QUERY_STRING']
+        return path
+
+    def get_params(self):
+        return {i: j[-1] for i, j in parse_qs(self.environ.get('QUERY_STRING', '')).items()}
+
+    def get_body(self):
+        length = int(self.environ.get('CONTENT_LENGTH') or 0)
+        return self.environ['wsgi.input'].read(length) if length else b''
+
+    def get_cookie_header(self):
+        return self.environ.get('HTTP_COOKIE', '')
+
+    def redirect(self, url):
+        cookies = self.cookies
+
+        def app(environ, start_response):
+            start_response('302 Found', [('Location', url)] + cookies)
+            return [b'']
+
+        return app
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+
+"""
+wego.invalidation
+
+Invalidation bus: wego publishes what becomes stale (by push events and by its own write methods),
+caches registered on the bus drop those entries, so they can use long TTL and still be correct.
+
+Namespaces published by wego:
+
+    user: key is openid, None means all users.
+    groups: the group table.
+    menu: menus.
+"""
+
+from collections import defaultdict
+import threading
+import logging
+import json
+import uuid
+
+
+class LocalPubSub(object):
+    """
+    In-process pub/sub, it is the default backend. Share one instance between buses of the same process.
+    """
+
+    def __init__(self):
+
+        self.subscribers = []
+
+    def publish(self, message):
+
+        for callback in self.subscribers:
+            callback(message)
+
+    def subscribe(self, callback):
+
+        self.subscribers.append(callback)
+
+
+class RedisPubSub(object):
+    """
+    Cross process pub/sub through redis channel.
+
+    :param client: A redis client, such as redis.StrictRedis().
+    :param channel: (optional) Channel name.
+    """
+
+    def __init__(self, client, channel='wego:invalidation'):
+
+        self.client = client
+        self.channel = channel
+
+    def publish(self, message):
+
+        self.client.publish(self.channel, json.dumps(message))
+
+    def subscribe(self, callback):
+
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(self.channel)
+
+        def listen():
+            for item in pubsub.listen():
+                try:
+                    data = item['data']
+                    if isinstance(data, bytes):
+                        data = data.decode('utf-8')
+                    callback(json.loads(data))
+                except Exception:
+                    logging.getLogger('wego').exception('Bad invalidation message(无效的失效消息)')
+
+        thread = threading.Thread(target=listen, name='wego-invalidation')
+        thread.daemon = True
+        thread.start()
+
+
+class InvalidationBus(object):
+    """
+    Register caches by namespace, a cache is any object has delete(key) and clear().
+
+    :param backend: (optional) Pub/sub backend has publish(message) and subscribe(callback),
+            default is :class:`LocalPubSub <wego.invalidation.LocalPubSub>`.
+    :param account: (optional) APP_ID, buses of other accounts sharing the backend ignore its messages.
+    """
+
+    def __init__(self, backend=None, account=None):
+
+        self.backend = backend or LocalPubSub()
+        self.account = account
+        self.origin = uuid.uuid4().hex
+        self.caches = defaultdict(list)
+        self.backend.subscribe(self._receive)
+
+    def register(self, namespace, cache):
+        """
+        Register a cache.
+
+        :param namespace: Such as 'user', 'groups', 'menu'.
+        :param cache: Object has delete(key) and clear().
+        :return: cache
+        """
+
+        self.caches[namespace].append(cache)
+        return cache
+
+    def unregister(self, namespace, cache):
+
+        if cache in self.caches[namespace]:
+            self.caches[namespace].remove(cache)
+
+    def invalidate(self, namespace, key=None):
+        """
+        Invalidate local caches at once, then publish to other processes.
+
+        :param namespace: Namespace.
+        :param key: (optional) Key, None means the whole namespace.
+        :return: None
+        """
+
+        self._apply(namespace, key)
+        self.publish(namespace, key)
+
+    def invalidate_many(self, namespace, keys):
+        """
+        Invalidate keys at once, other processes get one message.
+
+        :param namespace: Namespace.
+        :param keys: Iterable of key.
+        :return: None
+        """
+
+        keys = list(keys)
+        if not keys:
+            return
+        for key in keys:
+            self._apply(namespace, key)
+        self.backend.publish({'origin': self.origin, 'account': self.account, 'namespace': namespace, 'keys': keys})
+
+    def publish(self, namespace, key=None):
+        """
+        Invalidate caches of other processes only, use it when local cache is already updated in place.
+
+        :param namespace: Namespace.
+        :param key: (optional) Key, None means the whole namespace.
+        :return: None
+        """
+
+        self.backend.publish({'origin': self.origin, 'account': self.account, 'namespace': namespace, 'key': key})
+
+    def _receive(self, message):
+
+        if message.get('origin') != self.origin and message.get('account') == self.account:
+            if 'keys' in message:
+                for key in message['keys']:
+                    self._apply(message['namespace'], key)
+            else:
+                self._apply(message['namespace'], message.get('key'))
+
+    def _apply(self, namespace, key):
+
+        for cache in list(self.caches.get(namespace, [])):
+            if key is None:
+                cache.clear()
+            else:
+                cache.delete(key)
+
+    def on_push(self, push):
+        """
+        Invalidate by push events.
+
+        :param push: :class:`WeChatPush <wego.api.WeChatPush>` object.
+        :return: None
+        """
+
+        if push.type in ('subscribe', 'unsubscribe', 'scan_subcribe'):
+            self.invalidate('user', push.from_user)
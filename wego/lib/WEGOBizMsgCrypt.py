@@ -22,7 +22,8 @@ if sys.version_info[0] == 2:
 try:
     from Crypto.Cipher import AES
 except ImportError:
-    print ('please install Crypto at first: $ pip install pycrypto')
+    # 在创建加解密对象时才提示安装
+    AES = None
 
 
 Crypt_OK = 0
@@ -136,6 +137,8 @@ class Prpcrypt(object):
     """提供接收和推送给公众平台消息的加解密接口"""
 
     def __init__(self, key, appid):
+        if AES is None:
+            raise ImportError('please install Crypto at first: $ pip install pycrypto')
         # self.key = base64.b64decode(key+"=")
         self.key = key
         # 设置加解密模式为AES的CBC模式
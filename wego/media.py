@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+
+"""
+wego.media
+
+Download image, voice, video and shortvideo users sent before the temporary media expires (3 days).
+Files are streamed into a local content-addressed store, look them up by MediaId.
+"""
+
+import threading
+import hashlib
+import time
+import re
+import os
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+_SAFE_NAME_RE = re.compile(r'^[A-Za-z0-9_-]{1,128}$')
+
+
+class MediaStore(object):
+    """
+    Content-addressed local store:
+
+        objects/ab/abcdef...    file content, named by its sha1.
+        media/<MediaId>         sha1 of the media content, replaced atomically.
+
+    :param path: Root directory.
+    """
+
+    def __init__(self, path):
+
+        self.path = path
+        self.index = {}
+        self.lock = threading.Lock()
+        for name in ('objects', 'media', 'tmp'):
+            directory = os.path.join(path, name)
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+
+    def _object_path(self, digest):
+
+        return os.path.join(self.path, 'objects', digest[:2], digest)
+
+    @staticmethod
+    def _safe_name(media_id):
+        """
+        File name of a MediaId, names out of [A-Za-z0-9_-] are replaced by their sha1.
+        """
+
+        if _SAFE_NAME_RE.match(media_id):
+            return media_id
+        return 'sha1-' + hashlib.sha1(media_id.encode('utf-8')).hexdigest()
+
+    def _media_path(self, media_id):
+
+        return os.path.join(self.path, 'media', self._safe_name(media_id))
+
+    def _write_atomic(self, path, data):
+
+        tmp_path = os.path.join(self.path, 'tmp', '%s.%s.%s' % (
+            os.path.basename(path), os.getpid(), threading.current_thread().ident))
+        with open(tmp_path, 'w') as f:
+            f.write(data)
+        getattr(os, 'replace', os.rename)(tmp_path, path)
+
+    def lookup(self, media_id):
+        """
+        Get local path of a media.
+
+        :param media_id: MediaId.
+        :return: Path or None.
+        """
+
+        with self.lock:
+            digest = self.index.get(media_id)
+        if digest is None:
+            try:
+                with open(self._media_path(media_id)) as f:
+                    digest = f.read().strip()
+            except IOError:
+                return None
+            if not digest:
+                return None
+            with self.lock:
+                self.index[media_id] = digest
+
+        return self._object_path(digest)
+
+    def save(self, media_id, chunks):
+        """
+        Write chunks into store, only one chunk is in memory at a time.
+
+        :param media_id: MediaId.
+        :param chunks: Iterable of bytes.
+        :return: Local path.
+        """
+
+        sha1 = hashlib.sha1()
+        tmp_path = os.path.join(self.path, 'tmp', '%s.%s.%s' % (
+            self._safe_name(media_id), os.getpid(), threading.current_thread().ident))
+        try:
+            with open(tmp_path, 'wb') as f:
+                for chunk in chunks:
+                    if chunk:
+                        sha1.update(chunk)
+                        f.write(chunk)
+
+            digest = sha1.hexdigest()
+            path = self._object_path(digest)
+            if os.path.exists(path):
+                os.remove(tmp_path)
+            else:
+                if not os.path.isdir(os.path.dirname(path)):
+                    try:
+                        os.makedirs(os.path.dirname(path))
+                    except OSError:
+                        pass
+                os.rename(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        self._write_atomic(self._media_path(media_id), digest)
+        with self.lock:
+            self.index[media_id] = digest
+
+        return path
+
+
+class MediaPrefetcher(object):
+    """
+    Bounded worker pool download medias of pushes into :class:`MediaStore <wego.media.MediaStore>`.
+
+    :param wego: :class:`WegoApi <wego.api.WegoApi>` object.
+    :param path: Store root directory.
+    :param workers: (optional) Number of download threads.
+    :param max_pending: (optional) Medias beyond it are dropped (and logged) instead of blocking the push handler.
+    :param retries: (optional) Retry times of a failed download.
+    :param backoff: (optional) Seconds waiting before first retry, doubled every retry.
+    """
+
+    push_types = ('image', 'voice', 'video', 'shortvideo')
+
+    def __init__(self, wego, path, workers=4, max_pending=1000, retries=3, backoff=1):
+
+        self.wego = wego
+        self.store = MediaStore(path)
+        self.workers = workers
+        self.retries = retries
+        self.backoff = backoff
+        self.queue = queue.Queue(max_pending)
+        self.lock = threading.Lock()
+        self.threads = []
+
+    def on_push(self, push):
+        """
+        Push listener, queue the media of image, voice, video and shortvideo pushes.
+
+        :param push: :class:`WeChatPush <wego.api.WeChatPush>` object.
+        :return: None
+        """
+
+        if push.type in self.push_types and push.MediaId:
+            self.prefetch(push.MediaId)
+
+    def prefetch(self, media_id):
+        """
+        Queue a media, return at once.
+
+        :param media_id: MediaId.
+        :return: :Bool: False if the queue is full.
+        """
+
+        if not self.threads:
+            self._start()
+
+        try:
+            self.queue.put_nowait(media_id)
+        except queue.Full:
+            self.wego.settings.LOGGER.warning(u'Media prefetch queue is full, drop %s(媒体预取队列已满)' % media_id)
+            return False
+        return True
+
+    def path(self, media_id):
+        """
+        Get local path of a media.
+
+        :param media_id: MediaId.
+        :return: Path or None if it has not been downloaded.
+        """
+
+        return self.store.lookup(media_id)
+
+    def download(self, media_id):
+        """
+        Download a media now, retry on failure.
+
+        :param media_id: MediaId.
+        :return: Local path.
+        """
+
+        path = self.store.lookup(media_id)
+        if path:
+            return path
+
+        for i in range(self.retries + 1):
+            try:
+                req = self.wego.wechat.stream_temporary_material(media_id)
+                try:
+                    return self.store.save(media_id, req.iter_content(64 * 1024))
+                finally:
+                    req.close()
+            except Exception:
+                if i == self.retries:
+                    raise
+                time.sleep(self.backoff * 2 ** i)
+
+    def _start(self):
+
+        with self.lock:
+            if self.threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run, name='wego-media-%s' % i)
+                thread.daemon = True
+                thread.start()
+                self.threads.append(thread)
+
+    def _run(self):
+
+        while True:
+            media_id = self.queue.get()
+            try:
+                self.download(media_id)
+            except Exception:
+                self.wego.settings.LOGGER.exception(u'Prefetch media %s failed(预取媒体失败)' % media_id)
+            finally:
+                self.queue.task_done()
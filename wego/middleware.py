@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+
+"""
+wego.middleware
+
+Attach request.wx_openid and request.wx_user to every request lazily, nothing is read from session and no api is
+called until a view uses them, and a view redirects to authorize only when it requires login (by
+login_required, or by reading the profile of a snsapi_base user).
+
+Django, settings.py:
+
+    MIDDLEWARE = [..., 'wego.middleware.DjangoMiddleware']
+    WEGO_API = 'myapp.wx.w'  # dotted path of your WegoApi object
+
+WSGI, sessions are kept in cookies signed by COOKIE_SECRET:
+
+    app = WSGIMiddleware(app, w)
+    # environ['wego.login'].openid, environ['wego.login'].user
+"""
+
+from .exceptions import UpgradeRequired, InitError
+from .helpers.official import WSGIHelper
+from .api import LazyWeChatUser
+
+
+class LazyLogin(object):
+    """
+    Login state of a request, the openid is resolved at the first access.
+
+    :param wego: :class:`WegoApi <wego.api.WegoApi>` object.
+    :param helper: Helper of the request.
+    """
+
+    def __init__(self, wego, helper):
+
+        self.wego = wego
+        self.helper = helper
+        self._openid = None
+        self._user = None
+
+    @property
+    def openid(self):
+        """
+        :return: :str: openid, empty if the user has not logged in.
+        """
+
+        if self._openid is None:
+            record = self.wego.get_session_record(self.helper)
+            code = self.helper.get_params().get('code', '')
+            openid = self.wego._get_openid(record, code) if code else None
+            self._openid = openid or record.openid
+            record.save()
+        return self._openid
+
+    @property
+    def user(self):
+        """
+        :return: :class:`LazyWeChatUser <wego.api.LazyWeChatUser>` object, None if the user has not logged in.
+        """
+
+        if not self.openid:
+            return None
+        if self._user is None:
+            self._user = LazyWeChatUser(self.wego, self.wego.get_session_record(self.helper), self.openid)
+        return self._user
+
+
+class DjangoMiddleware(object):
+    """
+    Django middleware, WegoApi object is found by settings.WEGO_API, its HELPER must be a Django helper.
+    """
+
+    def __init__(self, get_response=None):
+
+        self.get_response = get_response
+        self.wego = None
+
+    def __call__(self, request):
+
+        self.process_request(request)
+        return self.get_response(request)
+
+    def process_request(self, request):
+
+        from django.utils.functional import SimpleLazyObject
+
+        if self.wego is None:
+            from django.conf import settings
+            from django.utils.module_loading import import_string
+            self.wego = import_string(settings.WEGO_API)
+
+        login = LazyLogin(self.wego, self.wego.get_helper(request))
+        request.wego = self.wego
+        request.wego_helper = login.helper
+        request.wx_openid = SimpleLazyObject(lambda: login.openid)
+        request.wx_user = SimpleLazyObject(lambda: login.user)
+
+    def process_exception(self, request, exception):
+
+        # Django calls it when a view reads the profile of a snsapi_base user
+        if isinstance(exception, UpgradeRequired):
+            return self.wego.redirect_for_code(request.wego_helper)
+
+
+class WSGIMiddleware(object):
+    """
+    WSGI middleware, it puts a :class:`LazyLogin <wego.middleware.LazyLogin>` into environ['wego.login'].
+
+    Headers are sent with the first non-empty chunk of the body, so sessions written and UpgradeRequired raised
+    before it are in the response. Once a chunk is sent, session writes are lost and UpgradeRequired propagates.
+
+    :param app: WSGI application.
+    :param wego: :class:`WegoApi <wego.api.WegoApi>` object.
+    :param login_required: (optional) Redirect users who have not logged in before calling app.
+    :param scope: (optional) Scope of the login_required redirect, snsapi_userinfo or snsapi_base.
+    :param cookie_secret: (optional) Key signs session cookies, default is COOKIE_SECRET.
+    """
+
+    def __init__(self, app, wego, login_required=False, scope='snsapi_base', cookie_secret=None):
+
+        self.app = app
+        self.wego = wego
+        self.login_required = login_required
+        self.scope = scope
+        self.cookie_secret = cookie_secret or wego.settings.COOKIE_SECRET
+        if not self.cookie_secret:
+            raise InitError(u'WSGIMiddleware requires COOKIE_SECRET(WSGIMiddleware 需要设置 COOKIE_SECRET)')
+
+    def __call__(self, environ, start_response):
+
+        helper = WSGIHelper(environ, self.cookie_secret, self.wego.settings.COOKIE_MAX_AGE)
+        login = environ['wego.login'] = LazyLogin(self.wego, helper)
+
+        if self.login_required and not login.openid:
+            return self.wego.redirect_for_code(helper, self.scope)(environ, start_response)
+
+        response = {}
+
+        def start_with_cookies(status, headers, exc_info=None):
+            response['start'] = (status, headers, exc_info)
+            return lambda data: send()(data)
+
+        def send():
+            if 'write' not in response:
+                status, headers, exc_info = response['start']
+                response['write'] = start_response(status, list(headers) + helper.cookies, exc_info)
+            return response['write']
+
+        body = None
+        try:
+            body = self.app(environ, start_with_cookies)
+            chunks = iter(body)
+            first = b''
+            for first in chunks:
+                if first:
+                    break
+        except UpgradeRequired:
+            self._close(body)
+            return self.wego.redirect_for_code(helper)(environ, start_response)
+
+        send()
+        return self._iter_body(first, chunks, body)
+
+    def _iter_body(self, first, chunks, body):
+
+        try:
+            if first:
+                yield first
+            for chunk in chunks:
+                yield chunk
+        finally:
+            self._close(body)
+
+    @staticmethod
+    def _close(body):
+
+        if hasattr(body, 'close'):
+            body.close()
@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+
+"""
+wego.openidset
+
+Compact immutable openid set: sorted fixed-width 28 bytes records in one buffer (bytes, bytearray or mmap),
+about 28 bytes per openid instead of 100+ of a python set of str.
+
+    followers = OpenidSet.from_iterable(w.iter_followers())
+    followers.save('followers.bin')
+    followers = OpenidSet.load('followers.bin')  # mmap, no parse
+    'oXXXX' in followers
+    left = old.difference(new)
+"""
+
+import mmap
+import os
+
+WIDTH = 28
+
+
+def _encode(openid, width=WIDTH):
+
+    if not isinstance(openid, bytes):
+        openid = openid.encode('ascii')
+    if len(openid) > width:
+        raise ValueError('openid longer than %s bytes: %r' % (width, openid))
+    return openid.ljust(width, b'\0')
+
+
+def _decode(record):
+
+    return record.rstrip(b'\0').decode('ascii')
+
+
+class OpenidSet(object):
+    """
+    :param buffer: (optional) Sorted unique records, use the class methods to build one.
+    :param width: (optional) Bytes per record.
+    """
+
+    def __init__(self, buffer=b'', width=WIDTH):
+
+        if len(buffer) % width:
+            raise ValueError('buffer size is not a multiple of %s' % width)
+
+        self.buffer = buffer
+        self.width = width
+
+    @classmethod
+    def from_iterable(cls, iterable, width=WIDTH):
+        """
+        Build from openids in any order.
+
+        :param iterable: Iterable of openid.
+        :return: :class:`OpenidSet <wego.openidset.OpenidSet>` object.
+        """
+
+        return cls.from_sorted(sorted(set(_encode(i, width) for i in iterable)), width)
+
+    @classmethod
+    def from_sorted(cls, iterable, width=WIDTH):
+        """
+        Build from sorted openids, duplicates are dropped.
+
+        :param iterable: Sorted iterable of openid (str or encoded record).
+        :return: :class:`OpenidSet <wego.openidset.OpenidSet>` object.
+        """
+
+        buffer = bytearray()
+        last = None
+        for record in iterable:
+            record = _encode(record, width)
+            if record != last:
+                buffer += record
+                last = record
+        return cls(buffer, width)
+
+    @classmethod
+    def write_sorted(cls, path, iterable, width=WIDTH):
+        """
+        Stream sorted openids into a file without building the set in memory.
+
+        :param path: File path.
+        :param iterable: Sorted iterable of openid.
+        :return: Number of openids written.
+        """
+
+        count = 0
+        last = None
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            for record in iterable:
+                record = _encode(record, width)
+                if record != last:
+                    f.write(record)
+                    last = record
+                    count += 1
+        getattr(os, 'replace', os.rename)(tmp_path, path)
+        return count
+
+    @classmethod
+    def load(cls, path, use_mmap=True, width=WIDTH):
+        """
+        Load a file written by save or write_sorted.
+
+        :param path: File path.
+        :param use_mmap: (optional) Map the file instead of reading it, pages are loaded on demand.
+        :return: :class:`OpenidSet <wego.openidset.OpenidSet>` object.
+        """
+
+        with open(path, 'rb') as f:
+            if not use_mmap or os.fstat(f.fileno()).st_size == 0:
+                return cls(f.read(), width)
+            return cls(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ), width)
+
+    def close(self):
+        """
+        Unmap the file of a set loaded with use_mmap, the set can not be used after it.
+
+        :return: None
+        """
+
+        if isinstance(self.buffer, mmap.mmap):
+            self.buffer.close()
+
+    def save(self, path):
+        """
+        Write into a file atomically.
+
+        :param path: File path.
+        :return: None
+        """
+
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(self.buffer)
+        getattr(os, 'replace', os.rename)(tmp_path, path)
+
+    def _record(self, index):
+
+        return self.buffer[index * self.width:(index + 1) * self.width]
+
+    def _records(self):
+
+        for i in range(len(self)):
+            yield self._record(i)
+
+    def __len__(self):
+
+        return len(self.buffer) // self.width
+
+    def __getitem__(self, index):
+
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('OpenidSet index out of range')
+        return _decode(self._record(index))
+
+    def __iter__(self):
+
+        for record in self._records():
+            yield _decode(record)
+
+    def __contains__(self, openid):
+
+        try:
+            record = _encode(openid, self.width)
+        except (ValueError, UnicodeError):
+            return False
+
+        low, high = 0, len(self)
+        while low < high:
+            middle = (low + high) // 2
+            current = self._record(middle)
+            if current < record:
+                low = middle + 1
+            elif current > record:
+                high = middle
+            else:
+                return True
+        return False
+
+    def _merge(self, other, keep_left, keep_both, keep_right):
+
+        if self.width != other.width:
+            raise ValueError('Can not merge OpenidSet with different width')
+
+        width = self.width
+        buffer = bytearray()
+        i, j, n, m = 0, 0, len(self), len(other)
+        a = self._record(0) if n else None
+        b = other._record(0) if m else None
+        while i < n and j < m:
+            if a < b:
+                if keep_left:
+                    buffer += a
+                i += 1
+                a = self._record(i)
+            elif b < a:
+                if keep_right:
+                    buffer += b
+                j += 1
+                b = other._record(j)
+            else:
+                if keep_both:
+                    buffer += a
+                i += 1
+                j += 1
+                a, b = self._record(i), other._record(j)
+
+        if keep_left:
+            buffer += self.buffer[i * width:]
+        if keep_right:
+            buffer += other.buffer[j * width:]
+
+        return OpenidSet(buffer, width)
+
+    def union(self, other):
+
+        return self._merge(other, True, True, True)
+
+    def difference(self, other):
+
+        return self._merge(other, True, False, False)
+
+    def intersection(self, other):
+
+        return self._merge(other, False, True, False)
+
+    def __or__(self, other):
+
+        return self.union(other)
+
+    def __sub__(self, other):
+
+        return self.difference(other)
+
+    def __and__(self, other):
+
+        return self.intersection(other)
+
+    def __eq__(self, other):
+
+        return isinstance(other, OpenidSet) and self.width == other.width and self.buffer[:] == other.buffer[:]
+
+    def __ne__(self, other):
+
+        return not self == other
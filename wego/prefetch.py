@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+
+"""
+wego.prefetch
+
+Fetch user profile in background when user subscribe or scan, so the first get_ext_userinfo
+and login_required after it are warm hits of USERINFO_CACHE.
+"""
+
+import threading
+import time
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+
+class ProfilePrefetcher(object):
+    """
+    Collect openids from pushes and fetch them by /cgi-bin/user/info/batchget in a background thread.
+
+    :param wego: :class:`WegoApi <wego.api.WegoApi>` object, its USERINFO_CACHE is written.
+    :param batch_size: (optional) At most 100 openids per batch.
+    :param delay: (optional) Seconds waiting for more openids before a batch is sent.
+    :param maxsize: (optional) Max openids waiting, more are dropped, a dropped user is fetched on demand.
+    """
+
+    push_types = ('subscribe', 'scan_subcribe', 'scan')
+
+    def __init__(self, wego, batch_size=100, delay=0.2, maxsize=10000):
+
+        self.wego = wego
+        self.batch_size = min(batch_size, 100)
+        self.delay = delay
+        self.queue = queue.Queue(maxsize)
+        self.dropped = 0
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def on_push(self, push):
+        """
+        Push listener, queue the user of subscribe and scan pushes.
+
+        :param push: :class:`WeChatPush <wego.api.WeChatPush>` object.
+        :return: None
+        """
+
+        if push.type in self.push_types:
+            self.prefetch(push.from_user)
+
+    def prefetch(self, openid):
+        """
+        Queue an openid, return at once.
+
+        :param openid: User openid.
+        :return: :Bool: Queued, or dropped because the queue is full.
+        """
+
+        try:
+            self.queue.put_nowait(openid)
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+        if self.thread is None:
+            with self.lock:
+                if self.thread is None:
+                    self.thread = threading.Thread(target=self._run, name='wego-prefetch')
+                    self.thread.daemon = True
+                    self.thread.start()
+        return True
+
+    def _run(self):
+
+        while True:
+            openids = [self.queue.get()]
+            deadline = time.time() + self.delay
+            while len(openids) < self.batch_size:
+                timeout = deadline - time.time()
+                if timeout <= 0:
+                    break
+                try:
+                    openids.append(self.queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+
+            try:
+                self.fetch(openids)
+            except Exception:
+                self.wego.settings.LOGGER.exception(u'Prefetch userinfo failed(预取用户信息失败)')
+
+    def fetch(self, openids):
+        """
+        Fetch users not in cache and write them into cache.
+
+        :param openids: User openid list.
+        :return: None
+        """
+
+        cache = self.wego.userinfo_cache
+        openids = [i for i in set(openids) if cache.get(i) is None]
+        if not openids:
+            return
+
+        if len(openids) == 1:
+            users = [self.wego.wechat.get_userinfo(openids[0])]
+        else:
+            users = self.wego.wechat.batch_get_userinfo(openids)['user_info_list']
+
+        for data in users:
+            cache.set(data['openid'], data)
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+
+"""
+wego.registry
+
+Many official accounts in one process. Accounts share one requests.Session (so one connection pool to
+api.weixin.qq.com), one global access token store and the cache backends, each keeps its own settings.
+An account is looked up by APP_ID, or by its original id (ToUserName of its pushes):
+
+    accounts = AccountRegistry(loader=load_from_db, HELPER='wego.helpers.DjangoHelper')
+    accounts.register(APP_ID='wx...', APP_SECRET='...', REGISTER_URL='...', ORIGINAL_ID='gh_...')
+
+    w = accounts.route_push(request.body)
+    push = w.analysis_push(request)
+"""
+
+from .cache import MemoryCache, SingleFlight
+from .settings import init
+import threading
+import re
+
+_TO_USER_RE = re.compile(r'<ToUserName>\s*(?:<!\[CDATA\[)?(.*?)(?:\]\]>)?\s*</ToUserName>')
+_APP_ID_RE = re.compile(r'<appid>\s*(?:<!\[CDATA\[)?(.*?)(?:\]\]>)?\s*</appid>')
+
+
+class AccountRegistry(object):
+    """
+    :param loader: (optional) Function loader(app_id) returns settings dict of an unknown account or None,
+            accounts are loaded on demand and kept.
+    :param defaults: (optional) Settings shared by all accounts, such as HELPER and USERINFO_CACHE_BACKEND.
+            HTTP_SESSION and TOKEN_STORE are created if not given.
+    """
+
+    def __init__(self, loader=None, **defaults):
+
+        if 'HTTP_SESSION' not in defaults:
+            import requests
+            defaults['HTTP_SESSION'] = requests.Session()
+        defaults.setdefault('TOKEN_STORE', MemoryCache(0))
+        self.loader = loader
+        self.defaults = defaults
+        self.accounts = {}
+        self.usernames = {}
+        self.lock = threading.Lock()
+        self.load_flight = SingleFlight()
+
+    def register(self, **settings):
+        """
+        Init an account with defaults and settings.
+
+        :return: :class:`WegoApi <wego.api.WegoApi>` object.
+        """
+
+        kwargs = dict(self.defaults)
+        kwargs.update(settings)
+        wego = init(**kwargs)
+
+        with self.lock:
+            self.accounts[wego.settings.APP_ID] = wego
+            if wego.settings.ORIGINAL_ID:
+                self.usernames[wego.settings.ORIGINAL_ID] = wego
+        return wego
+
+    def unregister(self, app_id):
+        """
+        Drop an account, such as after its secret changed, the next get loads it again.
+
+        :return: None
+        """
+
+        with self.lock:
+            wego = self.accounts.pop(app_id, None)
+            if wego is not None:
+                self.usernames.pop(wego.settings.ORIGINAL_ID, None)
+                self.defaults['TOKEN_STORE'].delete('wego:token:' + app_id)
+
+    def get(self, app_id, default=None):
+        """
+        Concurrent first requests of an account share one load.
+
+        :return: :class:`WegoApi <wego.api.WegoApi>` object of APP_ID, or default if it is unknown.
+        """
+
+        wego = self.accounts.get(app_id)
+        if wego is None and self.loader is not None:
+            wego = self.load_flight.do(app_id, lambda: self._load(app_id))
+        return wego if wego is not None else default
+
+    def _load(self, app_id):
+
+        # Loaded by the flight just finished
+        wego = self.accounts.get(app_id)
+        if wego is not None:
+            return wego
+
+        settings = self.loader(app_id)
+        if not settings:
+            return None
+        settings.setdefault('APP_ID', app_id)
+        return self.register(**settings)
+
+    def by_username(self, username, default=None):
+        """
+        :param username: Original id (gh_...) of the account.
+        :return: :class:`WegoApi <wego.api.WegoApi>` object, or default if it is unknown.
+        """
+
+        return self.usernames.get(username, default)
+
+    def route_push(self, raw_xml):
+        """
+        Find the account a push is sent to, by ToUserName, or by appid for pay notifications.
+        Only the outer xml is read, encrypted pushes are decrypted by the account. The body is not
+        authenticated yet, so only registered accounts are found, the loader is never called.
+
+        :param raw_xml: Request body.
+        :return: :class:`WegoApi <wego.api.WegoApi>` object, None if it is unknown.
+        """
+
+        if isinstance(raw_xml, bytes):
+            raw_xml = raw_xml.decode('utf-8')
+
+        match = _TO_USER_RE.search(raw_xml)
+        if match:
+            return self.by_username(match.group(1))
+
+        match = _APP_ID_RE.search(raw_xml)
+        if match:
+            return self.accounts.get(match.group(1))
+        return None
+
+    def __getitem__(self, app_id):
+
+        wego = self.get(app_id)
+        if wego is None:
+            raise KeyError(app_id)
+        return wego
+
+    def __contains__(self, app_id):
+
+        return app_id in self.accounts
+
+    def __len__(self):
+
+        return len(self.accounts)
+
+    def __iter__(self):
+
+        return iter(list(self.accounts.values()))
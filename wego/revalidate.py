@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+
+"""
+wego.revalidate
+
+Stale-while-revalidate of session userinfo. Within USERINFO_GRACE seconds after USERINFO_EXPIRE, login_required
+serves the stale user at once and refreshes the user token and profile in background, the next request of the
+same session takes the result into it. Results are keyed by openid and refresh token, so the tokens refreshed for
+one session never go into another session of the user.
+"""
+
+from .cache import MemoryCache
+import threading
+import time
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+
+class Revalidator(object):
+    """
+    :param wego: :class:`WegoApi <wego.api.WegoApi>` object.
+    :param grace: (optional) Seconds after expiry a stale user is served while it is refreshed, USERINFO_GRACE.
+    :param ttl: (optional) Seconds a result waits for the next request of its session.
+    :param workers: (optional) Background threads.
+    """
+
+    def __init__(self, wego, grace=0, ttl=600, workers=2):
+
+        self.wego = wego
+        self.grace = grace
+        self.workers = workers
+        self.results = MemoryCache(10000, ttl)
+        self.queue = queue.Queue()
+        self.pending = set()
+        self.lock = threading.Lock()
+        self.threads = []
+
+    def submit(self, openid, record):
+        """
+        Queue a refresh of the session, return at once, a session is refreshed once at the same time.
+
+        :param openid: User openid.
+        :param record: :class:`SessionRecord <wego.session.SessionRecord>` object of the request.
+        :return: None
+        """
+
+        key = (openid, record.refresh_token)
+        with self.lock:
+            if key in self.pending or key in self.results:
+                return
+            self.pending.add(key)
+            if len(self.threads) < self.workers:
+                thread = threading.Thread(target=self._run, name='wego-revalidate')
+                thread.daemon = True
+                thread.start()
+                self.threads.append(thread)
+
+        self.queue.put((openid, record.access_token, record.expires_at, record.refresh_token))
+
+    def _run(self):
+
+        while True:
+            openid, access_token, expires_at, refresh_token = self.queue.get()
+            key = (openid, refresh_token)
+            try:
+                self.results.set(key, self.refresh(openid, access_token, expires_at, refresh_token))
+            except Exception:
+                self.wego.settings.LOGGER.exception(u'Revalidate userinfo failed(后台刷新用户信息失败)')
+            finally:
+                with self.lock:
+                    self.pending.discard(key)
+
+    def refresh(self, openid, access_token, expires_at, refresh_token):
+        """
+        Refresh the user token if it expires, then get the profile.
+
+        :return: :dict: {'tokens': new tokens or None, 'userinfo': profile}
+        """
+
+        tokens = None
+        if expires_at and expires_at < time.time():
+            tokens = self.wego.wechat.refresh_access_token(refresh_token)
+            if tokens == 'error':
+                raise ValueError('Refresh user access token failed')
+            access_token = tokens['access_token']
+
+        data = self.wego.wechat.get_userinfo_by_token(openid, access_token)
+        if 'errcode' in data:
+            raise ValueError('errcode: {}, msg: {}'.format(data['errcode'], data.get('errmsg')))
+
+        if hasattr(self.wego.userinfo_cache, 'set_profile'):
+            self.wego.userinfo_cache.set_profile(openid, data)
+        return {'tokens': tokens, 'userinfo': data}
+
+    def apply(self, openid, record):
+        """
+        Take the refreshed result of the session into the session record.
+
+        :return: :Bool: Applied or not.
+        """
+
+        key = (openid, record.refresh_token)
+        result = self.results.get(key)
+        if result is None:
+            return False
+
+        self.results.delete(key)
+        if result['tokens'] is not None:
+            self.wego._set_user_tokens(record, result['tokens'])
+        self.wego._set_userinfo_to_session(record, dict(result['userinfo']))
+        return True
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+
+"""
+wego.session
+
+OAuth state of a user kept in one compact session value, so a request reads the session once and writes it
+only when something changed. With TornadoHelper it is one signed cookie instead of five.
+
+Layout (version 2, base64 encoded): version byte, token expires_at as a double, then length prefixed
+openid, access_token, refresh_token, userinfo (:meth:`WeChatUser.dumps <wego.api.WeChatUser.dumps>`)
+and the granted scope. Version 1 has no scope, it is read as snsapi_userinfo.
+"""
+
+import base64
+import struct
+
+SESSION_FORMAT_VERSION = 2
+
+# Keys of the multi-key layout before the session record
+LEGACY_SESSION_KEYS = ('wx_openid', 'wx_access_token', 'wx_access_token_expires_at', 'wx_refresh_token',
+                       'wx_userinfo')
+
+
+def pack_varint(buf, value):
+
+    while value > 0x7f:
+        buf.append(value & 0x7f | 0x80)
+        value >>= 7
+    buf.append(value)
+
+
+def unpack_varint(buf, pos):
+
+    value = shift = 0
+    while True:
+        byte = buf[pos]
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+def pack_bytes(buf, value):
+
+    pack_varint(buf, len(value))
+    buf.extend(value)
+
+
+def unpack_bytes(buf, pos):
+
+    length, pos = unpack_varint(buf, pos)
+    return bytes(buf[pos:pos + length]), pos + length
+
+
+def _to_bytes(value):
+
+    if not value:
+        return b''
+    if isinstance(value, bytes):
+        return value
+    return value.encode('utf-8')
+
+
+def _to_text(value):
+
+    if not value:
+        return ''
+    if isinstance(value, bytes):
+        return value.decode('utf-8')
+    return value
+
+
+class SessionRecord(object):
+    """
+    The session record of a request, use :meth:`WegoApi.get_session_record <wego.api.WegoApi.get_session_record>`
+    to get it.
+
+    :param helper: Helper of the request.
+    :param key: (optional) Session key.
+    """
+
+    __slots__ = ('helper', 'key', 'openid', 'access_token', 'expires_at', 'refresh_token', 'userinfo', 'scope',
+                 'dirty', 'legacy')
+
+    def __init__(self, helper, key='wx'):
+
+        self.helper = helper
+        self.key = key
+        self.openid = ''
+        self.access_token = ''
+        self.expires_at = 0
+        self.refresh_token = ''
+        self.userinfo = b''
+        self.scope = ''
+        self.dirty = False
+        self.legacy = False
+
+        value = helper.get_session(key)
+        if value:
+            try:
+                self._loads(value)
+                return
+            except (ValueError, TypeError, IndexError, struct.error):
+                # Broken or unknown version, same as a new session
+                pass
+        self._migrate()
+
+    def _loads(self, value):
+
+        buf = bytearray(base64.b64decode(_to_bytes(value)))
+        version, self.expires_at = struct.unpack_from('>Bd', bytes(buf[:9]))
+        if version not in (1, SESSION_FORMAT_VERSION):
+            raise ValueError('Unknown session format version: %s' % version)
+
+        pos = 9
+        fields = []
+        for i in range(4):
+            value, pos = unpack_bytes(buf, pos)
+            fields.append(value)
+        self.openid, self.access_token, self.refresh_token = [i.decode('utf-8') for i in fields[:3]]
+        self.userinfo = fields[3]
+        if version == 1:
+            self.scope = 'snsapi_userinfo'
+        else:
+            self.scope = unpack_bytes(buf, pos)[0].decode('utf-8')
+
+    def dumps(self):
+        """
+        :return: :str: Session value.
+        """
+
+        buf = bytearray(struct.pack('>Bd', SESSION_FORMAT_VERSION, self.expires_at or 0))
+        for value in (self.openid, self.access_token, self.refresh_token):
+            pack_bytes(buf, _to_bytes(value))
+        pack_bytes(buf, self.userinfo or b'')
+        pack_bytes(buf, _to_bytes(self.scope))
+        return base64.b64encode(bytes(buf)).decode('ascii')
+
+    def _migrate(self):
+        """
+        Read the multi-key layout, the record is saved by the next save, which deletes the old keys.
+        """
+
+        openid = self.helper.get_session('wx_openid')
+        if not openid:
+            return
+
+        self.openid = _to_text(openid)
+        self.access_token = _to_text(self.helper.get_session('wx_access_token'))
+        self.expires_at = float(self.helper.get_session('wx_access_token_expires_at') or 0)
+        self.refresh_token = _to_text(self.helper.get_session('wx_refresh_token'))
+
+        # JSON of user data, WeChatUser.loads reads it
+        self.userinfo = _to_bytes(self.helper.get_session('wx_userinfo'))
+        self.scope = 'snsapi_userinfo'
+        self.dirty = True
+        self.legacy = True
+
+    def update(self, **fields):
+        """
+        Set fields, the record becomes dirty only if a value changed.
+
+        :return: None
+        """
+
+        for key, value in fields.items():
+            if getattr(self, key) != value:
+                setattr(self, key, value)
+                self.dirty = True
+
+    def save(self):
+        """
+        Write the record into session if it is dirty.
+
+        :return: :Bool: Written or not.
+        """
+
+        if not self.dirty:
+            return False
+
+        self.helper.set_session(self.key, self.dumps())
+        self.dirty = False
+
+        if self.legacy:
+            for key in LEGACY_SESSION_KEYS:
+                self.helper.del_session(key)
+            self.legacy = False
+        return True
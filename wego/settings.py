@@ -7,9 +7,13 @@ default setting
 """
 
 from .exceptions import InitError
-import wego
 import logging
 
+try:
+    string_types = basestring
+except NameError:
+    string_types = str
+
 
 def init(**kwargs):
     """
@@ -20,7 +24,8 @@ def init(**kwargs):
     :param REGISTER_URL: As same as you set at interface permissions(接口权限)
             >> authorized users obtain basic information page(网页授权获取用户基本信息).
     :param HELPER: Official helper 'wego.helpers.DjangoHelper' and 'wego.helpers.TornadoHelper' or you can customized
-            yourself helper with http://wego.quseit.com/customized/helper(building).
+            yourself helper with http://wego.quseit.com/customized/helper(building). A dotted path is imported
+            at the first request.
 
     :param MCH_ID: (optional) Mac ID get it at https://pay.weixin.qq.com/ (商户号).
     :param MCH_SECRET: (optional) MCH SECRET As same as you set at https://pay.weixin.qq.com/ (API 密钥).
@@ -30,14 +35,76 @@ def init(**kwargs):
 
     :param PUSH_TOKEN: (optional) Set at basic configuration(基本配置).
     :param PUSH_ENCODING_AES_KEY: (optional) Set at basic configuration(基本配置).
+    :param PUSH_LISTENERS: (optional) A list of functions called with every WeChatPush analysis_push returns,
+            such as wego.stats.PushStats().feed.
 
     :param GET_GLOBAL_ACCESS_TOKEN: (optional) A function that return a global access token, if your application run at
             multiple servers it required. How to customized your GET_GLOBAL_ACCESS_TOKEN:
             http://wego.quseit.com/customized/GET_GLOBAL_ACCESS_TOKEN(building).
 
+    :param INVALIDATION_BACKEND: (optional) Pub/sub backend for invalidate caches across processes,
+            such as wego.invalidation.RedisPubSub(redis_client), default is in-process only.
+
     :param USERINFO_EXPIRE: (optional) Set number of seconds expired, default is 0. subscribe,
             language, remark and groupid still is real time.
 
+    :param USERINFO_GRACE: (optional) Seconds after USERINFO_EXPIRE a stale session userinfo is still served at once,
+            while the user token and profile are refreshed in background, default is 0.
+
+    :param EXT_USERINFO_EXPIRE: (optional) Set number of seconds subscribe, language, remark and groupid are cached
+            in process, default is 0 (real time). With USERINFO_EXPIRE it enables the process level profile cache
+            (wego.cache.ProfileCache) shared by sessions and WeChatUser.get_ext_userinfo.
+    :param USERINFO_CACHE_SIZE: (optional) Max users in the profile cache, default is 10000.
+    :param USERINFO_CACHE_BACKEND: (optional) Shared cache behind the profile cache, has get(key),
+            set(key, value, ttl) and delete(key), such as a redis wrapper. Give it delete_prefix(prefix) so
+            invalidating all users also drops their backend entries.
+    :param USERINFO_CACHE: (optional) Replace the profile cache, it has get(openid), set(openid, data),
+            delete(openid) and clear() for user extra info, such as wego.cache.MemoryCache(ttl=3600).
+            It is invalidated by pushes and wego write methods.
+    :param PREFETCH_USERINFO: (optional) Default is False, fetch user info into the profile cache in background
+            when user subscribe or scan, EXT_USERINFO_EXPIRE or USERINFO_CACHE is required.
+
+    :param MEDIA_PREFETCH_PATH: (optional) A directory, medias of image, voice, video and shortvideo pushes
+            are downloaded into it in background, see WegoApi.get_media_path.
+
+    :param CONVERSATION_STORE: (optional) A wego.conversation.ConversationStore object, then WeChatPush has state,
+            set_state, update_state and end_conversation.
+
+    :param GROUPS_EXPIRE: (optional) Set number of seconds the group table is cached, default is 600, 0 disables it.
+            Wego`s own group write methods update the cache in place.
+
+    :param TAG_INDEX: (optional) True or a wego.bitmap.TagIndex object, a local tag bitmap index kept current by
+            tag_users, untag_users and del_tag, WegoApi.tag_index.rebuild(w) loads it from wechat.
+
+    :param WRITE_BEHIND: (optional) Default is False, change_user_group and setting WeChatUser remark, group or
+            groupid are queued and flushed in background by wechat batch apis, see wego.writebehind.
+    :param WRITE_BEHIND_SPILL_PATH: (optional) Journal path keeps queued writes over a crash, every process journals
+            to its own file next to it.
+
+    :param OAUTH_CODE_EXPIRE: (optional) Seconds the tokens of an OAuth code are kept in process, default is 300,
+            so a refreshed or prefetched redirect url does not exchange the one-time code again.
+
+    :param SESSION_KEY: (optional) Session key of the user OAuth record, default is 'wx'. Sessions of the old
+            wx_openid, wx_access_token... keys are migrated on their next request.
+    :param COOKIE_SECRET: (optional) Key signs session cookies of WSGIHelper and ASGIHelper, required by them,
+            it must not be APP_SECRET. The cookie is signed, not encrypted, the client can read the tokens in it.
+    :param COOKIE_MAX_AGE: (optional) Seconds a signed session cookie is valid since it was issued,
+            default is 2592000 (30 days).
+
+    :param SNAPSHOT_PATH: (optional) A file caches (global access token, group table, user profiles) are saved
+            into at exit and loaded from at init, entries still valid survive restart, see wego.snapshot.
+            Each account has its own file, SNAPSHOT_PATH.APP_ID, so accounts can share the setting.
+    :param SNAPSHOT_INTERVAL: (optional) Also save the snapshot every SNAPSHOT_INTERVAL seconds.
+    :param WARMUP: (optional) Call :meth:`WegoApi.warmup <wego.api.WegoApi.warmup>` at init, so the first
+            requests after start do not pay for connections, the global access token and push crypto.
+
+    :param ORIGINAL_ID: (optional) Original id (gh_...) of the account, the ToUserName of its pushes,
+            wego.registry.AccountRegistry routes pushes by it.
+    :param HTTP_SESSION: (optional) A requests.Session wechat calls go through, share one between accounts to
+            share its connection pool.
+    :param TOKEN_STORE: (optional) Store of global access tokens keyed by APP_ID, has get(key) and
+            set(key, value, ttl), such as wego.cache.MemoryCache or a redis wrapper.
+
     :param REDIRECT_PATH: (optional) Default redirect path, redirect when we get user`s authorize.
     :param REDIRECT_STATE: (optional) Default redirect state, redirect when we get user`s authorize.
     :param DEBUG: (optional) Default is True,
@@ -46,9 +113,16 @@ def init(**kwargs):
     :rtype: WegoApi.
     """
 
+    from .api import WegoApi, official_get_global_access_token
+
     default_settings = {
-        'GET_GLOBAL_ACCESS_TOKEN': wego.api.official_get_global_access_token,
+        'GET_GLOBAL_ACCESS_TOKEN': official_get_global_access_token,
         'USERINFO_EXPIRE': 0,
+        'EXT_USERINFO_EXPIRE': 0,
+        'USERINFO_GRACE': 0,
+        'GROUPS_EXPIRE': 600,
+        'OAUTH_CODE_EXPIRE': 300,
+        'COOKIE_MAX_AGE': 2592000,
         'DEBUG': False
     }
     kwargs = dict(default_settings, **kwargs)
@@ -63,19 +137,31 @@ def init(**kwargs):
     if 'PAY_NOTIFY_PATH' in kwargs:
         kwargs['PAY_NOTIFY_URL'] = kwargs['REGISTER_URL'] + kwargs['PAY_NOTIFY_PATH'][1:]
 
-    logger = logging.getLogger('wego')
-    formatter = logging.Formatter('%(asctime)s WEGO %(levelname)s: %(message)s', datefmt='%Y/%m/%d %I:%M:%S')
-    ch = logging.StreamHandler()
-    ch.setFormatter(formatter)
-    logger.addHandler(ch)
-    logger.setLevel(logging.INFO)
-    logger.warn = lambda x: logging.Logger.warn(logger, u'\033[1;31m%s\033[0m' % x)
+    logger = setup_logger()
     if kwargs['DEBUG']:
         logger.setLevel(logging.DEBUG)
         logger.warn(u'WEGO 运行在 DEBUG 模式, 微信支付付款金额将固定在 1 分钱.')
     kwargs['LOGGER'] = logger
 
-    return wego.WegoApi(WegoSettings(kwargs))
+    return WegoApi(WegoSettings(kwargs))
+
+
+def setup_logger():
+    """
+    Set up the 'wego' logger once, however many accounts are initialized.
+
+    :return: Logger
+    """
+
+    logger = logging.getLogger('wego')
+    if getattr(logger, 'wego_handler', None) is None:
+        formatter = logging.Formatter('%(asctime)s WEGO %(levelname)s: %(message)s', datefmt='%Y/%m/%d %I:%M:%S')
+        logger.wego_handler = logging.StreamHandler()
+        logger.wego_handler.setFormatter(formatter)
+        logger.addHandler(logger.wego_handler)
+        logger.setLevel(logging.INFO)
+        logger.warn = lambda x: logging.Logger.warn(logger, u'\033[1;31m%s\033[0m' % x)
+    return logger
 
 
 def check_settings(settings):
@@ -118,16 +204,28 @@ def check_settings(settings):
     if 'PAY_NOTIFY_PATH' in settings and not settings['PAY_NOTIFY_PATH'].startswith('/'):
         raise InitError('PAY_NOTIFY_PATH have to starts with "/"(PAY_NOTIFY_PATH 需以 "/" 开始)')
 
-    if type(settings['HELPER']) is str:
-        modules = settings['HELPER'].split('.')
-        settings['HELPER'] = getattr(__import__('.'.join(modules[:-1]), fromlist=['']), modules[-1])
+    from .helpers import BaseHelper
 
-    if not issubclass(settings['HELPER'], wego.helpers.BaseHelper):
+    # A dotted path is imported at the first request, see WegoSettings, it is only checked here
+    if isinstance(settings['HELPER'], string_types):
+        check_helper_path(settings['HELPER'])
+    elif not issubclass(settings['HELPER'], BaseHelper):
         raise InitError('Helper have to inherit the wego.helper.BaseHelper(Helper 必须继承至 wego.helper.BaseHelper)')
 
     if not hasattr(settings['GET_GLOBAL_ACCESS_TOKEN'], '__call__'):
         raise InitError('GET_GLOBAL_ACCESS_TOKEN is not a function(GET_ACCESS_TOKEN 不是一个函数)')
 
+    if any(not hasattr(i, '__call__') for i in settings.get('PUSH_LISTENERS', [])):
+        raise InitError('PUSH_LISTENERS must be a list of functions(PUSH_LISTENERS 必须是函数列表)')
+
+    if settings.get('COOKIE_SECRET') and settings['COOKIE_SECRET'] == settings['APP_SECRET']:
+        raise InitError('COOKIE_SECRET must not be APP_SECRET(COOKIE_SECRET 不能与 APP_SECRET 相同)')
+
+    if settings.get('PREFETCH_USERINFO') and settings.get('USERINFO_CACHE') is None \
+            and not settings['EXT_USERINFO_EXPIRE']:
+        raise InitError('PREFETCH_USERINFO requires EXT_USERINFO_EXPIRE or USERINFO_CACHE'
+                        '(PREFETCH_USERINFO 需要设置 EXT_USERINFO_EXPIRE 或 USERINFO_CACHE)')
+
     # TODO 检查推送消息加解密所需依赖是否安装 PUSH_TOKEN PUSH_ENCODING_AES_KEY
 
     settings['DEBUG'] = not not settings['DEBUG']
@@ -143,6 +241,49 @@ class WegoSettings(object):
 
     def __getattr__(self, key):
         if key in self.data:
+            if key == 'HELPER' and isinstance(self.data[key], string_types):
+                self.data[key] = load_helper(self.data[key])
             return self.data[key]
         return ''
 
+
+def check_helper_path(path):
+    """
+    Check the module of a helper dotted path can be found, without importing it.
+    The helper itself is looked up at the first use, see :func:`load_helper`.
+
+    :param path: Such as 'wego.helpers.official.DjangoHelper'.
+    :return: None
+    :raise: ImportError if the module is not found.
+    """
+
+    module = path.rpartition('.')[0]
+    try:
+        from importlib.util import find_spec
+    except ImportError:
+        # Python 2
+        from pkgutil import find_loader as find_spec
+
+    if not module or find_spec(module) is None:
+        raise ImportError(u'No module named %s(找不到 HELPER 模块)' % module)
+
+
+def load_helper(path):
+    """
+    Import a helper by dotted path.
+
+    :param path: Such as 'wego.helpers.official.DjangoHelper'.
+    :return: Helper class.
+    :raise: AttributeError if the module does not define the helper.
+    """
+
+    from .helpers import BaseHelper
+
+    module, _, name = path.rpartition('.')
+    helper = getattr(__import__(module, fromlist=['']), name, None)
+    if helper is None:
+        raise AttributeError(u'Module %s has no helper %s(HELPER 模块中没有 %s)' % (module, name, name))
+    if not issubclass(helper, BaseHelper):
+        raise InitError('Helper have to inherit the wego.helper.BaseHelper(Helper 必须继承至 wego.helper.BaseHelper)')
+    return helper
+
@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+
+"""
+wego.snapshot
+
+Snapshot of in-process caches for warm restarts: the global access token, the group table and user profiles
+are written into a file at exit (and every SNAPSHOT_INTERVAL seconds), the next start loads entries not yet
+expired, so a deploy does not refetch them all at once. Each account writes its own file, path.APP_ID.
+
+Layout (version 1): magic b'WGSN', version byte, length prefixed APP_ID, then zlib compressed sections,
+each is its name, entry count and entries of key, expires_at as a double (0 never expires) and JSON value.
+The file holds the access token, it is created readable by its owner only.
+"""
+
+from .session import pack_varint, unpack_varint, pack_bytes, unpack_bytes
+from .cache import ProfileCache
+import threading
+import atexit
+import struct
+import json
+import zlib
+import time
+import os
+
+SNAPSHOT_MAGIC = b'WGSN'
+SNAPSHOT_FORMAT_VERSION = 1
+
+
+def _unpack_bytes(buf, pos):
+
+    value, end = unpack_bytes(buf, pos)
+    if end > len(buf):
+        raise IndexError('%s bytes truncated' % (end - len(buf)))
+    return value, end
+
+
+class CacheSnapshot(object):
+    """
+    :param wego: :class:`WegoApi <wego.api.WegoApi>` object.
+    :param path: Snapshot path, the file is path.APP_ID.
+    """
+
+    def __init__(self, wego, path):
+
+        self.wego = wego
+        self.path = '%s.%s' % (path, wego.settings.APP_ID)
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def _token_key(self):
+
+        return 'wego:token:' + self.wego.settings.APP_ID
+
+    def dump_token(self):
+
+        store = self.wego.settings.data.get('TOKEN_STORE')
+        if store is not None:
+            # Only a store that lists its entries, such as MemoryCache, shared stores survive restart anyway
+            if not hasattr(store, 'items'):
+                return []
+            return [('access_token', v, e) for k, v, e in store.items() if k == self._token_key()]
+
+        token = self.wego.wechat.global_access_token
+        if not token:
+            return []
+        return [('access_token', token['access_token'], token['expires_at'])]
+
+    def restore_token(self, key, value, expires_at):
+
+        store = self.wego.settings.data.get('TOKEN_STORE')
+        ttl = int(expires_at - time.time())
+        if store is not None:
+            store.set(self._token_key(), value, ttl)
+        else:
+            self.wego.wechat.global_access_token = {'access_token': value, 'expires_in': ttl, 'expires_at': expires_at}
+
+    def dump_groups(self):
+
+        return [(k, sorted(v[0].items()), e) for k, v, e in self.wego.groups_cache.items()]
+
+    def restore_groups(self, key, value, expires_at):
+
+        self.wego._set_groups({i: j for i, j in value}, expires_at)
+
+    def dump_users(self):
+
+        if not isinstance(self.wego.userinfo_cache, ProfileCache):
+            return []
+        return self.wego.userinfo_cache.local.items()
+
+    def restore_users(self, key, value, expires_at):
+
+        self.wego.userinfo_cache.local.set(key, value, expires_at=expires_at)
+
+    def sections(self):
+        """
+        :return: :list: [(name, dump function, restore function), ...]
+        """
+
+        sections = [('token', self.dump_token, self.restore_token), ('groups', self.dump_groups, self.restore_groups)]
+        if isinstance(self.wego.userinfo_cache, ProfileCache):
+            sections.append(('users', self.dump_users, self.restore_users))
+        return sections
+
+    def dumps(self):
+        """
+        :return: :bytes: Snapshot of valid entries.
+        """
+
+        now = time.time()
+        body = bytearray()
+        for name, dump, restore in self.sections():
+            entries = [i for i in dump() if i[2] is None or i[2] > now]
+            pack_bytes(body, name.encode('utf-8'))
+            pack_varint(body, len(entries))
+            for key, value, expires_at in entries:
+                pack_bytes(body, key.encode('utf-8'))
+                body.extend(struct.pack('>d', expires_at or 0))
+                pack_bytes(body, json.dumps(value, separators=(',', ':')).encode('utf-8'))
+
+        buf = bytearray(SNAPSHOT_MAGIC + struct.pack('>B', SNAPSHOT_FORMAT_VERSION))
+        pack_bytes(buf, self.wego.settings.APP_ID.encode('utf-8'))
+        buf.extend(zlib.compress(bytes(body)))
+        return bytes(buf)
+
+    def loads(self, payload):
+        """
+        Restore entries not yet expired.
+
+        :param payload: Bytes :meth:`dumps` returns.
+        :return: :int: Entries restored.
+        :raise: ValueError if the snapshot is corrupt, or of another format version or account.
+        """
+
+        buf = bytearray(payload)
+        if len(buf) < 5 or bytes(buf[:4]) != SNAPSHOT_MAGIC or buf[4] != SNAPSHOT_FORMAT_VERSION:
+            raise ValueError('Unknown snapshot format')
+        try:
+            app_id, pos = _unpack_bytes(buf, 5)
+            body = bytearray(zlib.decompress(bytes(buf[pos:])))
+        except (IndexError, zlib.error) as e:
+            raise ValueError('Snapshot is corrupt: %s' % e)
+        if app_id.decode('utf-8') != self.wego.settings.APP_ID:
+            raise ValueError('Snapshot of another account: %s' % app_id.decode('utf-8'))
+
+        try:
+            return self._restore(body)
+        except (IndexError, struct.error) as e:
+            raise ValueError('Snapshot is corrupt: %s' % e)
+
+    def _restore(self, body):
+
+        restores = {name: restore for name, dump, restore in self.sections()}
+        now = time.time()
+        pos = count = 0
+        while pos < len(body):
+            name, pos = _unpack_bytes(body, pos)
+            restore = restores.get(name.decode('utf-8'))
+            size, pos = unpack_varint(body, pos)
+            for i in range(size):
+                key, pos = _unpack_bytes(body, pos)
+                expires_at = struct.unpack_from('>d', bytes(body[pos:pos + 8]))[0] or None
+                value, pos = _unpack_bytes(body, pos + 8)
+                # Sections of caches disabled since the snapshot was written are skipped
+                if restore is not None and (expires_at is None or expires_at > now):
+                    restore(key.decode('utf-8'), json.loads(value.decode('utf-8')), expires_at)
+                    count += 1
+        return count
+
+    def save(self):
+        """
+        Write the snapshot, the file is replaced at once so a crash never leaves half of it.
+
+        :return: None
+        """
+
+        payload = self.dumps()
+        tmp_path = '%s.%s.tmp' % (self.path, os.getpid())
+        with self.lock:
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(payload)
+            getattr(os, 'replace', os.rename)(tmp_path, self.path)
+
+    def load(self):
+        """
+        Load the snapshot if it exists, a broken or foreign file is ignored.
+
+        :return: :int: Entries restored.
+        """
+
+        try:
+            with open(self.path, 'rb') as f:
+                payload = f.read()
+        except IOError:
+            return 0
+
+        try:
+            count = self.loads(payload)
+        except (ValueError, TypeError) as e:
+            self.wego.settings.LOGGER.warning(u'Snapshot %s is not loaded(缓存快照未加载): %s' % (self.path, e))
+            return 0
+        self.wego.settings.LOGGER.info(u'Snapshot %s loaded %s entries(已加载缓存快照)' % (self.path, count))
+        return count
+
+    def start(self, interval=0):
+        """
+        Save at exit, and every interval seconds if it is set.
+
+        :return: None
+        """
+
+        atexit.register(self._save_quietly)
+        if interval and self.thread is None:
+            self.thread = threading.Thread(target=self._run, args=(interval,), name='wego-snapshot')
+            self.thread.daemon = True
+            self.thread.start()
+
+    def stop(self):
+
+        self.stopped.set()
+
+    def _run(self, interval):
+
+        while not self.stopped.wait(interval):
+            self._save_quietly()
+
+    def _save_quietly(self):
+
+        try:
+            self.save()
+        except Exception:
+            self.wego.settings.LOGGER.exception(u'Save snapshot failed(保存缓存快照失败)')
@@ -0,0 +1,336 @@
+# -*- coding: utf-8 -*-
+
+"""
+wego.stats
+
+In-process aggregation of WeChat pushes (menu clicks, QR scans, subscriptions...).
+Counting happens in memory, closed rollups are handed to your flush function in batches by a background thread,
+which also closes buckets when their period ends, so the push handler never waits for your storage.
+
+    stats = wego.stats.PushStats(flush=save_rows)
+    w = wego.init(..., PUSH_LISTENERS=[stats.feed])
+"""
+
+from collections import deque
+import threading
+import hashlib
+import logging
+import atexit
+import math
+import time
+
+
+RESOLUTIONS = {
+    'minute': 60,
+    'hour': 3600,
+}
+
+
+class HyperLogLog(object):
+    """
+    HyperLogLog cardinality estimator, used for unique users of a counter.
+    Memory is 2 ** precision bytes, standard error is about 1.04 / sqrt(2 ** precision).
+    """
+
+    __slots__ = ('precision', 'registers')
+
+    def __init__(self, precision=10):
+
+        if not 4 <= precision <= 16:
+            raise ValueError('precision must between 4 and 16')
+
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    def add(self, value):
+        """
+        Add a value (such as openid) into the estimator.
+
+        :param value: str or bytes.
+        :return: None
+        """
+
+        if not isinstance(value, bytes):
+            value = value.encode('utf-8')
+
+        x = int(hashlib.sha1(value).hexdigest()[:16], 16)
+        index = x >> (64 - self.precision)
+        rest = x & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        """
+        Merge another estimator with same precision into this one.
+
+        :param other: :class:`HyperLogLog <wego.stats.HyperLogLog>` object.
+        :return: self
+        """
+
+        if other.precision != self.precision:
+            raise ValueError('Can not merge HyperLogLog with different precision')
+
+        self.registers = bytearray(max(i, j) for i, j in zip(self.registers, other.registers))
+        return self
+
+    def count(self):
+        """
+        Estimate the number of unique values.
+
+        :return: :int
+        """
+
+        m = len(self.registers)
+        if m == 16:
+            alpha = 0.673
+        elif m == 32:
+            alpha = 0.697
+        elif m == 64:
+            alpha = 0.709
+        else:
+            alpha = 0.7213 / (1 + 1.079 / m)
+
+        estimate = alpha * m * m / sum(2.0 ** -i for i in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(float(m) / zeros)
+
+        return int(round(estimate))
+
+    def __len__(self):
+
+        return self.count()
+
+
+class _Bucket(object):
+
+    __slots__ = ('count', 'users')
+
+    def __init__(self, precision):
+
+        self.count = 0
+        self.users = HyperLogLog(precision)
+
+
+class PushStats(object):
+    """
+    Rolling per-minute and per-hour counters for each (push type, EventKey), with unique users estimate.
+
+    :param flush: (optional) A function receive a list of rollup dicts:
+            {'resolution', 'start', 'type', 'key', 'count', 'users'}, called in a background thread.
+            Without it rollups are only kept in memory for query.
+    :param batch_size: (optional) Rollups are flushed early when so many of them are pending.
+    :param minutes: (optional) How many closed minute buckets kept in memory for query.
+    :param hours: (optional) How many closed hour buckets kept in memory for query.
+    :param precision: (optional) HyperLogLog precision.
+    :param interval: (optional) Seconds between background flushes, 0 for no background thread,
+            then call :meth:`tick` yourself.
+    :param max_pending: (optional) Oldest rollups are dropped when so many are kept after failed flushes.
+    """
+
+    def __init__(self, flush=None, batch_size=500, minutes=60, hours=24, precision=10, interval=10,
+                 max_pending=50000):
+
+        self.flush_func = flush
+        self.batch_size = batch_size
+        self.precision = precision
+        self.interval = interval
+        self.max_pending = max_pending
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.stopped = threading.Event()
+        self.thread = None
+        self.pending = []
+        self.current = {}
+        self.history = {}
+        for name, length in (('minute', minutes), ('hour', hours)):
+            self.current[name] = [0, {}]
+            self.history[name] = deque(maxlen=length)
+
+    def feed(self, push, now=None):
+        """
+        Count a push, it`s cheap enough to call inline in your push handler.
+
+        :param push: :class:`WeChatPush <wego.api.WeChatPush>` object.
+        :param now: (optional) Timestamp, default is now.
+        :return: None
+        """
+
+        self.incr(push.type, push.EventKey, push.from_user, now)
+
+    def incr(self, push_type, key='', openid=None, now=None):
+        """
+        Count an event by hand, it only counts in memory, flushing is left to the background thread.
+
+        :param push_type: Push type such as 'click', 'scan', 'subscribe'.
+        :param key: EventKey.
+        :param openid: (optional) User openid for unique users estimate.
+        :return: None
+        """
+
+        now = time.time() if now is None else now
+        counter = (push_type, key or '')
+
+        with self.lock:
+            self._roll(now)
+            for name in RESOLUTIONS:
+                buckets = self.current[name][1]
+                bucket = buckets.get(counter)
+                if bucket is None:
+                    bucket = buckets[counter] = _Bucket(self.precision)
+                bucket.count += 1
+                if openid:
+                    bucket.users.add(openid)
+
+            if len(self.pending) >= self.batch_size:
+                self.wakeup.set()
+
+        self._start()
+
+    def _roll(self, now):
+        """
+        Close the buckets whose period is over and start new ones, must hold the lock.
+        """
+
+        for name, step in RESOLUTIONS.items():
+            start = int(now // step * step)
+            current = self.current[name]
+            if start != current[0]:
+                self._close(name, current)
+                self.current[name] = [start, {}]
+
+    def _close(self, name, current):
+        """
+        Move a finished bucket into history and pending rollups, must hold the lock.
+        """
+
+        start, buckets = current
+        if not buckets:
+            return
+
+        rollup = {}
+        for (push_type, key), bucket in buckets.items():
+            users = bucket.users.count()
+            rollup[(push_type, key)] = (bucket.count, users)
+            if self.flush_func is None:
+                continue
+            self.pending.append({
+                'resolution': name,
+                'start': start,
+                'type': push_type,
+                'key': key,
+                'count': bucket.count,
+                'users': users
+            })
+        self.history[name].append((start, rollup))
+
+    def _start(self):
+
+        if self.thread is not None or not self.interval or self.flush_func is None:
+            return
+
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name='wego-push-stats')
+                self.thread.daemon = True
+                self.thread.start()
+                atexit.register(self._close_quietly)
+
+    def _run(self):
+
+        while not self.stopped.is_set():
+            self.wakeup.wait(self.interval)
+            self.wakeup.clear()
+            if self.stopped.is_set():
+                break
+            try:
+                self.tick()
+            except Exception:
+                logging.getLogger('wego').exception(u'Push stats flush failed(推送统计写入失败)')
+
+    def tick(self, now=None):
+        """
+        Close the buckets whose period is over and flush pending rollups, the background thread calls it.
+
+        :param now: (optional) Timestamp, default is now.
+        :return: :list: Rows flushed.
+        """
+
+        now = time.time() if now is None else now
+        with self.lock:
+            self._roll(now)
+        return self.flush()
+
+    def flush(self, close=False):
+        """
+        Flush pending rollups now, such as at shutdown. Rows are kept for the next flush if it fails.
+
+        :param close: (optional) Also close the buckets still counting.
+        :return: :list: Rows flushed.
+        """
+
+        with self.flush_lock:
+            with self.lock:
+                if close:
+                    for name in RESOLUTIONS:
+                        self._close(name, self.current[name])
+                        self.current[name] = [0, {}]
+                rows, self.pending = self.pending, []
+
+            if rows:
+                try:
+                    self.flush_func(rows)
+                except Exception:
+                    with self.lock:
+                        self.pending[:0] = rows
+                        del self.pending[:-self.max_pending]
+                    raise
+        return rows
+
+    def close(self):
+        """
+        Stop background flush, close the buckets still counting and flush them, such as at shutdown.
+
+        :return: :list: Rows flushed.
+        """
+
+        self.stopped.set()
+        self.wakeup.set()
+        return self.flush(close=True)
+
+    def _close_quietly(self):
+
+        try:
+            self.close()
+        except Exception:
+            logging.getLogger('wego').exception(u'Push stats flush at exit failed(退出时推送统计写入失败)')
+
+    def get(self, push_type, key='', resolution='minute'):
+        """
+        Get the counter still counting.
+
+        :return: :tuple: (count, unique users)
+        """
+
+        with self.lock:
+            bucket = self.current[resolution][1].get((push_type, key or ''))
+            if bucket is None:
+                return 0, 0
+            return bucket.count, bucket.users.count()
+
+    def series(self, push_type, key='', resolution='minute'):
+        """
+        Get closed buckets kept in memory and the current one.
+
+        :return: :list: [(start, count, unique users), ...]
+        """
+
+        counter = (push_type, key or '')
+        with self.lock:
+            data = [(start, ) + rollup[counter] for start, rollup in self.history[resolution] if counter in rollup]
+            start, buckets = self.current[resolution]
+            if counter in buckets:
+                data.append((start, buckets[counter].count, buckets[counter].users.count()))
+        return data
@@ -1,6 +1,5 @@
 # -*- coding: utf-8 -*-
 from .exceptions import WeChatApiError
-import requests
 import json
 import re
 
@@ -9,6 +8,10 @@ try:
 except ImportError:
     from urllib.parse import quote
 
+_XML_FIELD_RE = re.compile(r'\<.*?\>\<\!\[CDATA\[(.*?)\]\]\>\<\/(.*?)\>')
+# Leaf elements, CDATA or plain text, such as fields of wechat pay notifications
+_XML_ITEM_RE = re.compile(r'<(\w+)>\s*(?:<!\[CDATA\[(.*?)\]\]>|([^<]*))\s*</\1>', re.S)
+
 
 class WeChatApi(object):
     """
@@ -19,13 +22,40 @@ class WeChatApi(object):
 
         self.settings = settings
         self.global_access_token = {}
+        self._http = settings.data.get('HTTP_SESSION')
+
+    @property
+    def http(self):
+        """
+        requests or a shared requests.Session, its connection pool is reused. requests is imported at the first call.
+        """
 
-    def get_code_url(self, redirect_url, state):
+        if self._http is None:
+            import requests
+            self._http = requests
+        return self._http
+
+    def preconnect(self, url, timeout=5):
+        """
+        Open a connection to a wechat host and keep it in the pool, it uses a requests.Session from now on
+        if HTTP_SESSION is not set.
+
+        :param url: Such as 'https://api.weixin.qq.com/'.
+        :return: None
+        """
+
+        if self._http is None:
+            import requests
+            self._http = requests.Session()
+        self.http.head(url, timeout=timeout)
+
+    def get_code_url(self, redirect_url, state, scope='snsapi_userinfo'):
         """
         Get the url which 302 jump back and bring a code.
 
         :param redirect_url: Jump back url
         :param state: Jump back state
+        :param scope: (optional) snsapi_userinfo or snsapi_base, snsapi_base is silent but only gets openid.
         :return: url
         """
 
@@ -35,8 +65,8 @@ class WeChatApi(object):
         url = ('https://open.weixin.qq.com/connect/oauth2/authorize?' +
                'appid=%s&redirect_uri=%s' +
                '&response_type=code' +
-               '&scope=snsapi_userinfo' +
-               '&state=%s#wechat_redirect') % (self.settings.APP_ID, redirect_url, state)
+               '&scope=%s' +
+               '&state=%s#wechat_redirect') % (self.settings.APP_ID, redirect_url, scope, state)
 
         return url
 
@@ -48,7 +78,7 @@ class WeChatApi(object):
         :return: Raw data that wechat returns.
         """
 
-        data = requests.get('https://api.weixin.qq.com/sns/oauth2/access_token', params={
+        data = self.http.get('https://api.weixin.qq.com/sns/oauth2/access_token', params={
             'appid': self.settings.APP_ID,
             'secret': self.settings.APP_SECRET,
             'code': code,
@@ -65,7 +95,7 @@ class WeChatApi(object):
         :return: Raw data that wechat returns.
         """
 
-        data = requests.get('https://api.weixin.qq.com/sns/oauth2/refresh_token', params={
+        data = self.http.get('https://api.weixin.qq.com/sns/oauth2/refresh_token', params={
             'appid': self.settings.APP_ID,
             'grant_type': 'refresh_token',
             'refresh_token': refresh_token
@@ -90,13 +120,54 @@ class WeChatApi(object):
             'openid': openid,
             'lang': 'zh_CN'
         }
-        data = requests.get('https://api.weixin.qq.com/cgi-bin/user/info', params=data).json()
+        data = self.http.get('https://api.weixin.qq.com/cgi-bin/user/info', params=data).json()
 
         if 'errcode' in data.keys():
             raise WeChatApiError('errcode: {}, msg: {}'.format(data['errcode'], data['errmsg']))
 
         return data
 
+    def batch_get_userinfo(self, openids):
+        """
+        Get at most 100 users info with global access token.
+
+        :param openids: User openid list.
+        :return: Raw data that wechat returns.
+        """
+
+        access_token = self.settings.GET_GLOBAL_ACCESS_TOKEN(self)
+        data = {
+            'user_list': [{'openid': i, 'lang': 'zh_CN'} for i in openids]
+        }
+        url = 'https://api.weixin.qq.com/cgi-bin/user/info/batchget?access_token=' + access_token
+        req = self.http.post(url, data=json.dumps(data))
+        req.encoding = 'utf-8'
+        data = req.json()
+
+        if 'errcode' in data.keys() and data['errcode'] != 0:
+            raise WeChatApiError('errcode: {}, msg: {}'.format(data['errcode'], data['errmsg']))
+
+        return data
+
+    def get_followers(self, next_openid=''):
+        """
+        Get a page of followers, at most 10000 openids.
+
+        :param next_openid: (optional) Start after it, empty means from the beginning.
+        :return: Raw data that wechat returns.
+        """
+
+        access_token = self.settings.GET_GLOBAL_ACCESS_TOKEN(self)
+        data = self.http.get('https://api.weixin.qq.com/cgi-bin/user/get', params={
+            'access_token': access_token,
+            'next_openid': next_openid
+        }).json()
+
+        if 'errcode' in data.keys() and data['errcode'] != 0:
+            raise WeChatApiError('errcode: {}, msg: {}'.format(data['errcode'], data['errmsg']))
+
+        return data
+
     def set_user_remark(self, openid, remark):
         """
         Set user remark.
@@ -111,8 +182,8 @@ class WeChatApi(object):
             'openid': openid,
             'remark': remark
         }
-        url = 'https://api.weixin.qq.com/cgi-bin/user/info/updateremark?access_token=%s' + access_token
-        data = requests.post(url, data=json.dumps(data)).json()
+        url = 'https://api.weixin.qq.com/cgi-bin/user/info/updateremark?access_token=' + access_token
+        data = self.http.post(url, data=json.dumps(data)).json()
 
         if 'errcode' in data.keys() and data['errcode'] != 0:
             raise WeChatApiError('errcode: {}, msg: {}'.format(data['errcode'], data['errmsg']))
@@ -131,7 +202,7 @@ class WeChatApi(object):
             'openid': openid,
         }
         url = 'https://api.weixin.qq.com/sns/auth'
-        data = requests.post(url, params=data).json()
+        data = self.http.post(url, params=data).json()
 
         return data
 
@@ -144,7 +215,7 @@ class WeChatApi(object):
         :return: Raw data that wechat returns.
         """
 
-        data = requests.get('https://api.weixin.qq.com/sns/userinfo', params={
+        data = self.http.get('https://api.weixin.qq.com/sns/userinfo', params={
             'access_token': access_token,
             'openid': openid,
             'lang': 'zh_CN'
@@ -160,7 +231,7 @@ class WeChatApi(object):
         :return: Raw data that wechat returns.
         """
 
-        data = requests.get("https://api.weixin.qq.com/cgi-bin/token", params={
+        data = self.http.get("https://api.weixin.qq.com/cgi-bin/token", params={
             'grant_type': 'client_credential',
             'appid': self.settings.APP_ID,
             'secret': self.settings.APP_SECRET
@@ -198,13 +269,23 @@ class WeChatApi(object):
         if type(xml) is bytes:
             xml = xml.decode("utf8")
 
-        return {k: v for v,k in re.findall('\<.*?\>\<\!\[CDATA\[(.*?)\]\]\>\<\/(.*?)\>', xml)}
+        return {k: v for v, k in _XML_FIELD_RE.findall(xml)}
+
+    def _analysis_pay_xml(self, xml):
+        """
+        Convert the XML of wechat pay to dict, plain text fields such as total_fee included.
+        """
+
+        if type(xml) is bytes:
+            xml = xml.decode("utf8")
+
+        return {k: cdata or text for k, cdata, text in _XML_ITEM_RE.findall(xml)}
 
     # 统一下单
     def unified_order(self, data):
 
         xml = self._make_xml(data).encode('utf-8')
-        data = requests.post('https://api.mch.weixin.qq.com/pay/unifiedorder', data=xml).content
+        data = self.http.post('https://api.mch.weixin.qq.com/pay/unifiedorder', data=xml).content
 
         return self._analysis_xml(data)
 
@@ -217,7 +298,7 @@ class WeChatApi(object):
         """
 
         xml = self._make_xml(data).encode('utf-8')
-        data = requests.post('https://api.mch.weixin.qq.com/pay/orderquery', data=xml).content
+        data = self.http.post('https://api.mch.weixin.qq.com/pay/orderquery', data=xml).content
 
         return self._analysis_xml(data)
 
@@ -230,7 +311,7 @@ class WeChatApi(object):
         """
 
         xml = self._make_xml(data).encode('utf-8')
-        data = requests.post('https://api.mch.weixin.qq.com/pay/closeorder', data=xml).content
+        data = self.http.post('https://api.mch.weixin.qq.com/pay/closeorder', data=xml).content
 
         return self._analysis_xml(data)
 
@@ -242,7 +323,7 @@ class WeChatApi(object):
         :return: Raw data that wechat returns.
         """
         xml = self._make_xml(data).encode('utf-8')
-        data = requests.post(
+        data = self.http.post(
             'https://api.mch.weixin.qq.com/secapi/pay/refund',
             data=xml,
             cert=(self.settings.CERT_PEM_PATH, self.settings.KEY_PEM_PATH)
@@ -257,7 +338,7 @@ class WeChatApi(object):
         :return: Raw data that wechat returns.
         """
         xml = self._make_xml(data).encode('utf-8')
-        data = requests.post('https://api.mch.weixin.qq.com/pay/refundquery', data=xml).content
+        data = self.http.post('https://api.mch.weixin.qq.com/pay/refundquery', data=xml).content
         return self._analysis_xml(data)
 
     # 下载对账单
@@ -269,7 +350,7 @@ class WeChatApi(object):
         """
 
         xml = self._make_xml(data).encode('utf-8')
-        data = requests.post('https://api.mch.weixin.qq.com/pay/downloadbill', data=xml)
+        data = self.http.post('https://api.mch.weixin.qq.com/pay/downloadbill', data=xml)
         if data.headers['content-type'] == 'text/plain':
             return self._analysis_xml(data.content)
 
@@ -287,7 +368,7 @@ class WeChatApi(object):
         """
 
         xml = self._make_xml(data).encode('utf-8')
-        data = requests.post('https://api.mch.weixin.qq.com/payitil/report', data=xml).content
+        data = self.http.post('https://api.mch.weixin.qq.com/payitil/report', data=xml).content
         return self._analysis_xml(data)
 
     def create_group(self, name):
@@ -304,8 +385,8 @@ class WeChatApi(object):
                 'name': name
             }
         }
-        url = 'https://api.weixin.qq.com/cgi-bin/groups/create?access_token=%s' + access_token
-        data = requests.post(url, data=json.dumps(data)).json()
+        url = 'https://api.weixin.qq.com/cgi-bin/groups/create?access_token=' + access_token
+        data = self.http.post(url, data=json.dumps(data)).json()
 
         return data
 
@@ -318,7 +399,7 @@ class WeChatApi(object):
 
         access_token = self.settings.GET_GLOBAL_ACCESS_TOKEN(self)
         url = "https://api.weixin.qq.com/cgi-bin/groups/get?access_token=" + access_token
-        req = requests.get(url)
+        req = self.http.get(url)
 
         return req.json()
 
@@ -334,7 +415,7 @@ class WeChatApi(object):
             'openid': openid
         }
         url = "https://api.weixin.qq.com/cgi-bin/groups/getid?access_token=" + access_token
-        data = requests.post(url, data=json.dumps(data)).json()
+        data = self.http.post(url, data=json.dumps(data)).json()
 
         return data
 
@@ -354,8 +435,8 @@ class WeChatApi(object):
                 'name': name
             }
         }
-        url = 'https://api.weixin.qq.com/cgi-bin/groups/update?access_token=%s' + access_token
-        data = requests.post(url, data=json.dumps(data)).json()
+        url = 'https://api.weixin.qq.com/cgi-bin/groups/update?access_token=' + access_token
+        data = self.http.post(url, data=json.dumps(data)).json()
 
         return data
 
@@ -373,8 +454,74 @@ class WeChatApi(object):
             'openid': openid,
             'to_groupid': groupid
         }
-        url = 'https://api.weixin.qq.com/cgi-bin/groups/members/update?access_token=%s' + access_token
-        data = requests.post(url, data=json.dumps(data)).json()
+        url = 'https://api.weixin.qq.com/cgi-bin/groups/members/update?access_token=' + access_token
+        data = self.http.post(url, data=json.dumps(data)).json()
+
+        return data
+
+    def batch_change_user_group(self, openids, groupid):
+        """
+        Move at most 50 users to a new group.
+
+        :param openids: User openid list.
+        :param groupid: Group ID.
+        :return: Raw data that wechat returns.
+        """
+
+        access_token = self.settings.GET_GLOBAL_ACCESS_TOKEN(self)
+        data = {
+            'openid_list': openids,
+            'to_groupid': groupid
+        }
+        url = 'https://api.weixin.qq.com/cgi-bin/groups/members/batchupdate?access_token=' + access_token
+        data = self.http.post(url, data=json.dumps(data)).json()
+
+        if 'errcode' in data.keys() and data['errcode'] != 0:
+            raise WeChatApiError('errcode: {}, msg: {}'.format(data['errcode'], data['errmsg']))
+
+        return data
+
+    def batch_tagging(self, openids, tagid):
+        """
+        Tag at most 50 users.
+
+        :param openids: User openid list.
+        :param tagid: Tag ID.
+        :return: Raw data that wechat returns.
+        """
+
+        access_token = self.settings.GET_GLOBAL_ACCESS_TOKEN(self)
+        data = {
+            'openid_list': openids,
+            'tagid': tagid
+        }
+        url = 'https://api.weixin.qq.com/cgi-bin/tags/members/batchtagging?access_token=' + access_token
+        data = self.http.post(url, data=json.dumps(data)).json()
+
+        if 'errcode' in data.keys() and data['errcode'] != 0:
+            raise WeChatApiError('errcode: {}, msg: {}'.format(data['errcode'], data['errmsg']))
+
+        return data
+
+    def batch_untagging(self, openids, tagid):
+        """
+        Untag at most 50 users.
+
+        :param openids: User openid list.
+        :param tagid: Tag ID.
+        :return: Raw data that wechat returns.
+        """
+
+        access_token = self.settings.GET_GLOBAL_ACCESS_TOKEN(self)
+        data = {
+            'openid_list': openids,
+            'tagid': tagid
+        }
+        url = 'https://api.weixin.qq.com/cgi-bin/tags/members/batchuntagging?access_token=' + access_token
+        data = self.http.post(url, data=json.dumps(data)).json()
+
+        if 'errcode' in data.keys() and data['errcode'] != 0:
+            raise WeChatApiError('errcode: {}, msg: {}'.format(data['errcode'], data['errmsg']))
 
         return data
 
@@ -392,8 +539,180 @@ class WeChatApi(object):
                 'id': groupid
             }
         }
-        url = 'https://api.weixin.qq.com/cgi-bin/groups/delete?access_token=%s' + access_token
-        data = requests.post(url, data=json.dumps(data)).json()
+        url = 'https://api.weixin.qq.com/cgi-bin/groups/delete?access_token=' + access_token
+        data = self.http.post(url, data=json.dumps(data)).json()
+
+        return data
+
+    def create_tag(self, name):
+        """
+        Create a user tag.
+
+        :param name: Tag name.
+        :return: Raw data that wechat returns.
+        """
+
+        access_token = self.settings.GET_GLOBAL_ACCESS_TOKEN(self)
+        data = {
+            'tag': {
+                'name': name
+            }
+        }
+        url = 'https://api.weixin.qq.com/cgi-bin/tags/create?access_token=' + access_token
+        data = self.http.post(url, data=json.dumps(data, ensure_ascii=False).encode('utf8')).json()
+
+        return data
+
+    def get_all_tags(self):
+        """
+        Get all user tags.
+
+        :return: Raw data that wechat returns.
+        """
+
+        access_token = self.settings.GET_GLOBAL_ACCESS_TOKEN(self)
+        url = 'https://api.weixin.qq.com/cgi-bin/tags/get?access_token=' + access_token
+        req = self.http.get(url)
+        req.encoding = 'utf-8'
+
+        return req.json()
+
+    def change_tag_name(self, tagid, name):
+        """
+        Change tag name.
+
+        :param tagid: Tag ID.
+        :param name: New name.
+        :return: Raw data that wechat returns.
+        """
+
+        access_token = self.settings.GET_GLOBAL_ACCESS_TOKEN(self)
+        data = {
+            'tag': {
+                'id': tagid,
+                'name': name
+            }
+        }
+        url = 'https://api.weixin.qq.com/cgi-bin/tags/update?access_token=' + access_token
+        data = self.http.post(url, data=json.dumps(data, ensure_ascii=False).encode('utf8')).json()
+
+        return data
+
+    def del_tag(self, tagid):
+        """
+        Delete a tag.
+
+        :param tagid: Tag ID.
+        :return: Raw data that wechat returns.
+        """
+
+        access_token = self.settings.GET_GLOBAL_ACCESS_TOKEN(self)
+        data = {
+            'tag': {
+                'id': tagid
+            }
+        }
+        url = 'https://api.weixin.qq.com/cgi-bin/tags/delete?access_token=' + access_token
+        data = self.http.post(url, data=json.dumps(data)).json()
+
+        return data
+
+    def get_tag_users(self, tagid, next_openid=''):
+        """
+        Get a page of users with the tag, at most 10000 openids.
+
+        :param tagid: Tag ID.
+        :param next_openid: (optional) Start after it, empty means from the beginning.
+        :return: Raw data that wechat returns.
+        """
+
+        access_token = self.settings.GET_GLOBAL_ACCESS_TOKEN(self)
+        data = {
+            'tagid': tagid,
+            'next_openid': next_openid
+        }
+        url = 'https://api.weixin.qq.com/cgi-bin/user/tag/get?access_token=' + access_token
+        data = self.http.post(url, data=json.dumps(data)).json()
+
+        if 'errcode' in data.keys() and data['errcode'] != 0:
+            raise WeChatApiError('errcode: {}, msg: {}'.format(data['errcode'], data['errmsg']))
+
+        return data
+
+    def get_user_tags(self, openid):
+        """
+        Get tag ids of a user.
+
+        :param openid: User openid.
+        :return: Raw data that wechat returns.
+        """
+
+        access_token = self.settings.GET_GLOBAL_ACCESS_TOKEN(self)
+        data = {
+            'openid': openid
+        }
+        url = 'https://api.weixin.qq.com/cgi-bin/tags/getidlist?access_token=' + access_token
+        data = self.http.post(url, data=json.dumps(data)).json()
+
+        return data
+
+    def get_blacklist(self, begin_openid=''):
+        """
+        Get a page of blacklist, at most 10000 openids.
+
+        :param begin_openid: (optional) Start after it, empty means from the beginning.
+        :return: Raw data that wechat returns.
+        """
+
+        access_token = self.settings.GET_GLOBAL_ACCESS_TOKEN(self)
+        data = {
+            'begin_openid': begin_openid
+        }
+        url = 'https://api.weixin.qq.com/cgi-bin/tags/members/getblacklist?access_token=' + access_token
+        data = self.http.post(url, data=json.dumps(data)).json()
+
+        if 'errcode' in data.keys() and data['errcode'] != 0:
+            raise WeChatApiError('errcode: {}, msg: {}'.format(data['errcode'], data['errmsg']))
+
+        return data
+
+    def batch_blacklist(self, openids):
+        """
+        Block at most 20 users.
+
+        :param openids: User openid list.
+        :return: Raw data that wechat returns.
+        """
+
+        access_token = self.settings.GET_GLOBAL_ACCESS_TOKEN(self)
+        data = {
+            'openid_list': openids
+        }
+        url = 'https://api.weixin.qq.com/cgi-bin/tags/members/batchblacklist?access_token=' + access_token
+        data = self.http.post(url, data=json.dumps(data)).json()
+
+        if 'errcode' in data.keys() and data['errcode'] != 0:
+            raise WeChatApiError('errcode: {}, msg: {}'.format(data['errcode'], data['errmsg']))
+
+        return data
+
+    def batch_unblacklist(self, openids):
+        """
+        Unblock at most 20 users.
+
+        :param openids: User openid list.
+        :return: Raw data that wechat returns.
+        """
+
+        access_token = self.settings.GET_GLOBAL_ACCESS_TOKEN(self)
+        data = {
+            'openid_list': openids
+        }
+        url = 'https://api.weixin.qq.com/cgi-bin/tags/members/batchunblacklist?access_token=' + access_token
+        data = self.http.post(url, data=json.dumps(data)).json()
+
+        if 'errcode' in data.keys() and data['errcode'] != 0:
+            raise WeChatApiError('errcode: {}, msg: {}'.format(data['errcode'], data['errmsg']))
 
         return data
 
@@ -407,7 +726,7 @@ class WeChatApi(object):
 
         access_token = self.settings.GET_GLOBAL_ACCESS_TOKEN(self)
         url = "https://api.weixin.qq.com/cgi-bin/menu/create?access_token=" + access_token
-        data = requests.post(url, data=json.dumps(data, ensure_ascii=False).encode('utf8')).json()
+        data = self.http.post(url, data=json.dumps(data, ensure_ascii=False).encode('utf8')).json()
 
         return data
 
@@ -421,7 +740,7 @@ class WeChatApi(object):
 
         access_token = self.settings.GET_GLOBAL_ACCESS_TOKEN(self)
         url = "https://api.weixin.qq.com/cgi-bin/menu/addconditional?access_token=" + access_token
-        data = requests.post(url, data=json.dumps(data, ensure_ascii=False).encode('utf8')).json()
+        data = self.http.post(url, data=json.dumps(data, ensure_ascii=False).encode('utf8')).json()
 
         return data
 
@@ -434,7 +753,7 @@ class WeChatApi(object):
 
         access_token = self.settings.GET_GLOBAL_ACCESS_TOKEN(self)
         url = "https://api.weixin.qq.com/cgi-bin/menu/get?access_token=" + access_token
-        data = requests.get(url).json()
+        data = self.http.get(url).json()
 
         return data
 
@@ -447,7 +766,7 @@ class WeChatApi(object):
 
         access_token = self.settings.GET_GLOBAL_ACCESS_TOKEN(self)
         url = "https://api.weixin.qq.com/cgi-bin/menu/delete?access_token=" + access_token
-        data = requests.get(url).json()
+        data = self.http.get(url).json()
 
         return data
 
@@ -462,8 +781,8 @@ class WeChatApi(object):
         data = {
             'menuid': menu_id
         }
-        url = 'https://api.weixin.qq.com/cgi-bin/menu/delconditional?access_token=%s' + access_token
-        data = requests.post(url, data=json.dumps(data)).json()
+        url = 'https://api.weixin.qq.com/cgi-bin/menu/delconditional?access_token=' + access_token
+        data = self.http.post(url, data=json.dumps(data)).json()
 
         return data
 
@@ -473,7 +792,7 @@ class WeChatApi(object):
 
         url = 'https://api.weixin.qq.com/cgi-bin/media/upload?access_token=%s&type=%s' % (access_token, kwargs['type'])
 
-        data = requests.post(url, files={'media': kwargs['media']}).json()
+        data = self.http.post(url, files={'media': kwargs['media']}).json()
         return data
 
     def get_temporary_material(self, media_id):
@@ -486,11 +805,33 @@ class WeChatApi(object):
         )
 
         try:
-            data = requests.get(url).content
+            data = self.http.get(url).content
         except:
             data = None
         return data
 
+    def stream_temporary_material(self, media_id):
+        """
+        Get temporary material as a stream, video material is streamed from its video_url.
+
+        :param media_id: Media id.
+        :return: :class:`requests.Response` object, read it by iter_content.
+        """
+
+        access_token = self.settings.GET_GLOBAL_ACCESS_TOKEN(self)
+        url = 'https://api.weixin.qq.com/cgi-bin/media/get'
+        req = self.http.get(url, params={'access_token': access_token, 'media_id': media_id}, stream=True, timeout=30)
+        req.raise_for_status()
+
+        if req.headers.get('content-type', '').startswith(('application/json', 'text/plain')):
+            data = req.json()
+            if 'video_url' not in data:
+                raise WeChatApiError('errcode: {}, msg: {}'.format(data.get('errcode'), data.get('errmsg')))
+            req = self.http.get(data['video_url'], stream=True, timeout=30)
+            req.raise_for_status()
+
+        return req
+
     def add_permanent_material(self, articles):
 
         access_token = self.settings.GET_GLOBAL_ACCESS_TOKEN(self)
@@ -498,7 +839,7 @@ class WeChatApi(object):
         url = 'https://api.weixin.qq.com/cgi-bin/material/add_news?access_token=%s' % access_token
 
         data = {'articles': articles}
-        data = requests.post(url, data=json.dumps(data)).json()
+        data = self.http.post(url, data=json.dumps(data)).json()
 
         return data
 
@@ -508,7 +849,7 @@ class WeChatApi(object):
 
         url = 'https://api.weixin.qq.com/cgi-bin/media/uploadimg?access_token=%s' % access_token
 
-        data = requests.post(url, files={'media': media}).json()
+        data = self.http.post(url, files={'media': media}).json()
         return data
 
     def add_other_material(self, **kwargs):
@@ -527,7 +868,7 @@ class WeChatApi(object):
             data = {'type': kwargs['type']}
 
         url = 'https://api.weixin.qq.com/cgi-bin/material/add_material?access_token=%s' % access_token
-        data = requests.post(url, data=data, files={'media': kwargs['media']}).json()
+        data = self.http.post(url, data=data, files={'media': kwargs['media']}).json()
         return data
 
     def get_permanent_material(self, media_id):
@@ -536,7 +877,7 @@ class WeChatApi(object):
         data = {"media_id": media_id}
 
         url = 'https://api.weixin.qq.com/cgi-bin/material/get_material?access_token=%s' % access_token
-        data = requests.post(url, data=json.dumps(data)).json()
+        data = self.http.post(url, data=json.dumps(data)).json()
 
         return data
 
@@ -546,7 +887,7 @@ class WeChatApi(object):
         data = {"media_id": media_id}
 
         url = 'https://api.weixin.qq.com/cgi-bin/material/del_material?access_token=%s' % access_token
-        data = requests.post(url, data=json.dumps(data)).json()
+        data = self.http.post(url, data=json.dumps(data)).json()
 
         return data
 
@@ -568,7 +909,7 @@ class WeChatApi(object):
         }
 
         url = 'https://api.weixin.qq.com/cgi-bin/material/update_news?access_token=%s' % access_token
-        data = requests.post(url, data=json.dumps(data)).json()
+        data = self.http.post(url, data=json.dumps(data)).json()
 
         return data
 
@@ -577,7 +918,7 @@ class WeChatApi(object):
         access_token = self.settings.GET_GLOBAL_ACCESS_TOKEN(self)
 
         url = 'https://api.weixin.qq.com/cgi-bin/material/get_materialcount?access_token=%s' % access_token
-        data = requests.get(url).json()
+        data = self.http.get(url).json()
 
         return data
 
@@ -591,7 +932,7 @@ class WeChatApi(object):
         }
 
         url = 'https://api.weixin.qq.com/cgi-bin/material/batchget_material?access_token=%s' % access_token
-        data = requests.post(url, data=json.dumps(data)).json()
+        data = self.http.post(url, data=json.dumps(data)).json()
 
         return data
 
@@ -607,8 +948,8 @@ class WeChatApi(object):
                 }
             }
         }
-        url = 'https://api.weixin.qq.com/cgi-bin/qrcode/create?access_token=%s' + access_token
-        data = requests.post(url, data=json.dumps(data)).json()
+        url = 'https://api.weixin.qq.com/cgi-bin/qrcode/create?access_token=' + access_token
+        data = self.http.post(url, data=json.dumps(data)).json()
 
         return data
 
@@ -623,8 +964,8 @@ class WeChatApi(object):
                 }
             }
         }
-        url = 'https://api.weixin.qq.com/cgi-bin/qrcode/create?access_token=%s' + access_token
-        data = requests.post(url, data=json.dumps(data)).json()
+        url = 'https://api.weixin.qq.com/cgi-bin/qrcode/create?access_token=' + access_token
+        data = self.http.post(url, data=json.dumps(data)).json()
 
         return data
 
@@ -639,8 +980,8 @@ class WeChatApi(object):
                 }
             }
         }
-        url = 'https://api.weixin.qq.com/cgi-bin/qrcode/create?access_token=%s' + access_token
-        data = requests.post(url, data=json.dumps(data)).json()
+        url = 'https://api.weixin.qq.com/cgi-bin/qrcode/create?access_token=' + access_token
+        data = self.http.post(url, data=json.dumps(data)).json()
 
         return data
 
@@ -651,8 +992,8 @@ class WeChatApi(object):
             'action': 'long2short',
             'long_url': url
         }
-        url = 'https://api.weixin.qq.com/cgi-bin/shorturl?access_token=%s' + access_token
-        data = requests.post(url, data=json.dumps(data)).json()
+        url = 'https://api.weixin.qq.com/cgi-bin/shorturl?access_token=' + access_token
+        data = self.http.post(url, data=json.dumps(data)).json()
 
         return data
 
@@ -666,7 +1007,7 @@ class WeChatApi(object):
 
         access_token = self.settings.GET_GLOBAL_ACCESS_TOKEN(self)
         url = "https://api.weixin.qq.com/cgi-bin/getcallbackip?access_token=" + access_token
-        data = requests.post(url).json()
+        data = self.http.post(url).json()
 
         return data
 
@@ -683,7 +1024,7 @@ class WeChatApi(object):
         }
         access_token = self.settings.GET_GLOBAL_ACCESS_TOKEN(self)
         url = "https://api.weixin.qq.com/cgi-bin/menu/trymatch?access_token=" + access_token
-        data = requests.post(url, data=json.dumps(data)).json()
+        data = self.http.post(url, data=json.dumps(data)).json()
 
         return data
 
@@ -702,7 +1043,7 @@ class WeChatApi(object):
         access_token = self.settings.GET_GLOBAL_ACCESS_TOKEN(self)
         url = "https://api.weixin.qq.com/datacube/getusersummary?access_token=" + access_token
 
-        data = requests.post(url, data=json.dumps(data)).json()
+        data = self.http.post(url, data=json.dumps(data)).json()
 
         return data
 
@@ -721,7 +1062,7 @@ class WeChatApi(object):
 
         access_token = self.settings.GET_GLOBAL_ACCESS_TOKEN(self)
         url = "https://api.weixin.qq.com/datacube/getusercumulate?access_token=" + access_token
-        data = requests.post(url, data=json.dumps(data)).json()
+        data = self.http.post(url, data=json.dumps(data)).json()
 
         return data
 
@@ -740,7 +1081,7 @@ class WeChatApi(object):
 
         access_token = self.settings.GET_GLOBAL_ACCESS_TOKEN(self)
         url = "https://api.weixin.qq.com/datacube/getarticlesummary?access_token=" + access_token
-        data = requests.post(url, data=json.dumps(data)).json()
+        data = self.http.post(url, data=json.dumps(data)).json()
 
         return data
 
@@ -758,7 +1099,7 @@ class WeChatApi(object):
 
         access_token = self.settings.GET_GLOBAL_ACCESS_TOKEN(self)
         url = "https://api.weixin.qq.com/datacube/getarticletotal?access_token=" + access_token
-        data = requests.post(url, data=json.dumps(data)).json()
+        data = self.http.post(url, data=json.dumps(data)).json()
 
         return data
 
@@ -776,7 +1117,7 @@ class WeChatApi(object):
 
         access_token = self.settings.GET_GLOBAL_ACCESS_TOKEN(self)
         url = "https://api.weixin.qq.com/datacube/getuserread?access_token=" + access_token
-        data = requests.post(url, data=json.dumps(data)).json()
+        data = self.http.post(url, data=json.dumps(data)).json()
 
         return data
 
@@ -794,7 +1135,7 @@ class WeChatApi(object):
 
         access_token = self.settings.GET_GLOBAL_ACCESS_TOKEN(self)
         url = "https://api.weixin.qq.com/datacube/getuserreadhour?access_token=" + access_token
-        data = requests.post(url, data=json.dumps(data)).json()
+        data = self.http.post(url, data=json.dumps(data)).json()
 
         return data
 
@@ -812,7 +1153,7 @@ class WeChatApi(object):
 
         access_token = self.settings.GET_GLOBAL_ACCESS_TOKEN(self)
         url = "https://api.weixin.qq.com/datacube/getusershare?access_token=" + access_token
-        data = requests.post(url, data=json.dumps(data)).json()
+        data = self.http.post(url, data=json.dumps(data)).json()
 
         return data
 
@@ -830,31 +1171,6 @@ class WeChatApi(object):
 
         access_token = self.settings.GET_GLOBAL_ACCESS_TOKEN(self)
         url = "https://api.weixin.qq.com/datacube/getusersharehour?access_token=" + access_token
-        data = requests.post(url, data=json.dumps(data)).json()
-
-        return data
-
-
-# TODO 更方便定制
-def get_global_access_token(self):
-    """
-    获取全局 access token
-    """
-    def create_group(self, name):
-        """
-        Create a user group.
-
-        :param name: Group name.
-        :return: Raw data that wechat returns.
-        """
-
-        access_token = self.settings.GET_GLOBAL_ACCESS_TOKEN(self)
-        data = {
-            'group': {
-                'name': name
-            }
-        }
-        url = 'https://api.weixin.qq.com/cgi-bin/groups/create?access_token=%s' + access_token
-        data = requests.post(url, data=json.dumps(data)).json()
+        data = self.http.post(url, data=json.dumps(data)).json()
 
         return data
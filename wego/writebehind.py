@@ -0,0 +1,326 @@
+# -*- coding: utf-8 -*-
+
+"""
+wego.writebehind
+
+Write-behind queue for user writes: group moves, tagging and remarks. Writes of the same user are coalesced
+(last write wins) and flushed in background through wechat batch apis, 50 openids per call, remarks through
+bounded concurrency single calls. Pending writes are flushed at exit and journaled to a spill file, so they
+survive a crash.
+
+Every process journals to its own file next to the spill path, locked while the process lives. A starting
+process replays journals whose lock is free, left by processes that exited. Without fcntl (Windows) only
+one process may use a spill path.
+
+    w = wego.init(..., WRITE_BEHIND=True, WRITE_BEHIND_SPILL_PATH='/var/lib/wego/writes.jsonl')
+    w.change_user_group(openid, 'vip')  # queued
+    user.remark = 'vip'                 # queued
+"""
+
+from .batch import chunked, run_batches, RateLimiter
+from collections import defaultdict
+import threading
+import atexit
+import uuid
+import json
+import os
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+def _try_lock(f):
+    """
+    Lock a file exclusively without blocking.
+
+    :return: :Bool: Locked, or always True without fcntl.
+    """
+
+    if fcntl is None:
+        return True
+    try:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except (IOError, OSError):
+        return False
+
+
+class WriteBehindQueue(object):
+    """
+    :param wego: :class:`WegoApi <wego.api.WegoApi>` object.
+    :param spill_path: (optional) Journal path of pending writes, journals are spill_path.<pid>.<id>.
+    :param interval: (optional) Seconds between background flushes.
+    :param workers: (optional) Calls in flight when flushing.
+    :param rate: (optional) Max calls per second when flushing.
+    """
+
+    def __init__(self, wego, spill_path=None, interval=1, workers=4, rate=20):
+
+        self.wego = wego
+        self.spill_path = spill_path
+        self.interval = interval
+        self.workers = workers
+        self.limiter = RateLimiter(rate) if rate else None
+        self.lock = threading.RLock()
+        self.flush_lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+        self.spill = None
+        self.pending = {}
+
+        if spill_path:
+            if fcntl is None:
+                self.journal_path = spill_path
+            else:
+                self.journal_path = '%s.%s.%s' % (os.path.abspath(spill_path), os.getpid(), uuid.uuid4().hex[:8])
+            self.spill = open(self.journal_path, 'a')
+            _try_lock(self.spill)
+            self._replay()
+
+        atexit.register(self._close_quietly)
+
+    def _journals(self):
+        """
+        Journals of exited processes, they are locked and opened.
+        """
+
+        directory = os.path.dirname(os.path.abspath(self.spill_path))
+        prefix = os.path.basename(self.spill_path) + '.'
+        for name in sorted(os.listdir(directory)):
+            path = os.path.join(directory, name)
+            if not name.startswith(prefix) or name.endswith('.tmp') or path == self.journal_path:
+                continue
+            try:
+                f = open(path)
+            except IOError:
+                # Taken over by another process
+                continue
+            if _try_lock(f) and self._same_file(f, path):
+                yield path, f
+            else:
+                f.close()
+
+    @staticmethod
+    def _same_file(f, path):
+        """
+        A journal removed by a process which took it over is still readable by a file opened before.
+        """
+
+        try:
+            return os.fstat(f.fileno()).st_ino == os.stat(path).st_ino
+        except OSError:
+            return False
+
+    def _replay(self):
+
+        if fcntl is None:
+            journals = [(self.journal_path, open(self.journal_path))]
+        else:
+            journals = self._journals()
+
+        with self.lock:
+            for path, f in journals:
+                with f:
+                    for line in f:
+                        try:
+                            op, openid, key, value = json.loads(line)
+                        except ValueError:
+                            # The last line may be half written when crashed
+                            continue
+                        self.pending[(op, openid, key)] = value
+                # Writes taken over are in the own journal before the old one is removed
+                self._compact()
+                if path != self.journal_path:
+                    os.remove(path)
+
+    def _put(self, op, openid, key, value):
+
+        with self.lock:
+            self.pending[(op, openid, key)] = value
+            if self.spill is not None:
+                self.spill.write(json.dumps([op, openid, key, value]) + '\n')
+                self.spill.flush()
+
+        self._start()
+
+    def change_user_group(self, openid, groupid):
+        """
+        Queue a group move.
+
+        :param openid: User openid.
+        :param groupid: Group id.
+        :return: None
+        """
+
+        self._put('group', openid, None, groupid)
+
+    def set_remark(self, openid, remark):
+        """
+        Queue a remark.
+
+        :param openid: User openid.
+        :param remark: New remark.
+        :return: None
+        """
+
+        self._put('remark', openid, None, remark)
+
+    def tag_user(self, openid, tagid):
+        """
+        Queue a tagging, it cancels a queued untagging of the same tag.
+
+        :param openid: User openid.
+        :param tagid: Tag id.
+        :return: None
+        """
+
+        self._put('tag', openid, tagid, True)
+
+    def untag_user(self, openid, tagid):
+        """
+        Queue an untagging, it cancels a queued tagging of the same tag.
+
+        :param openid: User openid.
+        :param tagid: Tag id.
+        :return: None
+        """
+
+        self._put('tag', openid, tagid, False)
+
+    def __len__(self):
+
+        return len(self.pending)
+
+    def flush(self):
+        """
+        Send pending writes now, failed writes stay queued unless a newer write of them came.
+
+        :return: :int: Number of writes failed.
+        """
+
+        with self.flush_lock:
+            with self.lock:
+                batch, self.pending = self.pending, {}
+
+            groups, tags, remarks = defaultdict(list), defaultdict(list), []
+            for (op, openid, key), value in batch.items():
+                if op == 'group':
+                    groups[value].append(openid)
+                elif op == 'tag':
+                    tags[(key, value)].append(openid)
+                else:
+                    remarks.append(openid)
+
+            # (func, first arg, second arg, op, key, tagging)
+            calls = []
+            for groupid, openids in groups.items():
+                for chunk in chunked(openids, 50):
+                    calls.append((self.wego.wechat.batch_change_user_group, chunk, groupid, 'group', None, None))
+            for (tagid, tagging), openids in tags.items():
+                func = self.wego.wechat.batch_tagging if tagging else self.wego.wechat.batch_untagging
+                for chunk in chunked(openids, 50):
+                    calls.append((func, chunk, tagid, 'tag', tagid, tagging))
+            for openid in remarks:
+                calls.append((self.wego.wechat.set_user_remark, openid, batch[('remark', openid, None)], 'remark',
+                              None, None))
+
+            failed = []
+            done = []
+            for call, result, error in run_batches(lambda call: call[0](call[1], call[2]), calls, self.workers,
+                                                   rate_limiter=self.limiter):
+                openids = call[1] if isinstance(call[1], list) else [call[1]]
+                if error is None:
+                    done.extend(openids)
+                    self._update_tag_index(call, openids)
+                else:
+                    self.wego.settings.LOGGER.error(u'Write behind %s failed: %s' % (call[3], error))
+                    failed.extend((call[3], openid, call[4]) for openid in openids)
+
+            with self.lock:
+                for key in failed:
+                    self.pending.setdefault(key, batch[key])
+                self._compact()
+
+        self.wego.invalidation.invalidate_many('user', set(done))
+
+        return len(failed)
+
+    def _update_tag_index(self, call, openids):
+        """
+        Only tagging which reached wechat goes into the tag index.
+        """
+
+        tag_index = getattr(self.wego, 'tag_index', None)
+        if tag_index is None or call[3] != 'tag':
+            return
+        if call[5]:
+            tag_index.add(call[4], openids)
+        else:
+            tag_index.remove(call[4], openids)
+
+    def _compact(self):
+        """
+        Rewrite the journal with pending writes only, must hold the lock.
+        """
+
+        if self.spill is None:
+            return
+
+        # Locked before it is renamed, so the journal is never unlocked
+        tmp_path = self.journal_path + '.tmp'
+        f = open(tmp_path, 'w')
+        _try_lock(f)
+        for (op, openid, key), value in self.pending.items():
+            f.write(json.dumps([op, openid, key, value]) + '\n')
+        f.flush()
+        getattr(os, 'replace', os.rename)(tmp_path, self.journal_path)
+        self.spill.close()
+        self.spill = f
+
+    def _start(self):
+
+        if self.thread is not None or not self.interval:
+            return
+
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name='wego-write-behind')
+                self.thread.daemon = True
+                self.thread.start()
+
+    def _run(self):
+
+        while not self.stopped.wait(self.interval):
+            if self.pending:
+                try:
+                    self.flush()
+                except Exception:
+                    self.wego.settings.LOGGER.exception(u'Write behind flush failed(延迟写入失败)')
+
+    def close(self):
+        """
+        Stop background flush and flush the rest, such as at shutdown.
+
+        :return: :int: Number of writes failed, they are kept in spill file.
+        """
+
+        self.stopped.set()
+        failed = self.flush()
+        with self.lock:
+            if self.spill is not None:
+                self.spill.close()
+                self.spill = None
+                if not failed:
+                    os.remove(self.journal_path)
+        return failed
+
+    def _close_quietly(self):
+
+        if self.spill is None and self.stopped.is_set():
+            return
+        try:
+            self.close()
+        except Exception:
+            self.wego.settings.LOGGER.exception(u'Write behind flush at exit failed(退出时延迟写入失败)')